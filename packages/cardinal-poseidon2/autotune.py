@@ -0,0 +1,181 @@
+"""Sweep of the code generation variants, ranked by their `cost.estimate`.
+
+For every width and S-box degree of the sweep, the generic generator of `generate.py` is run with each of its
+backends, on the constants of `grain.py`. The BN254 t=8 instance of `generate_t8.py` (x^7, 8 full and 48 partial
+rounds) adds the variants of its hand-written templates: the memory backend with inline or table constants and
+dense or folded partial rounds, the stack backend with eager or lazy reductions, and the IR backend. The variants
+are generated and estimated in parallel by a process pool, then ranked per instance by total gas, or by the lifetime
+cost of a deployment hashing `--calls` times (the code deposit plus the gas of every call).
+
+The report lists the parameters of the sweep and, for every variant, its estimates and the SHA-256 of the generated
+library, so that two runs of the same sweep give the same report and a variant whose code changed stands out. The
+estimates are those of `cost.estimate` (the body of `hash`, before the optimizer), not measured gas.
+"""
+
+import hashlib
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+import cost
+
+# The instance of `generate_t8.py`, whose own templates are swept as well
+T8_INSTANCE = (8, 7, 8, 48)
+T8_VARIANTS = [
+    {'backend': 'memory', 'constants': 'inline', 'partial_rounds': 'dense'},
+    {'backend': 'memory', 'constants': 'inline', 'partial_rounds': 'folded'},
+    {'backend': 'memory', 'constants': 'table', 'partial_rounds': 'dense'},
+    {'backend': 'stack', 'reduction': 'eager'},
+    {'backend': 'stack', 'reduction': 'lazy'},
+    {'backend': 'ir'},
+    {'backend': 'memory', 'constants': 'inline', 'partial_rounds': 'folded', 'arguments': 'calldata'},
+    {'backend': 'stack', 'reduction': 'lazy', 'arguments': 'calldata'},
+    {'backend': 'ir', 'arguments': 'calldata'},
+]
+GENERIC_BACKENDS = ('memory', 'ir')
+
+
+def variants(widths, alphas, rounds_f, rounds_p):
+    """Return the variants of the sweep, each a dictionary of the generator, the instance and its options."""
+
+    result = []
+    for t in widths:
+        for alpha in alphas:
+            instance = {'t': t, 'alpha': alpha, 'rounds_f': rounds_f, 'rounds_p': rounds_p}
+            result += [{'generator': 'generate', **instance, 'backend': backend} for backend in GENERIC_BACKENDS]
+            if (t, alpha, rounds_f, rounds_p) == T8_INSTANCE:
+                result += [{'generator': 'generate_t8', **instance, **options} for options in T8_VARIANTS]
+    return result
+
+
+def name(variant):
+    options = [f'{key}={value}' for key, value in variant.items()
+               if key not in ('generator', 't', 'alpha', 'rounds_f', 'rounds_p')]
+    return f"{variant['generator']} t={variant['t']} x^{variant['alpha']} {' '.join(options)}"
+
+
+def t8_generators(variant):
+    """Return the generators and the constant table (or `None`) of a variant of the `generate_t8.py` templates."""
+
+    import generate_t8 as g
+
+    return g.backend_generators(variant['backend'], variant.get('reduction', 'lazy'),
+                                variant.get('constants', 'inline'), variant.get('partial_rounds', 'dense'),
+                                variant.get('arguments', 'memory'))
+
+
+def generate_t8_variant(variant):
+    """Return the library and the estimates of a variant of the `generate_t8.py` templates."""
+
+    import generate_t8 as g
+
+    generators, table = t8_generators(variant)
+    arguments = variant.get('arguments', 'memory')
+    code = g.generate_code(*generators, g.T, g.ROUNDS_F, g.ROUNDS_P, g.FUNCTION_COMMENT, [], variant['backend'],
+                           table, arguments)
+    return code, g.estimate(generators, variant['backend'], table, arguments)
+
+
+def generic_variant(variant):
+    """Return the library and the estimates of a variant of `generate.py`, on the constants of `grain.py`."""
+
+    import generate
+    import grain
+    from parameters import Parameters
+    from utils import F
+
+    C, D = grain.constants(F, variant['t'], variant['alpha'], variant['rounds_f'], variant['rounds_p'])
+    params = Parameters(variant['t'], variant['alpha'], variant['rounds_f'], variant['rounds_p'], C, D)
+    return generate.generate(params, variant['backend']), generate.estimate(params, variant['backend'])
+
+
+def evaluate(variant):
+    """Return the result of a variant: its estimates, or the error that prevented generating it."""
+
+    result = {'variant': name(variant), **variant}
+    try:
+        generator = generate_t8_variant if variant['generator'] == 'generate_t8' else generic_variant
+        code, estimate = generator(variant)
+    except ValueError as e:
+        return {**result, 'error': str(e)}
+    return {**result, 'total_gas': estimate['total_gas'], 'execution_gas': estimate['execution_gas'],
+            'code_size': estimate['code_size'], 'sha256': hashlib.sha256(code.encode()).hexdigest()}
+
+
+def lifetime_gas(result, calls):
+    """Code deposit plus `calls` times the gas of a hash, as `cost.choose_constant_encoding` weighs them."""
+
+    return cost.CODE_DEPOSIT_GAS * result['code_size'] + calls * result['total_gas']
+
+
+def sweep(widths, alphas, rounds_f, rounds_p, calls=None, jobs=None):
+    """Return the report of the sweep, the variants of every instance ranked from the cheapest; those that could
+    not be generated (e.g. needing more stack slots than reachable) come last, by name."""
+
+    import grain
+    from utils import F
+
+    todo = variants(widths, alphas, rounds_f, rounds_p)
+    # Derive the constants once, before the workers read them from the cache
+    for t, alpha in {(v['t'], v['alpha']) for v in todo if v['generator'] == 'generate'}:
+        try:
+            grain.constants(F, t, alpha, rounds_f, rounds_p)
+        except ValueError:
+            pass
+    with ProcessPoolExecutor(jobs) as pool:
+        results = list(pool.map(evaluate, todo))
+
+    def rank(result):
+        if 'error' in result:
+            return (1, 0, 0, 0, result['variant'])
+        gas = result['total_gas'] if calls is None else lifetime_gas(result, calls)
+        return (0, result['t'], result['alpha'], gas, result['variant'])
+
+    results.sort(key=rank)
+    positions = {}
+    for result in results:
+        if 'error' not in result:
+            instance = (result['t'], result['alpha'])
+            positions[instance] = result['rank'] = positions.get(instance, 0) + 1
+            if calls is not None:
+                result['lifetime_gas'] = lifetime_gas(result, calls)
+    return {
+        'sweep': {'widths': widths, 'alphas': alphas, 'rounds_f': rounds_f, 'rounds_p': rounds_p, 'calls': calls},
+        'results': results,
+    }
+
+
+def table(report):
+    """Return the ranking of a report as text, one variant per line."""
+
+    lines = []
+    for result in report['results']:
+        if 'error' in result:
+            lines.append(f"{'-':>4}  {result['variant']}: {result['error']}")
+        else:
+            lines.append(f"{result['rank']:>4}  {result['total_gas']:>8}  {result['code_size']:>7}  "
+                         f"{result['variant']}")
+    return f"{'rank':>4}  {'gas':>8}  {'size':>7}  variant\n" + '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from parameters import SUPPORTED_WIDTHS
+
+    parser = argparse.ArgumentParser(description='Rank the code generation variants by their estimated gas.')
+    parser.add_argument('--t', type=int, nargs='+', choices=SUPPORTED_WIDTHS, default=[8], help='state widths')
+    parser.add_argument('--alpha', type=int, nargs='+', default=[7], help='degrees of the S-box')
+    parser.add_argument('--rounds-f', type=int, default=8, help='number of full rounds')
+    parser.add_argument('--rounds-p', type=int, default=48, help='number of partial rounds')
+    parser.add_argument('--calls', type=int,
+                        help='rank by the lifetime cost of a deployment hashing this many times instead of by gas')
+    parser.add_argument('--jobs', type=int, help='number of worker processes (all the cores by default)')
+    parser.add_argument('--output', help='also write the report as JSON to this file')
+    args = parser.parse_args()
+
+    report = sweep(sorted(set(args.t)), sorted(set(args.alpha)), args.rounds_f, args.rounds_p, args.calls, args.jobs)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+    print(table(report))
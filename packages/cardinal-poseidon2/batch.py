@@ -0,0 +1,83 @@
+"""Batched evaluation of the t=8 permutation over many states at once (requires NumPy).
+
+The field elements do not fit into 64-bit lanes, so the states are kept as NumPy object arrays holding Python
+integers: a single round then costs a handful of array operations for the whole batch instead of a Python loop per
+hash. The state is stored lane-major (one array of `N` elements per lane), so the `mm4`/`fr_mm` decomposition of
+`reference.py` applies to the batch unchanged.
+"""
+
+import numpy as np
+
+from utils import F, round_schedule
+from generate_t8 import C, D, T, ALPHA, ROUNDS_F, ROUNDS_P, CAPACITY
+from reference import fr_mm
+
+
+def to_lanes(states, width):
+    """Validate an `(N, width)` array-like of field elements and return it as a list of `width` lane arrays."""
+
+    states = np.array(states, dtype=object)
+    if states.size == 0:
+        states = states.reshape(0, width)
+    if states.ndim != 2 or states.shape[1] != width:
+        raise ValueError(f'expected an (N, {width}) array of field elements, got shape {states.shape}')
+    if states.size and not ((states >= 0) & (states < F)).all():
+        raise ValueError('states contain values that are not elements of the field')
+    return [states[:, i] for i in range(width)]
+
+
+def sbox(x):
+    """Raise every element of `x` to the power of `ALPHA` modulo `F`."""
+
+    result, power, e = None, x, ALPHA
+    while e:
+        if e & 1:
+            result = power if result is None else result * power % F
+        e >>= 1
+        if e:
+            power = power * power % F
+    return result
+
+
+def full_round(lanes, r):
+    """Full round applied to the whole batch: constants and S-box on every lane, then `fr_mm`."""
+
+    for i in range(T):
+        lanes[i] = sbox(lanes[i] + C[T * r + i])
+    fr_mm(lanes)
+
+
+def partial_round(lanes, r):
+    """Partial round applied to the whole batch: S-box on lane 0, then `sum()` and the diagonal `D` multiply."""
+
+    lanes[0] = sbox(lanes[0] + C[T * r])
+    s = sum(lanes) % F
+    for i in range(T):
+        lanes[i] = (D[i] * lanes[i] + s) % F
+
+
+def permute_lanes(lanes):
+    """Permute a batch given as a list of `T` lane arrays, in place."""
+
+    fr_mm(lanes)
+    for r, is_full in round_schedule(ROUNDS_F, ROUNDS_P):
+        if is_full:
+            full_round(lanes, r)
+        else:
+            partial_round(lanes, r)
+    return lanes
+
+
+def permute_batch(states):
+    """Return the permutation of every row of an `(N, T)` array of states as an `(N, T)` object array."""
+
+    lanes = permute_lanes(to_lanes(states, T))
+    return np.stack(lanes, axis=1)
+
+
+def hash7_batch(inputs):
+    """Return `hash7` of every row of an `(N, 7)` array of inputs as an object array of `N` hashes."""
+
+    lanes = to_lanes(inputs, T - 1)
+    lanes.append(np.full(len(lanes[0]), CAPACITY, dtype=object))
+    return permute_lanes(lanes)[0]
@@ -0,0 +1,180 @@
+"""Benchmarks of the Python side: code generation, the size of the generated code, hashing and Merkle trees.
+
+Each benchmark records a value, its unit, whether lower or higher is better and whether it is measured (a time or a
+rate, which varies between runs) or exact (a size, which only changes with the code). Timings are the best of
+`--repeat` runs. The report is JSON, together with the Python version, the platform and the NumPy version, so that a
+report can be stored as the baseline of later runs: `--compare` flags the measured values worse than the baseline by
+more than `--tolerance`, and every change of an exact value, and exits with status 1 if any is worse.
+
+`bench-baseline.json` is the report of the last accepted run (its environment is recorded in it): its exact values
+hold on any machine, its measured ones only on a similar one. The committed one was recorded on a single-core
+machine, so timings are only compared meaningfully against a baseline recorded locally on the base revision with
+`make benchmark-python-baseline`. `make benchmark-python` writes the report to `bench.json`, which is not committed;
+copy it over the baseline when a change is accepted.
+"""
+
+import platform
+import time
+
+# Unit of a benchmark -> whether lower or higher values are better, and whether they vary between runs
+UNITS = {
+    'seconds': ('lower', True),
+    'bytes': ('lower', False),
+    'hashes/s': ('higher', True),
+    'leaves/s': ('higher', True),
+}
+TOLERANCE = 0.1
+
+
+def best_time(function, repeat):
+    """Return the shortest of `repeat` runs of `function()`, in seconds, and its last result."""
+
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def result(value, unit):
+    better, measured = UNITS[unit]
+    return {'value': value, 'unit': unit, 'better': better, 'measured': measured}
+
+
+def codegen(repeat):
+    """Time `generate_code` for every variant of the `generate_t8.py` templates and record the size of the library
+    and the estimated code size of `hash`."""
+
+    import generate_t8 as g
+    from autotune import T8_VARIANTS, t8_generators
+
+    results = {}
+    for variant in T8_VARIANTS:
+        name = '-'.join(str(value) for value in variant.values())
+        generators, table = t8_generators(variant)
+        arguments = variant.get('arguments', 'memory')
+        seconds, code = best_time(lambda: g.generate_code(*generators, g.T, g.ROUNDS_F, g.ROUNDS_P,
+                                                          g.FUNCTION_COMMENT, [], variant['backend'], table,
+                                                          arguments), repeat)
+        results[f'codegen/{name}/time'] = result(seconds, 'seconds')
+        results[f'codegen/{name}/source_size'] = result(len(code.encode()), 'bytes')
+        results[f'codegen/{name}/code_size'] = result(
+            g.estimate(generators, variant['backend'], table, arguments)['code_size'], 'bytes')
+    return results
+
+
+def inputs(count):
+    """Deterministic inputs of `hash7`."""
+
+    from utils import F
+
+    return [[(i * 7 + j + 1) * 0x9e3779b97f4a7c15 % F for j in range(7)] for i in range(count)]
+
+
+def hashing(repeat, count):
+    """Throughput of `reference.hash7`, of `kernel.hash7` and, with NumPy, of `batch.hash7_batch`."""
+
+    import kernel
+    import reference
+
+    data = inputs(count)
+    results = {}
+    for name, hash7 in (('scalar', reference.hash7), ('kernel', kernel.hash7)):
+        seconds, _ = best_time(lambda: [hash7(x) for x in data], repeat)
+        results[f'hash/{name}'] = result(count / seconds, 'hashes/s')
+    try:
+        from batch import hash7_batch
+    except ImportError:
+        return results
+    seconds, _ = best_time(lambda: hash7_batch(data), repeat)
+    results['hash/batch'] = result(count / seconds, 'hashes/s')
+    return results
+
+
+def merkle(repeat, leaves):
+    """Rate of `merkle.merkle_root` in the current process and on all the cores, for both arities."""
+
+    from merkle import MAX_ARITY, merkle_root
+
+    data = [row[0] for row in inputs(leaves)]
+    results = {}
+    for arity in (2, MAX_ARITY):
+        for processes in (1, None):
+            seconds, _ = best_time(lambda: merkle_root(data, arity, processes), repeat)
+            results[f"merkle/arity{arity}/{'serial' if processes else 'parallel'}"] = result(leaves / seconds,
+                                                                                             'leaves/s')
+    return results
+
+
+def run(repeat=3, hashes=2000, leaves=20000):
+    """Return the report of every benchmark."""
+
+    try:
+        import numpy
+        numpy_version = numpy.__version__
+    except ImportError:
+        numpy_version = None
+    benchmarks = {**codegen(repeat), **hashing(repeat, hashes), **merkle(repeat, leaves)}
+    return {
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(), 'numpy': numpy_version},
+        'parameters': {'repeat': repeat, 'hashes': hashes, 'leaves': leaves},
+        'benchmarks': benchmarks,
+    }
+
+
+def compare(baseline, report, tolerance=TOLERANCE):
+    """Return the changes of `report` against `baseline` worth reporting, as `(name, old, new, worse)`: measured values
+    off by more than `tolerance` (relatively) and any change of an exact value. Benchmarks missing from either
+    report are skipped."""
+
+    changes = []
+    for name, new in report['benchmarks'].items():
+        old = baseline['benchmarks'].get(name)
+        if old is None:
+            continue
+        ratio = new['value'] / old['value'] if old['value'] else float('inf')
+        if new['better'] == 'higher':
+            ratio = 1 / ratio if ratio else float('inf')
+        limit = tolerance if new['measured'] else 0
+        if abs(ratio - 1) > limit:
+            changes.append((name, old['value'], new['value'], ratio > 1))
+    return changes
+
+
+def format_value(value):
+    return f'{value:.4g}' if isinstance(value, float) else str(value)
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description='Benchmark code generation, hashing and Merkle trees.')
+    parser.add_argument('--repeat', type=int, default=3, help='runs of each timed benchmark, the best one is kept')
+    parser.add_argument('--hashes', type=int, default=2000, help='number of hashes of the hashing benchmarks')
+    parser.add_argument('--leaves', type=int, default=20000, help='number of leaves of the Merkle benchmarks')
+    parser.add_argument('--output', help='write the report as JSON to this file')
+    parser.add_argument('--compare', metavar='BASELINE', help='compare against the report of an earlier run')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help='relative change of a measured value reported by --compare')
+    args = parser.parse_args()
+
+    report = run(args.repeat, args.hashes, args.leaves)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+    for name, benchmark in report['benchmarks'].items():
+        print(f"{name:<48} {format_value(benchmark['value']):>12} {benchmark['unit']}")
+    if args.compare:
+        with open(args.compare) as f:
+            changes = compare(json.load(f), report, args.tolerance)
+        print()
+        for name, old, new, worse in changes:
+            print(f"{'REGRESSION' if worse else 'improved':<10}  {name}: {format_value(old)} -> {format_value(new)}")
+        if not changes:
+            print('no change against the baseline')
+        if any(worse for *_, worse in changes):
+            raise SystemExit(1)
@@ -0,0 +1,268 @@
+"""Static estimates of the execution gas and bytecode size of the generated assembly, without compiling it.
+
+The assembly is parsed with `yul.parse` and every expression is priced with the opcodes the legacy code generator
+emits for it: a PUSH per literal, DUP/SWAP/POP for local variables, jumps for control flow and for calls of Yul
+functions. A call is priced with the body of the function, so the gas of a round includes the `mm4`/`sum` helpers of
+the memory backend, while their code is counted only once. Loops of the shape the generators emit
+(`for { let p := .. let end := add(p, n) } lt(p, end) { p := add(p, step) }`) are priced per iteration, other loops
+and `if` bodies as run once. Memory expansion is charged for the highest slot read or written at a known address.
+
+The optimizer removes some of the stack shuffling priced here: the estimates are meant to compare generator
+variants and parameter sets in milliseconds, not to replace a gas report.
+"""
+
+from utils import MEM_SWP, WORD
+from yul import parse, functions
+
+# Gas of the builtins used by the generated code (Shanghai), without memory expansion
+BUILTIN_GAS = {
+    **dict.fromkeys(('add', 'sub', 'lt', 'gt', 'eq', 'iszero', 'and', 'or', 'xor', 'not', 'shl', 'shr', 'mload',
+                     'mstore', 'calldataload'), 3),
+    **dict.fromkeys(('mul', 'div', 'mod'), 5),
+    **dict.fromkeys(('addmod', 'mulmod'), 8),
+    **dict.fromkeys(('calldatasize', 'pop'), 2),
+    **dict.fromkeys(('return', 'revert'), 0),
+}
+# Builtins that leave nothing on the stack
+STATEMENT_BUILTINS = {'mstore', 'return', 'revert', 'pop'}
+
+PUSH_GAS = 3
+PUSH0_GAS = 2
+DUP_GAS = 3
+SWAP_GAS = 3
+POP_GAS = 2
+JUMP_GAS = 8
+JUMPI_GAS = 10
+JUMPDEST_GAS = 1
+# PUSH2 of a jump target, JUMP/JUMPI and JUMPDEST
+JUMP_SIZE = 5
+
+# Gas paid per byte of deployed code, and the largest deployable code (EIP-170)
+CODE_DEPOSIT_GAS = 200
+CODE_SIZE_LIMIT = 0x6000
+# Overhead of copying a `bytes constant` to memory (allocation and CODECOPY setup), besides 3 gas per word
+TABLE_COPY_GAS = 100
+
+
+def memory_gas(words):
+    """Return the total cost of a memory of `words` words."""
+
+    return 3 * words + words * words // 512
+
+
+def literal_size(value):
+    """Return the size of the PUSH of `value` (PUSH0 for zero)."""
+
+    return 1 + (value.bit_length() + 7) // 8
+
+
+class Estimator:
+    """Walks the statements of a program, accumulating its execution gas and the highest memory address it uses.
+
+    `defined` holds the functions the program can call, `values` the locals whose value is known statically."""
+
+    def __init__(self, defined):
+        self.defined = defined
+        self.values = {}
+        self.top = 0
+
+    def value(self, e):
+        """Return the value of the expression if it is known statically, `None` otherwise."""
+
+        if e[0] == 'lit':
+            return e[1]
+        if e[0] == 'var':
+            return self.values.get(e[1])
+        args = [self.value(a) for a in e[2]]
+        if None in args or e[1] not in ('add', 'sub', 'mul', 'shl', 'shr'):
+            return None
+        a, b = args
+        return {'add': a + b, 'sub': a - b, 'mul': a * b, 'shl': b << a, 'shr': b >> a}[e[1]] % WORD
+
+    def expression(self, e):
+        if e[0] == 'lit':
+            return PUSH_GAS if e[1] else PUSH0_GAS
+        if e[0] == 'var':
+            return DUP_GAS
+        name, args = e[1], e[2]
+        gas = sum(self.expression(a) for a in args)
+        if name in self.defined:
+            return gas + self.call(self.defined[name], [self.value(a) for a in args])
+        if name in ('mload', 'mstore'):
+            address = self.value(args[0])
+            if address is not None:
+                self.top = max(self.top, address + 32)
+        if name not in BUILTIN_GAS:
+            raise ValueError(f'no gas cost for the builtin {name!r}')
+        return gas + BUILTIN_GAS[name]
+
+    def call(self, function, args):
+        """Return the gas of a call with the given (statically known or `None`) arguments, after they are pushed."""
+
+        _, _, params, returns, body = function
+        outer = self.values
+        self.values = {p: v for p, v in zip(params, args) if v is not None}
+        try:
+            gas = self.statement(body)
+        finally:
+            self.values = outer
+        # Return label and jump in, zeroed return variables, argument clean-up and jump back
+        return (PUSH_GAS + JUMP_GAS + JUMPDEST_GAS + PUSH0_GAS * len(returns) + body_cleanup(params, returns) + gas
+                + JUMP_GAS + JUMPDEST_GAS)
+
+    def statement(self, s):
+        kind = s[0]
+        if kind == 'block':
+            return (sum(self.statement(t) for t in s[1])
+                    + POP_GAS * sum(len(t[1]) for t in s[1] if t[0] == 'let'))
+        if kind == 'function':
+            # Jump over the body
+            return PUSH_GAS + JUMP_GAS + JUMPDEST_GAS
+        if kind in ('let', 'assign'):
+            gas = self.expression(s[2]) if s[2] else PUSH0_GAS * len(s[1])
+            value = self.value(s[2]) if s[2] and len(s[1]) == 1 else None
+            for name in s[1]:
+                self.values.pop(name, None)
+            if value is not None:
+                self.values[s[1][0]] = value
+            return gas + (SWAP_GAS + POP_GAS) * len(s[1]) * (kind == 'assign')
+        if kind == 'expr':
+            e = s[1]
+            returns = len(self.defined[e[1]][3]) if e[1] in self.defined else int(e[1] not in STATEMENT_BUILTINS)
+            return self.expression(e) + POP_GAS * returns
+        if kind == 'if':
+            return self.test(s[1]) + self.statement(s[2])
+        if kind == 'for':
+            return self.loop(*s[1:])
+        if kind in ('break', 'continue'):
+            return PUSH_GAS + JUMP_GAS
+        return PUSH_GAS + JUMP_GAS  # leave
+
+    def test(self, condition):
+        """Gas of a conditional jump on `condition`."""
+
+        return self.expression(condition) + BUILTIN_GAS['iszero'] + PUSH_GAS + JUMPI_GAS + JUMPDEST_GAS
+
+    def loop(self, init, condition, post, body):
+        iterations = trip_count(init, condition, post)
+        gas = sum(self.statement(t) for t in init[1])
+        declared = sum(len(t[1]) for t in init[1] if t[0] == 'let')
+        # The loop variables change from one iteration to the next
+        for t in post[1]:
+            if t[0] == 'assign':
+                for name in t[1]:
+                    self.values.pop(name, None)
+        test = self.test(condition)
+        iteration = test + self.statement(body) + JUMPDEST_GAS + self.statement(post) + PUSH_GAS + JUMP_GAS
+        return gas + (iterations or 1) * iteration + test + POP_GAS * declared
+
+
+def body_cleanup(params, returns):
+    """Gas of dropping the arguments and moving the return values of a call into place."""
+
+    return POP_GAS * len(params) + SWAP_GAS * min(len(params), len(returns))
+
+
+def trip_count(init, condition, post):
+    """Return the number of iterations of a loop counting a pointer up to a fixed offset, `None` for other loops."""
+
+    match init[1], condition, post[1]:
+        case ([('let', [p], _), ('let', [end], ('call', 'add', [('var', p1), ('lit', length)]))],
+              ('call', 'lt', [('var', p2), ('var', end2)]),
+              [('assign', [p3], ('call', 'add', [('var', p4), ('lit', step)]))]) \
+                if p == p1 == p2 == p3 == p4 and end == end2 and step:
+            return length // step
+    return None
+
+
+def code_size(node, defined):
+    """Return the approximate number of bytes a parsed statement or expression compiles to."""
+
+    kind = node[0]
+    if kind == 'lit':
+        return literal_size(node[1])
+    if kind == 'var':
+        return 1
+    if kind == 'call':
+        size = sum(code_size(a, defined) for a in node[2])
+        return size + (1 + 3 + JUMP_SIZE if node[1] in defined else 1)
+    if kind == 'block':
+        return (sum(code_size(s, defined) for s in node[1])
+                + sum(len(s[1]) for s in node[1] if s[0] == 'let'))
+    if kind == 'function':
+        _, _, params, returns, body = node
+        return (2 * JUMP_SIZE + len(returns) + code_size(body, defined) + len(params) + min(len(params), len(returns))
+                + 2)
+    if kind in ('let', 'assign'):
+        size = code_size(node[2], defined) if node[2] else len(node[1])
+        return size + 2 * len(node[1]) * (kind == 'assign')
+    if kind == 'expr':
+        e = node[1]
+        returns = len(defined[e[1]][3]) if e[1] in defined else int(e[1] not in STATEMENT_BUILTINS)
+        return code_size(e, defined) + returns
+    if kind == 'if':
+        return code_size(node[1], defined) + 1 + JUMP_SIZE + code_size(node[2], defined)
+    if kind == 'for':
+        init, condition, post, body = node[1:]
+        return (code_size(init, defined) + code_size(condition, defined) + 1 + 2 * JUMP_SIZE + 1
+                + code_size(body, defined) + code_size(post, defined))
+    return JUMP_SIZE - 1  # break, continue, leave
+
+
+def estimate(parts, memory_start=0, table_words=None):
+    """Return the estimates of the body of `hash`, given as the `(kind, code)` pairs of `utils.generate_parts`.
+
+    `memory_start` is the memory already paid for when the assembly starts (`utils.MEMORY_START`). With
+    `table_words`, the constants are read from a table of that many words copied above the state slots first.
+    The result is a dictionary with, for each kind of part, the number of parts and their execution gas (total and
+    per part), then the execution gas of the whole body, the memory expansion and table copy gas, their sum and the
+    bytecode size (with the table data)."""
+
+    programs = [(kind, parse(code)) for kind, code in parts]
+    defined = {}
+    for _, program in programs:
+        defined.update(functions(program))
+
+    estimator = Estimator(defined)
+    rounds = {}
+    for kind, program in programs:
+        gas = sum(estimator.statement(s) for s in program[1])
+        entry = rounds.setdefault(kind, {'count': 0, 'gas': 0})
+        entry['count'] += 1
+        entry['gas'] += gas
+    for entry in rounds.values():
+        entry['gas_per_part'] = entry['gas'] / entry['count']
+
+    top, table_gas, size = estimator.top, 0, sum(code_size(program, defined) for _, program in programs)
+    if table_words is not None:
+        top = max(top, int(MEM_SWP[-1], 16) + 0x40 + 32 * table_words)
+        table_gas = TABLE_COPY_GAS + 3 * table_words
+        size += 32 * table_words
+
+    execution = sum(entry['gas'] for entry in rounds.values())
+    memory = max(memory_gas((top + 31) // 32) - memory_gas((memory_start + 31) // 32), 0)
+    return {
+        'parts': rounds,
+        'execution_gas': execution,
+        'memory_gas': memory,
+        'table_gas': table_gas,
+        'total_gas': execution + memory + table_gas,
+        'code_size': size,
+    }
+
+
+def choose_constant_encoding(inline, table, calls):
+    """Return `'table'` if the `estimate` of the table encoding of the constants is cheaper than the `inline` one
+    over the lifetime of a deployment hashing `calls` times, or if the inline code is too large to deploy.
+
+    Each encoding costs the code deposit of its size plus `calls` times its gas per hash. The size check comes first:
+    the inline t=8 code is estimated at about 57KB, over half of it the PUSH32 of `F` in every `addmod` and `mulmod`,
+    so for it the answer is `'table'` whatever `calls` is; the weighing only decides for code under the limit."""
+
+    if inline['code_size'] > CODE_SIZE_LIMIT:
+        return 'table'
+
+    def lifetime(e):
+        return CODE_DEPOSIT_GAS * e['code_size'] + calls * e['total_gas']
+
+    return 'table' if lifetime(table) < lifetime(inline) else 'inline'
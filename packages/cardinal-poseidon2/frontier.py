@@ -0,0 +1,166 @@
+"""Append-only Merkle tree of fixed depth that keeps only its right edge, for trees too large to store.
+
+The tree has `arity ** depth` leaf slots, the empty ones holding `zero`. Its nodes are those of `merkle.py` (`hash_node`
+of `arity` children), but an empty subtree of height `h` hashes to `zeros[h]` instead of being left out, so the root
+does not depend on how many leaves were appended and proofs always have `depth` levels. The root is therefore not
+the `merkle_root` of the same leaves, which only spans as many levels as they need; proofs are checked by
+`merkle.verify_proof` (and `hash(uint256[7])` on-chain) all the same.
+
+Each level keeps its last few complete nodes: the `index % arity` left siblings of the group being filled (the
+frontier), plus a window of older ones when proofs for the last `history` leaves are asked for. Appending a leaf
+hashes only the groups it completes, `1 / (arity - 1)` hashes on average; the incomplete groups of the right edge are
+hashed by `root`, `depth` hashes once per batch of appends.
+"""
+
+from collections import deque
+from itertools import islice
+
+from merkle import MAX_ARITY, check_arity, hash_node
+
+# Number of leaves hashed level by level at once by `append_many`
+BATCH_SIZE = 4096
+
+
+def zero_hashes(depth, arity=MAX_ARITY, zero=0):
+    """Return the roots of the empty subtrees of height `0` to `depth`."""
+
+    zeros = [zero]
+    for _ in range(depth):
+        zeros.append(hash_node([zeros[-1]] * arity))
+    return zeros
+
+
+def hash_groups(groups, batched=False):
+    """Hash groups of up to `MAX_ARITY` children, in one `batch.hash7_batch` call (NumPy) if `batched`."""
+
+    if not batched or len(groups) < 2:
+        return [hash_node(group) for group in groups]
+
+    from batch import hash7_batch
+
+    return [int(h) for h in hash7_batch([[*group, *[0] * (MAX_ARITY - len(group))] for group in groups])]
+
+
+class Frontier:
+    """Incremental tree over `arity ** depth` leaves, able to prove any of the last `history` leaves."""
+
+    def __init__(self, depth, arity=MAX_ARITY, zero=0, history=0):
+        check_arity(arity)
+        if depth < 1:
+            raise ValueError(f'depth must be positive, got {depth}')
+        self.depth, self.arity, self.history = depth, arity, history
+        self.zeros = zero_hashes(depth, arity, zero)
+        self.size = 0
+        # Last complete nodes of every level, the root level included: enough for the frontier and for the groups of
+        # the ancestors of the last `history` leaves
+        self.levels = [deque(maxlen=history // arity ** level + arity + 1) for level in range(depth + 1)]
+        self._root = None
+
+    @property
+    def capacity(self):
+        return self.arity ** self.depth
+
+    def __len__(self):
+        return self.size
+
+    def _check_room(self, count):
+        if self.size + count > self.capacity:
+            raise ValueError(f'cannot append {count} leaves to a tree of {self.size} out of {self.capacity}')
+
+    def _count(self, level):
+        """Number of complete nodes of `level`."""
+
+        return self.size // self.arity ** level
+
+    def _node(self, level, position, edge):
+        """Node `position` of `level` in the current tree, `edge` being the incomplete node of the right edge."""
+
+        count = self._count(level)
+        if position < count:
+            stored = self.levels[level]
+            if position < count - len(stored):
+                raise IndexError(f'node {position} of level {level} is no longer kept')
+            return stored[position - count]
+        if position == count and edge is not None:
+            return edge
+        return self.zeros[level]
+
+    def append(self, leaf):
+        """Append a leaf, hashing the groups it completes."""
+
+        self._check_room(1)
+        self._root = None
+        self.size += 1
+        node = leaf
+        for level in range(self.depth + 1):
+            self.levels[level].append(node)
+            if level == self.depth or self._count(level) % self.arity:
+                break
+            node = hash_node(list(islice(reversed(self.levels[level]), self.arity))[::-1])
+
+    def append_many(self, leaves, batched=False):
+        """Append an iterable of leaves, hashing the parents the batch completes one level at a time (with NumPy, a
+        single `hash7_batch` call per level, see `hash_groups`)."""
+
+        leaves = iter(leaves)
+        while batch := list(islice(leaves, BATCH_SIZE)):
+            self._check_room(len(batch))
+            self._root = None
+            nodes, size = batch, self.size + len(batch)
+            for level in range(self.depth + 1):
+                stored = self.levels[level]
+                # Children of the groups completed by `nodes`: the pending ones of the frontier come first
+                pending = self._count(level) % self.arity if level < self.depth else 0
+                children = [*islice(stored, len(stored) - pending, None), *nodes]
+                stored.extend(nodes)
+                if level == self.depth:
+                    break
+                complete = len(children) - len(children) % self.arity
+                nodes = hash_groups([children[i:i + self.arity] for i in range(0, complete, self.arity)], batched)
+                if not nodes:
+                    break
+            self.size = size
+
+    def _edge(self):
+        """Yield the incomplete node of the right edge on every level, bottom-up, `None` where it is empty; the last
+        one is the root."""
+
+        edge = None
+        for level in range(self.depth):
+            yield edge
+            count = self._count(level)
+            pending = count % self.arity
+            if not pending and edge is None:
+                continue
+            group = list(islice(reversed(self.levels[level]), pending))[::-1]
+            if edge is not None:
+                group.append(edge)
+            edge = hash_node(group + [self.zeros[level]] * (self.arity - len(group)))
+        yield edge
+
+    def root(self):
+        """Return the root of the tree, the empty slots holding `zero`."""
+
+        if self._root is None:
+            if self.size == self.capacity:
+                self._root = self.levels[self.depth][-1]
+            else:
+                *_, edge = self._edge()
+                self._root = self.zeros[self.depth] if edge is None else edge
+        return self._root
+
+    def proof(self, index):
+        """Return the siblings of leaf `index` on every level, as `merkle.inclusion_proof` does; only the last
+        `history` leaves (and those of the group being filled) can be proven."""
+
+        if not 0 <= index < self.size:
+            raise IndexError(f'leaf index {index} out of range')
+        edges = list(self._edge())
+        proof = []
+        for level in range(self.depth):
+            start = index - index % self.arity
+            group = [self._node(level, position, edges[level]) for position in range(start, start + self.arity)]
+            del group[index % self.arity]
+            proof.append(group)
+            index //= self.arity
+        return proof
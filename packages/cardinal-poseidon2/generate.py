@@ -0,0 +1,285 @@
+"""Generator of the Poseidon2 library for any `Parameters`: state width, S-box degree, round numbers and constants.
+
+The memory backend follows the t=8 templates of `generate_t8.py` with the layout of `utils.memory_layout`. The linear
+layer of the full rounds is picked per width: `mm4` on every block of four elements, plus the sums of the blocks
+when there are several (`circ(2 M4, M4, ...)`), or a single sum added to every element for `t = 2, 3`. The internal
+layer is always `sum()` plus the diagonal, with the multiplications by 1 left out. The IR backend builds the same
+rounds as `ir` blocks.
+
+The IR backend keeps the values a round shares on the stack, and the code it prints must fit in the 16 slots DUP16
+and SWAP16 reach. It does not for `t >= 12`, nor for `t = 8` with `x^11`, `x^19` or `x^31`: `generate` and `estimate`
+raise `ValueError` for those, and the memory backend has to be used.
+"""
+
+from utils import *
+import cost
+import ir
+from parameters import Parameters, SUPPORTED_WIDTHS, SUPPORTED_ALPHAS
+
+# Largest number of lanes handled by one `fr_intro` function: the constants are passed as arguments, and more of
+# them would not fit in the reachable stack
+INTRO_LANES = 8
+
+
+def lane_groups(t):
+    """Return the lanes handled by each `fr_intro` function, and the names of the functions."""
+
+    groups = [list(range(i, min(i + INTRO_LANES, t))) for i in range(0, t, INTRO_LANES)]
+    names = ['fr_intro'] if len(groups) == 1 else [f'fr_intro{g}' for g in range(len(groups))]
+    return groups, names
+
+
+def unreduced_sum(terms):
+    """Return the sum of reduced values, reduced only where an addition could overflow 256 bits."""
+
+    return ReductionPlanner().add(*[Bounded(term, F) for term in terms])
+
+
+def memory_backend(params):
+    """Return the generators of the memory backend for `params`."""
+
+    t, MEM, SWP = params.t, params.MEM, params.MEM_SWP
+    groups, intro_names = lane_groups(t)
+
+    def load(i):
+        return f'mload({MEM[i]})'
+
+    def diagonal(i):
+        return load(i) if params.D[i] == 1 else mulmod(params.D[i], load(i))
+
+    def fr_mm():
+        if t < 4:
+            return (f'mstore({SWP[0]}, {unreduced_sum([load(i) for i in range(t)])})\n'
+                    + ''.join(f'        mstore({MEM[i]}, {addmod(load(i), f"mload({SWP[0]})")})\n' for i in range(t)))
+        code = ''.join(f'mm4({", ".join(MEM[i:i + 4])})\n        ' for i in range(0, t, 4))
+        if t == 4:
+            return code
+        code += '\n'
+        for j in range(4):
+            code += f'        mstore({SWP[j]}, {unreduced_sum([load(i) for i in range(j, t, 4)])})\n'
+        code += '\n'
+        for i in range(t):
+            code += f'        mstore({MEM[i]}, {addmod(load(i), f"mload({SWP[i % 4]})")})\n'
+        return code
+
+    def fr_intro(name, lanes):
+        body = ''.join(f'''
+        let state{i} := {add(load(i), f'c{i}')}
+        {pow_store(params.alpha, f'state{i}', MEM[i])}
+''' for i in lanes)
+        return f'''
+    function {name}({', '.join(f'c{i}' for i in lanes)}) {{{body}    }}
+'''
+
+    def define_functions():
+        code = f'''
+
+    function sum() {{
+        mstore({SWP[0]}, {unreduced_sum([load(i) for i in range(t)])})
+    }}
+'''
+        if t >= 4:
+            code += f'''
+    function mm4(a, b, c, d) {{
+        let t0 := {add('mload(a)', 'mload(b)')}        //  a +  b
+        let t1 := {add('mload(c)', 'mload(d)')}        //          + c +  d
+        let t2 := {add('mload(b)', 'mload(b)', 't1')}  //    + 2b  + c +  d
+        let t3 := {add('mload(d)', 'mload(d)', 't0')}  //  a +  b      + 2d
+        let t4 := {add('t1', 't1')}                    //           2c + 2d
+            t4 := {addmod('t4', 't4')}                     //           4c + 4d
+            t4 := {addmod('t4', 't3')}                     //  a +  b + 4c + 6d
+        let t5 := {add('t0', 't0')}                    // 2a + 2b
+            t5 := {addmod('t5', 't5')}                     // 4a + 4b
+            t5 := {addmod('t5', 't2')}                     // 4a + 6b + c +  d
+
+        mstore(a, {addmod('t3', 't5')})
+        mstore(b, t5)
+        mstore(c, {addmod('t2', 't4')})
+        mstore(d, t4)
+    }}
+'''
+        code += f'''
+    function fr_mm() {{
+        {fr_mm()}
+    }}
+'''
+        return code + ''.join(fr_intro(name, lanes) for name, lanes in zip(intro_names, groups))
+
+    def init():
+        stores = ''.join(f'    mstore({MEM[i]}, mload({params.ARG[i]}))\n' for i in range(t - 1))
+        return f'''
+    {define_functions()}
+
+{stores}    mstore({MEM[t - 1]}, {params.capacity})
+
+    fr_mm()
+'''
+
+    def full_round(r):
+        constants = params.C[t * r:t * (r + 1)]
+        calls = ''.join(f'    {name}({", ".join(str(constants[i]) for i in lanes)})\n'
+                        for name, lanes in zip(intro_names, groups))
+        return f'''
+{{
+{calls}    fr_mm()
+}}
+'''
+
+    def partial_round(r):
+        constant = params.C[t * r]
+        lanes = ''.join(f'        mstore({MEM[i]}, {addmod(diagonal(i), f"mload({SWP[0]})")})\n' for i in range(t))
+        return f'''
+{{
+        let state0 := {add(load(0), constant) if constant else load(0)}
+        {pow_store(params.alpha, 'state0', MEM[0])}
+
+        sum()
+{lanes}}}
+'''
+
+    return init, full_round, partial_round
+
+
+def ir_backend(params):
+    """Return the generators of the IR backend for `params`."""
+
+    t, MEM, SWP = params.t, params.MEM, params.MEM_SWP
+
+    def ir_mm4(block, a, b, c, d):
+        t0 = ir.add(block.load(a), block.load(b))
+        t1 = ir.add(block.load(c), block.load(d))
+        t2 = ir.add(block.load(b), block.load(b), t1)
+        t3 = ir.add(block.load(d), block.load(d), t0)
+        t4 = ir.addmod(ir.addmod(ir.add(t1, t1), ir.add(t1, t1)), t3)
+        t5 = ir.addmod(ir.addmod(ir.add(t0, t0), ir.add(t0, t0)), t2)
+
+        block.store(a, ir.addmod(t3, t5))
+        block.store(b, t5)
+        block.store(c, ir.addmod(t2, t4))
+        block.store(d, t4)
+
+    def ir_sum(nodes):
+        # At most five reduced values fit into 256 bits
+        total, count = nodes[-1], 1
+        for node in reversed(nodes[:-1]):
+            total, count = (ir.add(node, total), count + 1) if count < 5 else (ir.addmod(node, total), 1)
+        return total
+
+    def ir_fr_mm(block):
+        if t < 4:
+            block.store(SWP[0], ir_sum([block.load(MEM[i]) for i in range(t)]))
+            for i in range(t):
+                block.store(MEM[i], ir.addmod(block.load(MEM[i]), block.load(SWP[0])))
+            return
+        for i in range(0, t, 4):
+            ir_mm4(block, *MEM[i:i + 4])
+        if t == 4:
+            return
+        for j in range(4):
+            block.store(SWP[j], ir_sum([block.load(MEM[i]) for i in range(j, t, 4)]))
+        for i in range(t):
+            block.store(MEM[i], ir.addmod(block.load(MEM[i]), block.load(SWP[i % 4])))
+
+    def ir_init():
+        block = ir.Block()
+        for i in range(t - 1):
+            block.store(MEM[i], block.load(params.ARG[i]))
+        block.store(MEM[t - 1], params.capacity)
+        ir_fr_mm(block)
+        return [block]
+
+    def ir_full_round(r):
+        block = ir.Block()
+        for i in range(t):
+            block.store(MEM[i], ir.pow(params.alpha, ir.add(block.load(MEM[i]), params.C[t * r + i])))
+        ir_fr_mm(block)
+        return [block]
+
+    def ir_partial_round(r):
+        block = ir.Block()
+        block.store(MEM[0], ir.pow(params.alpha, ir.add(block.load(MEM[0]), params.C[t * r])))
+        block.store(SWP[0], ir_sum([block.load(MEM[i]) for i in range(t)]))
+        for i in range(t):
+            lane = block.load(MEM[i]) if params.D[i] == 1 else ir.mulmod(params.D[i], block.load(MEM[i]))
+            block.store(MEM[i], ir.addmod(lane, block.load(SWP[0])))
+        return [block]
+
+    return ir_init, ir_full_round, ir_partial_round
+
+
+BACKENDS = {'memory': memory_backend, 'ir': ir_backend}
+
+
+def function_comment(params):
+    return f"""
+    /*
+    * Suitable only for {params.t - 1}-tuples: Poseidon2 with t={params.t}, x^{params.alpha}, {params.rounds_f} full and
+    * {params.rounds_p} partial rounds. The capacity element is the input length shifted left by 64 bits.
+    */"""
+
+
+def generate(params, backend='memory'):
+    """Return the Solidity library computing `hash(uint256[t - 1])` for `params`."""
+
+    return generate_code(*BACKENDS[backend](params), params.t, params.rounds_f, params.rounds_p,
+                         function_comment(params), backend=backend)
+
+
+def estimate(params, backend='memory'):
+    """Return the `cost.estimate` of the `hash` function generated for `params`."""
+
+    parts = [argument_copy(params.ARG), *generate_parts(*BACKENDS[backend](params), params.rounds_f, params.rounds_p,
+                                                        backend)]
+    return cost.estimate(parts, MEMORY_START)
+
+
+def load_constants(path):
+    """Read the round constants `C` and the diagonal `D` (optional for t = 2, 3) from a JSON file, as numbers or
+    hex strings."""
+
+    import json
+
+    with open(path) as f:
+        constants = json.load(f)
+    number = lambda x: int(x, 0) if isinstance(x, str) else x
+    D = constants.get('D')
+    return [number(c) for c in constants['C']], D and [number(d) for d in D]
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Generate a Poseidon2 Solidity library for any supported width.')
+    parser.add_argument('--t', type=int, choices=SUPPORTED_WIDTHS, default=8, help='state width')
+    parser.add_argument('--alpha', type=int, choices=SUPPORTED_ALPHAS, default=7, help='degree of the S-box')
+    parser.add_argument('--rounds-f', type=int, default=8, help='number of full rounds')
+    parser.add_argument('--rounds-p', type=int, default=48, help='number of partial rounds')
+    parser.add_argument('--constants', help='JSON file with the round constants `C` and the diagonal `D` '
+                                            '(derived with the Grain LFSR of `grain.py` by default)')
+    parser.add_argument('--backend', choices=BACKENDS, default='memory',
+                        help='keep the state in memory slots, or optimize it through the IR; the IR code does not fit '
+                             'the stack for t >= 12, nor for t = 8 with x^11, x^19 or x^31')
+    parser.add_argument('--estimate', action='store_true',
+                        help='print the estimated gas and code size of `hash` as JSON instead of the code')
+    args = parser.parse_args()
+
+    try:
+        if args.constants:
+            C, D = load_constants(args.constants)
+        else:
+            import grain
+
+            C, D = grain.constants(F, args.t, args.alpha, args.rounds_f, args.rounds_p)
+        params = Parameters(args.t, args.alpha, args.rounds_f, args.rounds_p, C, D)
+    except ValueError as e:
+        parser.error(str(e))
+
+    try:
+        if args.estimate:
+            import json
+
+            print(json.dumps(estimate(params, args.backend), indent=2))
+        else:
+            print(generate(params, args.backend))
+    except ValueError as e:
+        parser.error(str(e))
@@ -0,0 +1,272 @@
+"""Generator of a fully unrolled Goldilocks t=12 permutation (requires eth-hash for the round constants).
+
+The parameters are those of `packages/our-implementation/`: p = 2^64 - 2^32 + 1, t=12, 8 full and 26 partial
+rounds, the S-box x^5 of `Poseidon2Main`, and the matrices and round constants of `Poseidon2Constants.sol`: the
+external matrix with 2 on the diagonal and 1 below it (circulant), the internal matrix with ones on the first row and
+column and 2 on the rest of the diagonal, and the round constants `keccak256(seed, round, lane) % p`. The generated
+library inlines all of them. It is not a drop-in replacement of `Poseidon2Main`, which reads its matrices and
+constants from storage and whose `hash` returns the first lane of the input state rather than of the permutation.
+
+Field elements take 64 of the 256 bits of a word, so the linear layers never reduce: the bounds of the lanes are
+followed through the rounds by a `ReductionPlanner`, and only the S-boxes (whose `mulmod` accepts any input) and the
+outputs are reduced. `mulmod` cannot work on packed lanes, so packing four 64-bit lanes into a word is done at the
+boundary of the library, by `permutePacked(uint256[3])`.
+
+Note that x^5 is not a permutation of the Goldilocks field (5 divides p - 1); `--alpha 7` generates the same
+construction with x^7, which is.
+"""
+
+from functools import cache
+
+from utils import *
+import cost
+
+P = 0xFFFFFFFF00000001
+T = 12
+ROUNDS_F = 8
+ROUNDS_P = 26
+ALPHA = 5
+SEED = b'Poseidon2_Goldilocks_t12'
+
+# Lanes packed into a word by `permutePacked`, the first one in the most significant bits
+LANE_BITS = 64
+PACKED_LANES = 256 // LANE_BITS
+# Most inputs of `hash`: one lane takes the domain separator and one the padding delimiter
+MAX_INPUTS = T - 2
+
+# The state is kept in the arguments of `permute` (and in place of the length and elements of the `hash` input)
+MEM = [hex(0x80 + 0x20 * i) for i in range(T)]
+ERRORS = ['InvalidInputLength()', 'InvalidFieldElement()']
+
+
+@cache
+def round_constants_t12():
+    """Return the round constants, `T` per round, as `Poseidon2Constants.getRoundConstants` derives them."""
+
+    seed = keccak256(SEED)
+    return [int.from_bytes(keccak256(seed + r.to_bytes(32, 'big') + i.to_bytes(32, 'big')), 'big') % P
+            for r in range(ROUNDS_F + ROUNDS_P) for i in range(T)]
+
+
+def external_layer(state):
+    return [(2 * state[i] + state[i - 1]) % P for i in range(T)]
+
+
+def internal_layer(state):
+    return [sum(state) % P] + [(state[0] + 2 * state[i]) % P for i in range(1, T)]
+
+
+def permute(state, alpha=ALPHA):
+    """Return the permutation of 12 integers (reduced first), as the generated `permute` computes it."""
+
+    if len(state) != T:
+        raise ValueError(f'expected {T} elements')
+    C = round_constants_t12()
+    state = external_layer([x % P for x in state])
+    for r, is_full in round_schedule(ROUNDS_F, ROUNDS_P):
+        state = [(x + c) % P for x, c in zip(state, C[T * r:T * (r + 1)])]
+        if is_full:
+            state = external_layer([x ** alpha % P for x in state])
+        else:
+            state = internal_layer([state[0] ** alpha % P, *state[1:]])
+    return state
+
+
+def hash(inputs, alpha=ALPHA):
+    """Return the same value as `hash(uint256[])` of the generated library."""
+
+    if not 1 <= len(inputs) <= MAX_INPUTS:
+        raise ValueError(f'expected between 1 and {MAX_INPUTS} inputs')
+    if not all(0 <= x < P for x in inputs):
+        raise ValueError('inputs must be elements of the field')
+    return permute([0, *inputs, 1] + [0] * (MAX_INPUTS - len(inputs)), alpha)[0]
+
+
+def pack(lanes):
+    """Pack lanes of 64 bits into words, `PACKED_LANES` per word, the first one in the most significant bits."""
+
+    return [sum(lane << (LANE_BITS * (PACKED_LANES - 1 - j)) for j, lane in enumerate(lanes[i:i + PACKED_LANES]))
+            for i in range(0, len(lanes), PACKED_LANES)]
+
+
+def unpack(words):
+    return [(word >> (LANE_BITS * (PACKED_LANES - 1 - j))) % 2 ** LANE_BITS for word in words
+            for j in range(PACKED_LANES)]
+
+
+def rounds(alpha=ALPHA):
+    """Return the `(kind, code)` parts of the permutation of the lanes in `MEM`, each below 2^64, as
+    `utils.generate_parts` does: the initial external layer (`init`), then the `full` and `partial` rounds. The
+    lanes are left unreduced in `MEM`."""
+
+    p = ReductionPlanner(WORD, P)
+    bounds = [2 ** LANE_BITS] * T
+
+    def lane(i):
+        return Bounded(f'mload({MEM[i]})', bounds[i])
+
+    def sbox(i, c):
+        value = p.add(lane(i), p.constant(c)) if c else lane(i)
+        bounds[i] = P
+        return f'''{{
+        let state := {value}
+        {pow_store(alpha, 'state', MEM[i], P)}
+    }}'''
+
+    def external():
+        # In place from the last lane down, each lane adds the one before it; the first adds the saved last one
+        last = Bounded('last', bounds[T - 1])
+        values = [p.add(lane(i), lane(i), lane(i - 1) if i else last) for i in range(T)]
+        lines = [f'let last := {lane(T - 1)}'] + [f'mstore({MEM[i]}, {values[i]})' for i in reversed(range(T))]
+        bounds[:] = [v.bound for v in values]
+        return '{\n' + ''.join(f'    {line}\n' for line in lines) + '}'
+
+    def internal(constants):
+        # The constants of the other lanes are folded into the sum and into the doubled lanes
+        s0 = Bounded('s0', bounds[0])
+        total = p.add(s0, *[lane(i) for i in range(1, T)], p.constant(sum(constants[1:])))
+        values = [p.add(s0, lane(i), lane(i), p.constant(2 * constants[i])) for i in range(1, T)]
+        lines = [f'let s0 := {lane(0)}', f'let sum := {total}']
+        lines += [f'mstore({MEM[i]}, {values[i - 1]})' for i in range(1, T)]
+        lines.append(f'mstore({MEM[0]}, sum)')
+        bounds[:] = [total.bound] + [v.bound for v in values]
+        return '{\n' + ''.join(f'    {line}\n' for line in lines) + '}'
+
+    parts = [('init', external() + '\n')]
+    for r, is_full in round_schedule(ROUNDS_F, ROUNDS_P):
+        constants = round_constants_t12()[T * r:T * (r + 1)]
+        if is_full:
+            sboxes = ''.join(sbox(i, c) for i, c in enumerate(constants))
+            parts.append(('full', f'''
+{{
+    {sboxes}
+{external()}
+}}
+'''))
+        else:
+            parts.append(('partial', f'''
+{{
+    {sbox(0, constants[0])}
+{internal(constants)}
+}}
+'''))
+    return parts
+
+
+def reduce(i):
+    return f'mod(mload({MEM[i]}), {P})'
+
+
+def revert(error):
+    return f'{{ mstore(0, {hex(selector(error))}) revert(0, 4) }}'
+
+
+def entry_points():
+    """Return the `(signature, assembly before the permutation, assembly after it)` of the public functions."""
+
+    permute_in = ''.join(f'mstore({MEM[i]}, {reduce(i)})\n' for i in range(T))
+    permute_out = permute_in + f'return({MEM[0]}, {hex(0x20 * T)})'
+
+    # The length of the input array takes the place of the domain separator, and the elements are in the lanes
+    # following it; the delimiter goes right after them and the rest of the state is cleared
+    hash_in = f'''let n := mload({MEM[0]})
+if or(iszero(n), gt(n, {MAX_INPUTS})) {revert(ERRORS[0])}
+for {{ let ptr := {MEM[1]} let end := add(ptr, shl(5, n)) }} lt(ptr, end) {{ ptr := add(ptr, 0x20) }} {{
+    if iszero(lt(mload(ptr), {P})) {revert(ERRORS[1])}
+}}
+mstore({MEM[0]}, 0)
+mstore(add({MEM[1]}, shl(5, n)), 1)
+for {{ let ptr := add({MEM[2]}, shl(5, n)) }} lt(ptr, {hex(int(MEM[-1], 16) + 0x20)}) {{ ptr := add(ptr, 0x20) }} {{
+    mstore(ptr, 0)
+}}
+'''
+    hash_out = f'mstore({MEM[0]}, {reduce(0)})\nreturn({MEM[0]}, 0x20)'
+
+    words = T // PACKED_LANES
+    mask = hex(2 ** LANE_BITS - 1)
+    packed_in = ''.join(f'let w{k} := mload({MEM[k]})\n' for k in range(words))
+    for i in range(T):
+        shift = LANE_BITS * (PACKED_LANES - 1 - i % PACKED_LANES)
+        packed_in += f'mstore({MEM[i]}, mod(and(shr({shift}, w{i // PACKED_LANES}), {mask}), {P}))\n'
+    packed_out = ''
+    for k in range(words):
+        lanes = [f'shl({LANE_BITS * (PACKED_LANES - 1 - j)}, {reduce(k * PACKED_LANES + j)})'
+                 for j in range(PACKED_LANES - 1)]
+        word = reduce(k * PACKED_LANES + PACKED_LANES - 1)
+        for expression in reversed(lanes):
+            word = f'or({expression}, {word})'
+        packed_out += f'mstore({MEM[k]}, {word})\n'
+    packed_out += f'return({MEM[0]}, {hex(0x20 * words)})'
+
+    return [(f'permute(uint256[{T}] memory) public pure returns (uint256[{T}] memory)', permute_in, permute_out),
+            ('hash(uint256[] memory input) public pure returns (uint256)', hash_in, hash_out),
+            (f'permutePacked(uint256[{words}] memory) public pure returns (uint256[{words}] memory)', packed_in,
+             packed_out)]
+
+
+PERMUTE_COMMENT = """
+    /*
+    * Permutes the lanes in memory, leaving them unreduced. Shared by the entry points below, which
+    * place the state in the slots of their arguments and reduce the lanes they return.
+    */"""
+
+ENTRY_COMMENTS = [
+    """
+    /*
+    * Poseidon2 permutation of the 12 lanes, with the matrices and round constants of
+    * `Poseidon2Constants` inlined. The lanes are reduced modulo p on the way in and out.
+    */""",
+    """
+    /*
+    * First lane of the permutation of the state: domain separator 0, the 1 to 10 inputs, the padding
+    * delimiter 1 and zeros. Reverts with `InvalidInputLength()` on other lengths and with
+    * `InvalidFieldElement()` on inputs not below p.
+    */""",
+    """
+    /*
+    * `permute` with four 64-bit lanes per word, the first lane in the most significant bits.
+    */""",
+]
+
+
+def generate_code(alpha=ALPHA):
+    code = ''.join(part for _, part in rounds(alpha))
+    functions = [wrap_into_function('_permute() private pure', code.split('\n'), PERMUTE_COMMENT)]
+    for (signature, before, after), comment in zip(entry_points(), ENTRY_COMMENTS):
+        lines = ''.join(3 * chr(9) + line + chr(10) for line in before.split('\n'))
+        prologue = f"""
+        assembly {{
+{lines}
+        }}
+        _permute();"""
+        functions.append(wrap_into_function(signature, after.split('\n'), comment, prologue))
+    errors = ''.join(f'\n    error {error};' for error in ERRORS)
+    return f"""
+pragma solidity 0.8.26;
+library Poseidon2GoldilocksT{T}Assembly {{{errors}
+{''.join(functions)}
+}}"""
+
+
+def estimate(alpha=ALPHA):
+    """Return the `cost.estimate` of the permutation, without the entry points."""
+
+    return cost.estimate(rounds(alpha), int(MEM[-1], 16) + 0x20)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Generate the unrolled Poseidon2 Goldilocks t=12 Solidity library.')
+    parser.add_argument('--alpha', type=int, choices=(5, 7), default=ALPHA,
+                        help='degree of the S-box: 5 as in Poseidon2Main, 7 for a permutation of the field')
+    parser.add_argument('--estimate', action='store_true',
+                        help='print the estimated gas and code size of the permutation as JSON instead of the code')
+    args = parser.parse_args()
+
+    if args.estimate:
+        import json
+
+        print(json.dumps(estimate(args.alpha), indent=2))
+    else:
+        print(generate_code(args.alpha))
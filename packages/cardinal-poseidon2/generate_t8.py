@@ -1,4 +1,6 @@
 from utils import *
+import cost
+import ir
 
 C = [0x09ac1c9e3e10275d303775ee5156cac5797286885ab6e9996cabd920c6d7301c,
      0x08f060c5232c1aa1af16c66c01f856ce21a23b904d785d93fc3eb1936ab1d138,
@@ -470,14 +472,12 @@ M = [[10, 14, 2, 6, 5, 7, 1, 3],
 ALPHA = 7
 ROUNDS_F = 8
 ROUNDS_P = 48
+# Initial value of the capacity element: the input length (7) shifted left by 64 bits
+CAPACITY = 129127208515966861312
 
 def define_functions():
     return f'''
 
-    function sum() {{
-        {store0(addmod(add(addmod(add(load0(), load1(), load2(), load3(), load4()), load5()), load6()), load7()), swap=True)}
-    }}
-
     function mm4(a, b, c, d) {{
         let t0 := {add('mload(a)', 'mload(b)')}        //  a +  b
         let t1 := {add('mload(c)', 'mload(d)')}        //          + c +  d
@@ -554,12 +554,32 @@ def init():
     {store4(f'mload({ARG[4]})')}
     {store5(f'mload({ARG[5]})')}
     {store6(f'mload({ARG[6]})')}
-    {store7('129127208515966861312')}
+    {store7(CAPACITY)}
 
     fr_mm()
 '''
 
 
+def calldata_init():
+    """`init` of the memory backend for `hash(uint256[7] calldata)`: the inputs are read with `calldataload` into
+    stack variables, the first `fr_mm` runs there as in the stack backend, and only its result is stored to `MEM`."""
+
+    p = ReductionPlanner()
+    arguments, mix = stack_arguments(p, 'calldata'), stack_fr_mm(p)
+    stores = (chr(10) + 4 * ' ').join(f'mstore({MEM[i]}, {p.reduce(p[STACK[i]])})' for i in range(T))
+    return f'''
+    {define_functions()}
+
+{{
+    {arguments}
+
+    {mix}
+
+    {stores}
+}}
+'''
+
+
 def full_round(r):
     return f'''
 {{
@@ -570,22 +590,293 @@ def full_round(r):
 
 
 def partial_round(r):
+    return partial_round_body(C[T * r])
+
+
+def partial_round_body(constant):
+    """Partial round adding `constant` (an expression, or a number left out when it is zero) to the first element.
+
+    The sum of the elements is a local variable, with its reductions placed by a `ReductionPlanner`: the elements
+    stored in memory are below `F`, so one `addmod` out of seven additions keeps it below 2^256, and each element is
+    reduced by the `addmod` that adds it back."""
+
+    p = ReductionPlanner()
+    total = p.add(*(Bounded(f'mload({MEM[i]})', F) for i in range(T)))
+    lanes = [addmod(mulmod(D[i], f'mload({MEM[i]})'), 'total') for i in range(T)]
+    stores = ''.join(f'        mstore({MEM[i]}, {lane})\n' for i, lane in enumerate(lanes))
+    return f'''
+{{
+        let state0 := {add(load0(), constant) if constant else load0()}
+        {pow_store(ALPHA, 'state0', MEM[0])}
+
+        let total := {total}
+{stores}}}
+'''
+
+
+def folded_partial_round(r):
+    """Partial round of the folded representation of the partial rounds: the elements are stored unreduced, and the
+    first one with the constant of the next partial round already added, so that the next S-box reads it as is.
+
+    The sum of the elements is reduced below F. Every element is stored as its product by the diagonal (below F) plus
+    that sum, so below 2F; the first element also carries the folded constant, which leaves it below 3F (below 2F
+    after the last partial round). `mulmod` and `addmod` take operands of any size, so the S-box and the next sum
+    read them unreduced. Only the first partial round adds its own constant, to the reduced output of the full round
+    before it."""
+
+    p = ReductionPlanner()
+    first_partial_round = ROUNDS_F // 2
+    bound = F if r == first_partial_round else 2 * F
+    lanes = [Bounded(f'mload({MEM[0]})', F)] + [Bounded(f'mload({MEM[i]})', bound) for i in range(1, T)]
+    total = p.add(*lanes, limit=F)
+    # The constant of the next round, if it is a partial round
+    folded = [p.constant(C[T * (r + 1)])] if r + 1 < first_partial_round + ROUNDS_P else []
+
+    def lane(i):
+        return p.add(p.mulmod(D[i], f'mload({MEM[i]})'), Bounded('total', F), *(folded if i == 0 else []))
+
+    stores = ''.join(f'        mstore({MEM[i]}, {lane(i)})\n' for i in range(T))
     return f'''
 {{
-        let state0 := {add(load0(), C[T * r])}
+        let state0 := {add(load0(), C[T * r]) if r == first_partial_round else load0()}
         {pow_store(ALPHA, 'state0', MEM[0])}
 
-        sum()
-        {store0(addmod(mulmod(D[0], load0()), load0(swap=True)))}
-        {store1(addmod(mulmod(D[1], load1()), load0(swap=True)))}
-        {store2(addmod(mulmod(D[2], load2()), load0(swap=True)))}
-        {store3(addmod(mulmod(D[3], load3()), load0(swap=True)))}
-        {store4(addmod(mulmod(D[4], load4()), load0(swap=True)))}
-        {store5(addmod(mulmod(D[5], load5()), load0(swap=True)))}
-        {store6(addmod(mulmod(D[6], load6()), load0(swap=True)))}
-        {store7(addmod(mulmod(D[7], load7()), load0(swap=True)))}
+        let total := {total}
+{stores}}}
+'''
+
+
+def table_backend():
+    """Return the generators of the memory backend reading the round constants from the table of `constant_table`,
+    and that table. The full rounds read their constants by offset; the partial rounds, which only have a constant
+    on the first element, are rolled into a single loop walking the table."""
+
+    table, offsets = constant_table(C, T, ROUNDS_F, ROUNDS_P)
+    first_partial_round = ROUNDS_F // 2
+    for r in range(first_partial_round, first_partial_round + ROUNDS_P):
+        if [i for i, _ in round_constants(C, T, r)] != [0]:
+            raise ValueError(f'partial round {r} does not have exactly one constant, on the first element')
+
+    def entry(k):
+        return f'mload(add({CONSTANTS}, {hex(32 * (k + 1))}))'
+
+    def table_full_round(r):
+        lanes = [i for i, _ in round_constants(C, T, r)]
+        constants = [entry(offsets[r] + lanes.index(i)) if i in lanes else '0' for i in range(T)]
+        return f'''
+{{
+    fr_intro({', '.join(constants)})
+    fr_mm()
+}}
+'''
+
+    def table_partial_round(r):
+        if r != first_partial_round:
+            return ''
+        return f'''
+for {{ let p := add({CONSTANTS}, {hex(32 * (offsets[r] + 1))}) let end := add(p, {hex(32 * ROUNDS_P)}) }}
+    lt(p, end) {{ p := add(p, 0x20) }} {{
+    {partial_round_body('mload(p)')}
+}}
+'''
+
+    return (init, table_full_round, table_partial_round), table
+
+
+def constant_encoding(mode, calls):
+    """Return the generators of the memory backend and the table to pass to `generate_code` for the given
+    `--constants` mode; `auto` weighs the two encodings for a deployment hashing `calls` times. With inline constants
+    the t=8 code is estimated well over `cost.CODE_SIZE_LIMIT`, so `auto` always settles on the table here."""
+
+    generators, table = table_backend()
+    if mode == 'auto':
+        mode = cost.choose_constant_encoding(estimate(BACKENDS['memory']), estimate(generators, table=table), calls)
+    if mode == 'table':
+        return generators, table
+    return BACKENDS['memory'], None
+
+
+def argument_parts(arguments='memory'):
+    """Return the parts reading the arguments of `hash` before `init`, for `cost.estimate` and
+    `interpreter.profile`: the `argument_copy` of solc for `memory` arguments, none for `calldata` ones."""
+
+    return [] if arguments == 'calldata' else [argument_copy(ARG)]
+
+
+def estimate(generators, backend='memory', table=None, arguments='memory'):
+    """Return the `cost.estimate` of the `hash` function built by `generators`, reading its arguments from
+    `arguments` (the copy of `memory` arguments included)."""
+
+    parts = argument_parts(arguments) + generate_parts(*generators, ROUNDS_F, ROUNDS_P, backend)
+    return cost.estimate(parts, MEMORY_START, None if table is None else len(table))
+
+
+def backend_generators(backend, reduction='lazy', constants='inline', partial_rounds='dense', arguments='memory',
+                       calls=0):
+    """Return the generators of `hash` for the options of the command line, and the constant table to pass to
+    `generate_code` (`None` for inline constants)."""
+
+    table = None
+    if backend == 'stack':
+        return stack_backend(reduction, arguments), table
+    if backend == 'memory':
+        generators, table = constant_encoding(constants, calls)
+        if table is None:
+            generators = (init, full_round, PARTIAL_ROUNDS[partial_rounds])
+    else:
+        generators = BACKENDS[backend]
+    if arguments == 'calldata':
+        generators = (CALLDATA_INITS[backend], *generators[1:])
+    return generators, table
+
+
+def stack_arguments(p, arguments='memory'):
+    """Return the assembly code declaring the `STACK` variables with the arguments of `hash` and the capacity."""
+
+    lines = [p.assign(STACK[i], Bounded(argument(i, arguments), F), declare=True) for i in range(T - 1)]
+    lines.append(p.assign(STACK[T - 1], p.constant(CAPACITY), declare=True))
+    return (chr(10) + 4 * ' ').join(lines)
+
+
+def stack_fr_mm(p):
+    """Return the assembly code of `fr_mm` on the `STACK` variables, with the reductions placed by `p`."""
+
+    code = f'{{\n{stack_mm4(*STACK[0:4], p)}\n{stack_mm4(*STACK[4:8], p)}\n'
+    for i in range(4):
+        code += f'''{{
+    {p.assign('s', p.add(p[STACK[i]], p[STACK[i + 4]]), declare=True)}
+    {p.assign(STACK[i], p.add(p[STACK[i]], p['s']))}
+    {p.assign(STACK[i + 4], p.add(p[STACK[i + 4]], p['s']))}
 }}
 '''
+    return code + '}'
+
+
+def stack_backend(reduction='lazy', arguments='memory'):
+    """Return the generators of the stack backend. They share a `ReductionPlanner`, so the bounds of the state
+    are followed from one round to the next."""
+
+    p = ReductionPlanner(REDUCTIONS[reduction])
+    last_round = ROUNDS_F + ROUNDS_P - 1
+
+    def stack_init():
+        p.bounds.clear()
+        return f'''
+    {stack_arguments(p, arguments)}
+
+    {stack_fr_mm(p)}
+'''
+
+    def stack_sbox(i, c):
+        return f'''
+    {p.assign(STACK[i], p.add(p[STACK[i]], p.constant(c)))}
+    {pow(ALPHA, STACK[i])}'''
+
+    def stack_full_round(r):
+        sboxes = ''.join(stack_sbox(i, C[T * r + i]) for i in range(T))
+        for i in range(T):
+            p.bounds[STACK[i]] = F
+        code = f'''
+{{
+    {sboxes}
+
+    {stack_fr_mm(p)}
+}}
+'''
+        if r == last_round:
+            code += p.assign(STACK[0], p.reduce(p[STACK[0]])) + '\n'
+        return code
+
+    def stack_partial_round(r):
+        sbox = stack_sbox(0, C[T * r])
+        p.bounds[STACK[0]] = F
+        # The sum is accumulated one lane at a time to keep the expressions shallow. Reducing it once at the end is
+        # cheaper than reducing the eight lanes it is added to.
+        total = p.assign('sum', p[STACK[0]], declare=True)
+        for i in range(1, T):
+            total += chr(10) + 4 * ' ' + p.assign('sum', p.add(p[STACK[i]], p['sum'], limit=F if i == T - 1 else None))
+        lanes = (chr(10) + 4 * ' ').join(p.assign(STACK[i], p.add(p.mulmod(D[i], STACK[i]), p['sum']))
+                                         for i in range(T))
+        return f'''
+{{
+    {sbox}
+
+    {total}
+    {lanes}
+}}
+'''
+
+    return stack_init, stack_full_round, stack_partial_round
+
+
+def ir_mm4(block, a, b, c, d):
+    t0 = ir.add(block.load(a), block.load(b))
+    t1 = ir.add(block.load(c), block.load(d))
+    t2 = ir.add(block.load(b), block.load(b), t1)
+    t3 = ir.add(block.load(d), block.load(d), t0)
+    t4 = ir.addmod(ir.addmod(ir.add(t1, t1), ir.add(t1, t1)), t3)
+    t5 = ir.addmod(ir.addmod(ir.add(t0, t0), ir.add(t0, t0)), t2)
+
+    block.store(a, ir.addmod(t3, t5))
+    block.store(b, t5)
+    block.store(c, ir.addmod(t2, t4))
+    block.store(d, t4)
+
+
+def ir_fr_mm(block):
+    ir_mm4(block, *MEM[0:4])
+    ir_mm4(block, *MEM[4:8])
+    for i in range(4):
+        block.store(MEM_SWP[i], ir.add(block.load(MEM[i]), block.load(MEM[i + 4])))
+    for i in range(T):
+        block.store(MEM[i], ir.addmod(block.load(MEM[i]), block.load(MEM_SWP[i % 4])))
+
+
+def ir_init(arguments='memory'):
+    block = ir.Block()
+    for i in range(T - 1):
+        block.store(MEM[i], block.load(ARG[i]) if arguments == 'memory' else ir.calldataload(CALLDATA_ARG[i]))
+    block.store(MEM[T - 1], CAPACITY)
+    ir_fr_mm(block)
+    return [block]
+
+
+def ir_calldata_init():
+    return ir_init('calldata')
+
+
+def ir_full_round(r):
+    block = ir.Block()
+    for i in range(T):
+        block.store(MEM[i], ir.pow(ALPHA, ir.add(block.load(MEM[i]), C[T * r + i])))
+    ir_fr_mm(block)
+    return [block]
+
+
+def ir_partial_round(r):
+    block = ir.Block()
+    # The whole row of constants is added, the zero ones are folded away
+    for i in range(T):
+        block.store(MEM[i], ir.add(block.load(MEM[i]), C[T * r + i]))
+    block.store(MEM[0], ir.pow(ALPHA, block.load(MEM[0])))
+
+    block.store(MEM_SWP[0], ir.addmod(ir.add(ir.addmod(ir.add(*map(block.load, MEM[0:5])), block.load(MEM[5])),
+                                             block.load(MEM[6])), block.load(MEM[7])))
+    for i in range(T):
+        block.store(MEM[i], ir.addmod(ir.mulmod(D[i], block.load(MEM[i])), block.load(MEM_SWP[0])))
+    return [block]
+
+
+# Partial rounds of the memory backend: as specified, or in the folded representation of `folded_partial_round`
+PARTIAL_ROUNDS = {'dense': partial_round, 'folded': folded_partial_round}
+
+BACKENDS = {
+    'memory': (init, full_round, partial_round),
+    'stack': stack_backend(),
+    'ir': (ir_init, ir_full_round, ir_partial_round),
+}
+# `init` of the backends for `--arguments calldata` (the stack backend takes the mode itself)
+CALLDATA_INITS = {'memory': calldata_init, 'ir': ir_calldata_init}
 
 FUNCTION_COMMENT = """
     /*
@@ -593,5 +884,80 @@ FUNCTION_COMMENT = """
     * the initial state of the hashing function, which is not done in the current implementation.
     */"""
 
+SPONGE_COMMENT = """
+    /*
+    * Sponge with rate 7 and capacity 1 for inputs of any length. The length is part of the initial
+    * capacity element, so for 7-tuples the result is the same as `hash`. Reverts with
+    * `InputNotInField()` if an input is not below the field modulus.
+    */"""
+
+HASH_MANY_COMMENT = """
+    /*
+    * `hash` of every 7-tuple of `inputs`, in a single call: the permutation is run in a loop over the
+    * tuples and the results are returned in the same order.
+    */"""
+
+MERKLE_COMMENTS = ["""
+    /*
+    * Whether `leaf` is at position `index` of the tree with the given `root`, with the siblings of
+    * every level from the bottom up. Nodes are the `hash` of their children padded with zeros.
+    */""", """
+    /*
+    * Checks the path of `leaf` like `verifyPath` and returns the root of the tree with `newLeaf` in
+    * its place, computed from the same siblings. Reverts with `InvalidProof` if the path is wrong.
+    */"""]
+
 if __name__ == '__main__':
-    print(generate_code(init, full_round, partial_round, T, ROUNDS_F, ROUNDS_P, FUNCTION_COMMENT))
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Generate the Poseidon2 t=8 Solidity library.')
+    parser.add_argument('--backend', choices=BACKENDS, default='memory',
+                        help='keep the state of `hash` in memory slots or in stack variables, or optimize it through '
+                             'the IR')
+    parser.add_argument('--reduction', choices=REDUCTIONS, default='lazy',
+                        help='where the stack backend reduces additions modulo the field')
+    parser.add_argument('--sponge', action='store_true', help='also emit `sponge(uint256[] calldata)`')
+    parser.add_argument('--hash-many', action='store_true', help='also emit `hashMany(uint256[7][] calldata)`')
+    parser.add_argument('--merkle', type=int, choices=range(2, T), metavar='ARITY',
+                        help='also emit `verifyPath` and `updateLeaf` for trees of the given arity (2 to 7)')
+    parser.add_argument('--partial-rounds', choices=PARTIAL_ROUNDS, default='dense',
+                        help='compute the partial rounds as specified, or fold the constants into the previous round '
+                             'and leave the elements unreduced (memory backend with inline constants only)')
+    parser.add_argument('--constants', choices=('inline', 'table', 'auto'), default='inline',
+                        help='push the round constants inline or read them from a table copied from the code '
+                             '(memory backend only); `auto` picks the cheaper one that fits the code size limit, which '
+                             'for t=8 is always the table')
+    parser.add_argument('--arguments', choices=HASH_SIGNATURES, default='memory',
+                        help='take the inputs of `hash` as `memory`, decoded by solc, or as `calldata`, read by `init` '
+                             'with `calldataload` straight into the first `fr_mm`')
+    parser.add_argument('--calls', type=int, default=10000,
+                        help='expected number of hashes per deployment, weighed against the deploy cost by `auto`')
+    parser.add_argument('--estimate', action='store_true',
+                        help='print the estimated gas and code size of `hash` as JSON instead of the code')
+    args = parser.parse_args()
+    if args.constants != 'inline' and args.backend != 'memory':
+        parser.error('--constants table/auto requires the memory backend')
+    if args.partial_rounds != 'dense' and (args.backend != 'memory' or args.constants != 'inline'):
+        parser.error('--partial-rounds folded requires the memory backend with inline constants')
+    partial = PARTIAL_ROUNDS[args.partial_rounds]
+
+    extra_functions = []
+    if args.sponge:
+        extra_functions.append(generate_sponge(define_functions, 'fr_mm()', full_round, partial, T, ROUNDS_F,
+                                               ROUNDS_P, SPONGE_COMMENT))
+    if args.hash_many:
+        extra_functions.append(generate_hash_many(define_functions, 'fr_mm()', full_round, partial, T, ROUNDS_F,
+                                                  ROUNDS_P, HASH_MANY_COMMENT))
+    if args.merkle:
+        extra_functions.append(generate_merkle(define_functions, 'fr_mm()', full_round, partial, T, ROUNDS_F,
+                                               ROUNDS_P, args.merkle, MERKLE_COMMENTS))
+
+    generators, table = backend_generators(args.backend, args.reduction, args.constants, args.partial_rounds,
+                                           args.arguments, args.calls)
+    if args.estimate:
+        import json
+
+        print(json.dumps(estimate(generators, args.backend, table, args.arguments), indent=2))
+        raise SystemExit
+    print(generate_code(*generators, T, ROUNDS_F, ROUNDS_P, FUNCTION_COMMENT, extra_functions, args.backend, table,
+                        args.arguments))
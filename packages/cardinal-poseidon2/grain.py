@@ -0,0 +1,257 @@
+"""Derivation of the round constants and of the internal matrix of a Poseidon2 instance, as the parameter script of
+the Poseidon2 reference implementation (`poseidon2_rust_params.sage`) does, with an on-disk cache.
+
+All the values are read from the Grain LFSR seeded with the field, the S-box type, the field size, the width and the
+round numbers. The round constants come first: `t` per full round and one per partial round, drawn below the prime
+by rejection. The diagonal of the internal matrix `J - I + diag(d)` comes next, redrawn until the minimal polynomials
+of its first `2t` powers are irreducible of degree `t`. The reference then runs the subspace trail checks of the
+Poseidon paper on the result, which only report an insecure matrix: they are not repeated here. For `t = 2, 3` the
+internal matrix is the fixed one of the paper. For the BN254 t=8 instance the result is the `C` and `D` of
+`generate_t8.py`.
+
+Results are cached in JSON files named by the SHA-256 of their parameters, in the format `generate.py --constants`
+reads, under `$POSEIDON2_CACHE` (`~/.cache/cardinal-poseidon2` by default).
+"""
+
+import hashlib
+import json
+import os
+from math import gcd
+
+from parameters import internal_diagonal
+
+CACHE_DIR = os.environ.get('POSEIDON2_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'cardinal-poseidon2'))
+
+# Fields of the seed: prime field, and the S-box x^alpha (as opposed to x^-1)
+FIELD_PRIME = 1
+SBOX_POWER = 0
+# Bits of the LFSR discarded before the first output
+WARM_UP = 160
+
+
+def grain(p, t, rounds_f, rounds_p):
+    """Return an iterator over the bits of the Grain LFSR for the instance. Each output bit is preceded by a bit
+    deciding whether it is kept, as in the reference."""
+
+    seed = (f'{FIELD_PRIME:02b}{SBOX_POWER:04b}{p.bit_length():012b}{t:012b}{rounds_f:010b}{rounds_p:010b}'
+            + '1' * 30)
+    state = [int(bit) for bit in seed]
+
+    def step():
+        bit = state[62] ^ state[51] ^ state[38] ^ state[23] ^ state[13] ^ state[0]
+        state.pop(0)
+        state.append(bit)
+        return bit
+
+    for _ in range(WARM_UP):
+        step()
+    while True:
+        while not step():
+            step()
+        yield step()
+
+
+def random_integer(bits, size):
+    """Return the integer of the next `size` bits, the first one the most significant."""
+
+    return int(''.join(str(next(bits)) for _ in range(size)), 2)
+
+
+def round_constants(bits, p, t, rounds_f, rounds_p):
+    """Return the round constants, `t` per round with zeros after the first one in the partial rounds."""
+
+    constants = []
+    for r in range(rounds_f + rounds_p):
+        full = r < rounds_f // 2 or r >= rounds_f // 2 + rounds_p
+        for _ in range(t if full else 1):
+            c = random_integer(bits, p.bit_length())
+            while c >= p:
+                c = random_integer(bits, p.bit_length())
+            constants.append(c)
+        constants += [0] * (0 if full else t - 1)
+    return constants
+
+
+def internal_matrix_diagonal(bits, p, t):
+    """Return the `D` of the internal matrix `J + diag(D)`."""
+
+    if t < 4:
+        return internal_diagonal(t)
+    while True:
+        d = [random_integer(bits, p.bit_length()) % p for _ in range(t)]
+        matrix = [[d[i] if i == j else 1 for j in range(t)] for i in range(t)]
+        if minimal_polynomials_condition(matrix, p):
+            return [(x - 1) % p for x in d]
+
+
+def minimal_polynomials_condition(matrix, p):
+    """Whether the minimal polynomials of the first `2t` powers of the matrix are irreducible of degree `t`, that is
+    whether their characteristic polynomials are irreducible."""
+
+    power = matrix
+    for _ in range(2 * len(matrix)):
+        if not is_irreducible(characteristic_polynomial(power, p), p):
+            return False
+        power = _matrix_product(matrix, power, p)
+    return True
+
+
+def _matrix_product(a, b, p):
+    return [[sum(x * y for x, y in zip(row, column)) % p for column in zip(*b)] for row in a]
+
+
+def characteristic_polynomial(matrix, p):
+    """Return the coefficients of the characteristic polynomial, lowest degree first (Faddeev-LeVerrier, `p` has to
+    be larger than the size of the matrix)."""
+
+    n = len(matrix)
+    coefficients = [0] * n + [1]
+    m = [[0] * n for _ in range(n)]
+    for k in range(1, n + 1):
+        m = _matrix_product(matrix, m, p)
+        for i in range(n):
+            m[i][i] = (m[i][i] + coefficients[n - k + 1]) % p
+        trace = sum(row[i] for i, row in enumerate(_matrix_product(matrix, m, p)))
+        coefficients[n - k] = -trace * pow(k, -1, p) % p
+    return coefficients
+
+
+def _trim(f):
+    while f and not f[-1]:
+        f.pop()
+    return f
+
+
+def _remainder(f, g, p):
+    f, inverse = f[:], pow(g[-1], -1, p)
+    for i in range(len(f) - len(g), -1, -1):
+        q = f[i + len(g) - 1] * inverse % p
+        if q:
+            for j, c in enumerate(g):
+                f[i + j] = (f[i + j] - q * c) % p
+    return _trim(f[:len(g) - 1])
+
+
+def _product_modulo(a, b, f, p):
+    product = [0] * max(len(a) + len(b) - 1, 0)
+    for i, x in enumerate(a):
+        for j, y in enumerate(b):
+            product[i + j] += x * y
+    return _remainder([c % p for c in product], f, p)
+
+
+def _gcd(a, b, p):
+    a, b = _trim(a[:]), _trim(b[:])
+    while b:
+        a, b = b, _remainder(a, b, p)
+    return a
+
+
+def is_irreducible(f, p):
+    """Rabin's test of the irreducibility of a monic polynomial over the prime field: `x^(p^n) = x` modulo `f`, and
+    `x^(p^(n/q)) - x` coprime with `f` for every prime `q` dividing its degree `n`."""
+
+    n = len(f) - 1
+    if n == 1:
+        return True
+    # Frobenius map modulo `f`: the images of 1, x, ..., x^(n - 1) raised to the power `p`
+    xp, base, e = [1], [0, 1], p
+    while e:
+        if e & 1:
+            xp = _product_modulo(xp, base, f, p)
+        base, e = _product_modulo(base, base, f, p), e >> 1
+    images = [[1]]
+    for _ in range(n - 1):
+        images.append(_product_modulo(images[-1], xp, f, p))
+
+    def frobenius(g):
+        result = [0] * n
+        for c, image in zip(g, images):
+            for i, x in enumerate(image):
+                result[i] = (result[i] + c * x) % p
+        return _trim(result)
+
+    primes = [q for q in range(2, n + 1) if n % q == 0 and all(q % r for r in range(2, q))]
+    power, powers = [0, 1], {}
+    for k in range(1, n + 1):
+        power = frobenius(power)
+        powers[k] = power
+    if powers[n] != [0, 1]:
+        return False
+    for q in primes:
+        difference = powers[n // q] + [0] * 2
+        difference[1] = (difference[1] - 1) % p
+        if len(_gcd(f, difference, p)) > 1:
+            return False
+    return True
+
+
+def derive(p, t, alpha, rounds_f, rounds_p):
+    """Return the round constants `C` and the internal diagonal `D` of the instance, without the cache."""
+
+    if t not in (2, 3) and t % 4:
+        raise ValueError(f'no Poseidon2 external matrix for t={t}')
+    if alpha < 3 or gcd(alpha, p - 1) != 1:
+        raise ValueError(f'x^{alpha} is not a permutation of the field')
+    if rounds_f <= 0 or rounds_f % 2 or rounds_p < 0:
+        raise ValueError('the number of full rounds must be positive and even')
+    bits = grain(p, t, rounds_f, rounds_p)
+    C = round_constants(bits, p, t, rounds_f, rounds_p)
+    return C, internal_matrix_diagonal(bits, p, t)
+
+
+def cache_key(p, t, alpha, rounds_f, rounds_p):
+    return {'field': hex(p), 't': t, 'alpha': alpha, 'rounds_f': rounds_f, 'rounds_p': rounds_p}
+
+
+def cache_path(key, cache_dir=CACHE_DIR):
+    digest = hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+    return os.path.join(cache_dir, f'{digest}.json')
+
+
+def constants(p, t, alpha, rounds_f, rounds_p, cache_dir=CACHE_DIR):
+    """Return the `C` and `D` of `derive`, read from the cache when they were derived before. An unreadable or
+    mismatching cache entry is derived again and replaced."""
+
+    key = cache_key(p, t, alpha, rounds_f, rounds_p)
+    path = cache_path(key, cache_dir)
+    try:
+        with open(path) as f:
+            entry = json.load(f)
+        if entry['key'] == key:
+            return [int(c, 16) for c in entry['C']], [int(d, 16) for d in entry['D']]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    C, D = derive(p, t, alpha, rounds_f, rounds_p)
+    os.makedirs(cache_dir, exist_ok=True)
+    # Written next to the entry then renamed, so that concurrent runs never read a partial file
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'w') as f:
+        json.dump({'key': key, 'C': [hex(c) for c in C], 'D': [hex(d) for d in D]}, f, indent=1)
+    os.replace(temporary, path)
+    return C, D
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from utils import F
+
+    parser = argparse.ArgumentParser(description='Derive the constants of a Poseidon2 instance with the Grain LFSR.')
+    parser.add_argument('--field', type=lambda x: int(x, 0), default=F, help='prime of the field (BN254 by default)')
+    parser.add_argument('--t', type=int, default=8, help='state width')
+    parser.add_argument('--alpha', type=int, default=7, help='degree of the S-box')
+    parser.add_argument('--rounds-f', type=int, default=8, help='number of full rounds')
+    parser.add_argument('--rounds-p', type=int, default=48, help='number of partial rounds')
+    parser.add_argument('--no-cache', action='store_true', help='derive the constants without reading the cache')
+    args = parser.parse_args()
+
+    try:
+        if args.no_cache:
+            C, D = derive(args.field, args.t, args.alpha, args.rounds_f, args.rounds_p)
+        else:
+            C, D = constants(args.field, args.t, args.alpha, args.rounds_f, args.rounds_p)
+    except ValueError as e:
+        parser.error(str(e))
+    print(json.dumps({'C': [hex(c) for c in C], 'D': [hex(d) for d in D]}, indent=1))
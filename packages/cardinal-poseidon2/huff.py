@@ -0,0 +1,464 @@
+"""Huff and raw EVM bytecode emitter of the t=8 `hash`, with the whole state kept on the stack.
+
+The rounds are built by the IR backend of `generate_t8.py` and flattened into a single expression DAG over the
+inputs: a slot loaded by a round is replaced by the value the previous round stored to it, so no memory is used
+until the result is returned. The DAG is then scheduled onto the stack by `Scheduler`, which tracks what every
+stack slot holds and picks the DUP/SWAP for every operand:
+
+- values used once are evaluated in place as operands, values used more than once are kept in a stack slot;
+- the last use of a kept value moves it to the top with a SWAP (or uses it where it is) instead of duplicating it,
+  whenever nothing of the expression being evaluated is on the stack yet;
+- the field modulus of `addmod`/`mulmod` is duplicated from a slot kept within reach, pushed again when it is not;
+- slots left dead by a duplicated last use are only removed when they would push a live value out of the reach
+  of DUP16.
+
+The contract reads the seven inputs as raw calldata words (no selector, like the Huff permutation of the zemse
+package) and returns `hash(uint256[7])` of the generated Solidity library.
+"""
+
+from utils import F, MEM, ARG, round_schedule
+import cost
+import ir
+from generate_t8 import BACKENDS, ROUNDS_F, ROUNDS_P, T
+
+# Deepest slot DUP16/SWAP16 can reach
+REACH = 16
+# Slots kept free above the live values, for the operands of the expression being evaluated (tuned on the gas of
+# the t=8 hash)
+HEADROOM = 7
+# Deepest slot the modulus is duplicated from between two expressions; deeper, it is pushed again
+MODULUS_DEPTH = 12
+EVM_STACK_LIMIT = 1024
+
+OPCODES = {
+    'add': 0x01, 'addmod': 0x08, 'mulmod': 0x09, 'calldataload': 0x35, 'codecopy': 0x39, 'pop': 0x50,
+    'mstore': 0x52, 'push0': 0x5f, 'return': 0xf3,
+    **{f'dup{n}': 0x7f + n for n in range(1, 17)},
+    **{f'swap{n}': 0x8f + n for n in range(1, 17)},
+}
+# Number of stack items consumed and produced by the opcodes the scheduler emits
+STACK_EFFECTS = {'add': (2, 1), 'addmod': (3, 1), 'mulmod': (3, 1), 'calldataload': (1, 1), 'pop': (1, 0)}
+
+# Markers of the stack slots not holding a kept value: operands of the expression being evaluated, and dead values
+TEMPORARY = 'temporary'
+DEAD = 'dead'
+# Stands for the field modulus in the stack and in the code
+MODULUS = 'PRIME'
+
+
+@ir.scope()
+def rounds():
+    """Return the parts of the permutation as `(kind, values)` pairs, `values` mapping every `MEM` slot the part
+    writes to the `ir` node it stores, expressed over `calldataload` nodes and the values of the previous parts."""
+
+    init, full_round, partial_round = BACKENDS['ir']
+    kinds = ['init'] + [('full' if is_full else 'partial') for _, is_full in round_schedule(ROUNDS_F, ROUNDS_P)]
+    programs = [init()] + [(full_round if kind == 'full' else partial_round)(r) for r, kind in enumerate(kinds[1:])]
+    stores = ir.optimize([block for program in programs for block in program], [MEM[0]])
+
+    slots = {int(a, 16): ir.Node('calldataload', 32 * i) for i, a in enumerate(ARG)}
+    parts = []
+    for kind, block in zip(kinds, stores):
+        substituted = {}
+
+        def substitute(node):
+            if node.op == 'mload':
+                return slots[node.args[0]]
+            if node.op == 'const':
+                return node
+            if node not in substituted:
+                substituted[node] = ir.Node(node.op, *map(substitute, node.args))
+            return substituted[node]
+
+        values = {store.addr: substitute(store.node) for store in block}
+        slots.update(values)
+        parts.append((kind, values))
+    return parts
+
+
+def count_uses(parts):
+    """Return how many times every node is an operand, counting the values of each part as used by the next one
+    and the first element of the last part as used by the return."""
+
+    uses, seen = {}, set()
+
+    def visit(node):
+        if node in seen:
+            return
+        seen.add(node)
+        if node.op not in ('const', 'calldataload'):
+            for arg in node.args:
+                uses[arg] = uses.get(arg, 0) + 1
+                visit(arg)
+
+    for _, values in parts:
+        for node in values.values():
+            visit(node)
+    result = parts[-1][1][int(MEM[0], 16)]
+    uses[result] = uses.get(result, 0) + 1
+    return uses
+
+
+class Scheduler:
+    """Emits the opcodes evaluating `ir` nodes, tracking the content of every stack slot.
+
+    `stack` lists the slots from the bottom: a kept node, `MODULUS`, `TEMPORARY` or `DEAD`. `code` collects opcode
+    names and the integers to push."""
+
+    def __init__(self, uses):
+        self.remaining = dict(uses)
+        self.stack = []
+        self.code = []
+
+    def emit(self, op):
+        pops, pushes = STACK_EFFECTS.get(op, (0, 0))
+        self.code.append(op)
+        del self.stack[len(self.stack) - pops:]
+        self.stack += [TEMPORARY] * pushes
+
+    def push(self, value):
+        self.code.append(value)
+        self.stack.append(TEMPORARY)
+
+    def depth(self, content):
+        """Return the depth of the highest slot holding `content` (1 for the top), `None` if there is none."""
+
+        for d in range(1, len(self.stack) + 1):
+            if self.stack[-d] is content:
+                return d
+        return None
+
+    def operands(self):
+        """Number of operands of the expression being evaluated already on the stack."""
+
+        n = 0
+        while n < len(self.stack) and self.stack[-1 - n] is TEMPORARY:
+            n += 1
+        return n
+
+    def swap(self, d):
+        self.code.append(f'swap{d - 1}')
+        self.stack[-1], self.stack[-d] = self.stack[-d], self.stack[-1]
+
+    def dup(self, d):
+        if d > REACH:
+            raise ValueError(f'stack slot {d} is out of the reach of DUP{REACH}')
+        self.code.append(f'dup{d}')
+        self.stack.append(TEMPORARY)
+
+    def modulus(self):
+        d = self.depth(MODULUS)
+        if d is not None and d <= REACH:
+            self.dup(d)
+        else:
+            self.push(MODULUS)
+
+    def fetch(self, node):
+        """Push the value of a kept node, for one of its uses."""
+
+        d = self.depth(node)
+        self.remaining[node] -= 1
+        last = not self.remaining[node]
+        k = self.operands()
+        if last and k == 0 and d <= REACH + 1:
+            if d > 1:
+                self.swap(d)
+            self.stack[-1] = TEMPORARY
+        elif last and k == 1 and d == 2:
+            self.swap(2)
+            self.stack[-1] = TEMPORARY
+        else:
+            self.dup(d)
+            if last:
+                self.stack[-1 - d] = DEAD
+        self.drop_dead()
+
+    def drop_dead(self):
+        # Dead slots right under the operands being evaluated can be popped only once the operands are used, so
+        # only dead slots on top are dropped here
+        while self.stack and self.stack[-1] is DEAD:
+            self.emit('pop')
+
+    def evaluate(self, node):
+        """Push the value of `node`, computing its operands in place unless they are kept."""
+
+        if self.depth(node) is not None:
+            self.fetch(node)
+        elif node.op == 'const':
+            self.push(node.args[0])
+        elif node.op == 'calldataload':
+            self.push(node.args[0])
+            self.emit('calldataload')
+        else:
+            args = self.order(node.args)
+            if node.op in ('addmod', 'mulmod'):
+                first = args[-1]
+                if self.operands() == 0 and self.consumable(first):
+                    # The last use of a kept value is brought to the top first, the modulus slid under it
+                    self.fetch(first)
+                    self.modulus()
+                    self.swap(2)
+                    args = args[:-1]
+                else:
+                    self.modulus()
+            for arg in reversed(args):
+                self.evaluate(arg)
+            self.emit(node.op)
+
+    def consumable(self, node):
+        d = self.depth(node)
+        return d is not None and self.remaining[node] == 1 and d == 1
+
+    def height(self, node):
+        """Number of stack slots needed to evaluate `node` in place."""
+
+        if self.depth(node) is not None or node.op in ('const', 'calldataload'):
+            return 1
+        pushed = sorted(map(self.height, node.args)) + ([1] if node.op in ('addmod', 'mulmod') else [])
+        return max(j + h for j, h in enumerate(reversed(pushed)))
+
+    def order(self, args):
+        """Order the operands of a commutative operation, the one to push first last: the operand needing the most
+        stack slots goes first, as its slots are free again when the next one is evaluated; between equal ones, a
+        kept value used for the last time goes first, so that it can be moved instead of duplicated, and constants
+        go last."""
+
+        def key(arg):
+            return self.height(arg), self.consumable(arg), arg.op != 'const'
+
+        return sorted(args, key=key)
+
+    def keep(self, node):
+        """Evaluate `node` into a stack slot of its own."""
+
+        self.prepare(node)
+        self.evaluate(node)
+        self.stack[-1] = node
+        self.compact()
+
+    def prepare(self, node):
+        """Keep the nodes used more than once that `node` is computed from, which cannot be evaluated in place."""
+
+        for arg in node.args:
+            if self.depth(arg) is not None or arg.op in ('const', 'calldataload'):
+                continue
+            if self.remaining[arg] > 1:
+                self.keep(arg)
+            else:
+                self.prepare(arg)
+
+    def live(self, d):
+        return self.stack[-d] is not DEAD
+
+    def compact(self):
+        """Remove dead slots above the deepest live value while it is too deep to leave room for operands, and
+        push the modulus again when its slot is out of reach."""
+
+        while True:
+            deepest = max((d for d in range(1, len(self.stack) + 1) if self.live(d)), default=0)
+            if deepest <= REACH - HEADROOM:
+                break
+            dead = [d for d in range(1, deepest) if self.stack[-d] is DEAD]
+            if not dead:
+                break
+            if dead[0] == 1:
+                self.emit('pop')
+            else:
+                self.swap(dead[-1])
+                self.emit('pop')
+        d = self.depth(MODULUS)
+        if d is None or d > MODULUS_DEPTH:
+            if d is not None:
+                self.stack[-d] = DEAD
+            self.push(MODULUS)
+            self.stack[-1] = MODULUS
+
+
+def schedule():
+    """Return the scheduled code of the permutation as `(kind, code, stack)` for every part, `stack` naming the
+    lanes left on the stack after it (from the top), then the scheduler."""
+
+    parts = rounds()
+    scheduler = Scheduler(count_uses(parts))
+    scheduler.push(MODULUS)
+    scheduler.stack[-1] = MODULUS
+    result = []
+    for n, (kind, values) in enumerate(parts):
+        start = len(scheduler.code)
+        for node in values.values():
+            if scheduler.depth(node) is None:
+                scheduler.keep(node)
+        if n == len(parts) - 1:
+            # The result is returned from the top of the stack
+            scheduler.fetch(values[int(MEM[0], 16)])
+        lanes = {node: f's{MEM.index(hex(addr) if addr else "0x00")}' for addr, node in values.items()}
+        lanes[TEMPORARY] = 'hash'
+        stack = [lanes.get(c, c if isinstance(c, str) else '_') for c in reversed(scheduler.stack)]
+        while stack[-1] == DEAD:
+            stack.pop()
+        result.append((kind, scheduler.code[start:], stack))
+    return result, scheduler
+
+
+def epilogue():
+    """Code returning the value on top of the stack."""
+
+    return [0, 'mstore', 0x20, 0, 'return']
+
+
+def push_size(value):
+    return 33 if value == MODULUS else cost.literal_size(value)
+
+
+def assemble(code):
+    """Return the bytecode of a list of opcode names and values to push."""
+
+    out = bytearray()
+    for item in code:
+        if isinstance(item, str) and item != MODULUS:
+            out.append(OPCODES[item])
+            continue
+        value = F if item == MODULUS else item
+        if value == 0:
+            out.append(OPCODES['push0'])
+        else:
+            size = push_size(value) - 1
+            out.append(0x5f + size)
+            out += value.to_bytes(size, 'big')
+    return bytes(out)
+
+
+def gas(code):
+    """Return the execution gas of straight-line code (without the memory expansion)."""
+
+    total = 0
+    for item in code:
+        if item == MODULUS or not isinstance(item, str):
+            total += cost.PUSH_GAS if item else cost.PUSH0_GAS
+        elif item.startswith(('dup', 'swap')):
+            total += cost.DUP_GAS
+        else:
+            total += cost.BUILTIN_GAS[item]
+    return total
+
+
+def creation_code(runtime):
+    """Return the creation bytecode deploying `runtime`."""
+
+    size = len(runtime).to_bytes(2, 'big')
+    # PUSH2 size, DUP1, PUSH1 offset, PUSH0, CODECOPY, PUSH0, RETURN, where the offset of the runtime is the length
+    # of this prefix
+    head, tail = bytes([0x61, *size, 0x80, 0x60]), bytes([0x5f, 0x39, 0x5f, 0xf3])
+    return head + bytes([len(head) + 1 + len(tail)]) + tail + runtime
+
+
+def literal(item):
+    if item == MODULUS:
+        return f'[{MODULUS}]'
+    return hex(item) if not isinstance(item, str) else item
+
+
+def generate_huff():
+    """Return the Huff source of the permutation macro and of a `MAIN` macro hashing the calldata."""
+
+    parts, scheduler = schedule()
+    height = len(scheduler.stack)
+    body = ''
+    r = 0
+    for kind, code, stack in parts:
+        title = 'initial linear layer' if kind == 'init' else f'{kind} round {r}'
+        r += kind != 'init'
+        body += f'\n    // {title}\n'
+        for i in range(0, len(code), 8):
+            body += '    ' + ' '.join(map(literal, code[i:i + 8])) + '\n'
+        body += f'    // [{", ".join(stack)}]\n'
+
+    return f"""/// Poseidon2 over BN254, t=8, x^7, {ROUNDS_F} full and {ROUNDS_P} partial rounds: the `hash(uint256[7])`
+/// of generate_t8.py with the state on the stack. Generated by huff.py.
+
+#define constant {MODULUS} = {hex(F)}
+
+#define macro POSEIDON2_T{T}_HASH() = takes (0) returns ({height}) {{
+    [{MODULUS}]
+{body}}}
+
+#define macro MAIN() = takes (0) returns (0) {{
+    POSEIDON2_T{T}_HASH()
+    {' '.join(map(literal, epilogue()))}
+}}
+"""
+
+
+def code():
+    """Return the opcodes of the runtime code: the permutation and the epilogue."""
+
+    parts, _ = schedule()
+    items = [MODULUS] + [item for _, code, _ in parts for item in code] + epilogue()
+    if max_stack(items) > EVM_STACK_LIMIT:
+        raise ValueError(f'the code needs more than {EVM_STACK_LIMIT} stack slots')
+    return items
+
+
+def runtime_code():
+    return assemble(code())
+
+
+def estimate():
+    """Return the gas per part of the permutation, the total gas of a call (without the transaction and
+    calldata costs) and the size of the runtime code."""
+
+    parts, scheduler = schedule()
+    rounds = {}
+    for kind, part, _ in parts:
+        entry = rounds.setdefault(kind, {'count': 0, 'gas': 0})
+        entry['count'] += 1
+        entry['gas'] += gas(part)
+    for entry in rounds.values():
+        entry['gas_per_part'] = entry['gas'] / entry['count']
+    items = code()
+    return {
+        'parts': rounds,
+        'execution_gas': gas(items),
+        'memory_gas': cost.memory_gas(1),
+        'total_gas': gas(items) + cost.memory_gas(1),
+        'code_size': len(assemble(items)),
+        'max_stack': max_stack(items),
+    }
+
+
+def max_stack(code):
+    """Return the largest number of items on the stack while running straight-line code."""
+
+    height = highest = 0
+    for item in code:
+        if item == MODULUS or not isinstance(item, str):
+            height += 1
+        elif item.startswith('dup'):
+            height += 1
+        elif not item.startswith('swap'):
+            pops, pushes = STACK_EFFECTS.get(item, (2, 0))
+            height += pushes - pops
+        highest = max(highest, height)
+    return highest
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Emit the Poseidon2 t=8 hash as Huff or raw EVM bytecode.')
+    parser.add_argument('--bytecode', choices=('runtime', 'creation'),
+                        help='print the runtime or creation bytecode as hex instead of the Huff source')
+    parser.add_argument('--estimate', action='store_true',
+                        help='print the gas and code size of the generated code as JSON')
+    args = parser.parse_args()
+
+    if args.estimate:
+        import json
+
+        print(json.dumps(estimate(), indent=2))
+    elif args.bytecode == 'runtime':
+        print(runtime_code().hex())
+    elif args.bytecode == 'creation':
+        print(creation_code(runtime_code()).hex())
+    else:
+        print(generate_huff())
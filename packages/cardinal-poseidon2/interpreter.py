@@ -0,0 +1,343 @@
+"""Interpreter for the subset of Yul the generators emit, with a gas profile of every round and helper function.
+
+The `(kind, code)` parts of `utils.generate_parts` are parsed with `yul.parse` and run one after the other in the
+same scope, as they are once joined into the body of `hash`. Every step is charged with the prices of `cost`: the
+builtins, a PUSH per literal, DUP/SWAP/POP for local variables, jumps for control flow and calls, and memory
+expansion as it happens. Unlike `cost.estimate`, the conditions are evaluated and loops run for as many iterations
+as they take, so the profile is that of the actual inputs; for the straight-line `hash` bodies both agree.
+
+The gas of each part is split by function: the inclusive gas (jumps included) of the calls of `fr_intro`, `fr_mm`,
+`mm4`, `sum`... made during the part, and their number. Running the parts also computes the hash, which makes the
+interpreter a differential tester of the generated code against the reference implementations.
+"""
+
+import cost
+from utils import CONSTANTS, MEM_SWP, WORD
+from yul import parse, functions
+
+# Builtins the interpreter runs but `cost` does not price
+BUILTIN_GAS = {**cost.BUILTIN_GAS, 'xor': 3, 'byte': 3, 'sar': 3, 'slt': 3, 'sgt': 3, 'codecopy': 3}
+
+
+class Return(Exception):
+    def __init__(self, data):
+        self.data = data
+
+
+class Revert(Exception):
+    def __init__(self, data):
+        super().__init__(f'reverted with 0x{data.hex()}')
+        self.data = data
+
+
+class _Break(Exception):
+    pass
+
+
+class _Continue(Exception):
+    pass
+
+
+class _Leave(Exception):
+    pass
+
+
+class Interpreter:
+    """Runs parsed statements on a memory and calldata, charging the gas of every step to the current part and to
+    the functions being called."""
+
+    def __init__(self, defined, memory=None, calldata=b'', memory_start=0, code=b''):
+        self.defined = defined
+        self.memory = bytearray()
+        self.calldata = calldata
+        self.code = code
+        self.words = 0
+        self.gas = 0
+        self.expand(memory_start)
+        for address, value in (memory or {}).items():
+            self.write(address, value.to_bytes(32, 'big'))
+        # The memory the caller already paid for and wrote to is not charged
+        self.gas = 0
+        self.calls = []
+        self.functions = {}
+
+    def charge(self, gas):
+        self.gas += gas
+
+    def expand(self, end):
+        words = (end + 31) // 32
+        if words > self.words:
+            self.charge(cost.memory_gas(words) - cost.memory_gas(self.words))
+            self.words = words
+            self.memory.extend(bytes(32 * words - len(self.memory)))
+
+    def read(self, address, size=32):
+        if size:
+            self.expand(address + size)
+        return bytes(self.memory[address:address + size])
+
+    def write(self, address, data):
+        if data:
+            self.expand(address + len(data))
+            self.memory[address:address + len(data)] = data
+
+    def builtin(self, name, args):
+        if name not in BUILTIN_GAS:
+            raise ValueError(f'unsupported builtin {name!r}')
+        self.charge(BUILTIN_GAS[name])
+        a = args[0] if args else None
+        b = args[1] if len(args) > 1 else None
+        if name in ('addmod', 'mulmod'):
+            if not args[2]:
+                return 0
+            return (a + b if name == 'addmod' else a * b) % args[2]
+        if name == 'mload':
+            return int.from_bytes(self.read(a), 'big')
+        if name == 'mstore':
+            self.write(a, b.to_bytes(32, 'big'))
+            return None
+        if name == 'calldataload':
+            return int.from_bytes(self.calldata[a:a + 32].ljust(32, b'\0'), 'big')
+        if name == 'calldatasize':
+            return len(self.calldata)
+        if name == 'codecopy':
+            self.charge(3 * ((args[2] + 31) // 32))
+            self.write(a, self.code[b:b + args[2]].ljust(args[2], b'\0'))
+            return None
+        if name == 'return':
+            raise Return(self.read(a, b))
+        if name == 'revert':
+            raise Revert(self.read(a, b))
+        if name == 'pop':
+            return None
+        return {
+            'add': lambda: (a + b) % WORD,
+            'sub': lambda: (a - b) % WORD,
+            'mul': lambda: a * b % WORD,
+            'div': lambda: a // b if b else 0,
+            'mod': lambda: a % b if b else 0,
+            'lt': lambda: int(a < b),
+            'gt': lambda: int(a > b),
+            'eq': lambda: int(a == b),
+            'iszero': lambda: int(a == 0),
+            'and': lambda: a & b,
+            'or': lambda: a | b,
+            'xor': lambda: a ^ b,
+            'not': lambda: WORD - 1 - a,
+            'shl': lambda: (b << a) % WORD if a < 256 else 0,
+            'shr': lambda: b >> a,
+            'byte': lambda: (b >> (8 * (31 - a))) & 0xff if a < 32 else 0,
+        }[name]()
+
+    def expression(self, e, scopes):
+        if e[0] == 'lit':
+            self.charge(cost.PUSH_GAS if e[1] else cost.PUSH0_GAS)
+            return e[1]
+        if e[0] == 'var':
+            self.charge(cost.DUP_GAS)
+            return lookup(scopes, e[1])[e[1]]
+        name = e[1]
+        # Arguments are evaluated right to left
+        args = [self.expression(a, scopes) for a in reversed(e[2])][::-1]
+        if name in self.defined:
+            values = self.call(self.defined[name], args)
+            return values[0] if len(values) == 1 else values
+        return self.builtin(name, args)
+
+    def call(self, function, args):
+        _, name, params, returns, body = function
+        start = self.gas
+        self.charge(cost.PUSH_GAS + cost.JUMP_GAS + cost.JUMPDEST_GAS + cost.PUSH0_GAS * len(returns)
+                    + cost.body_cleanup(params, returns) + cost.JUMP_GAS + cost.JUMPDEST_GAS)
+        scope = {**dict(zip(params, args)), **dict.fromkeys(returns, 0)}
+        self.calls.append(name)
+        try:
+            self.block(body, [scope])
+        except _Leave:
+            pass
+        finally:
+            self.calls.pop()
+        entry = self.functions.setdefault(name, {'calls': 0, 'gas': 0})
+        entry['calls'] += 1
+        # Inclusive gas, with the jumps of the call, counted once for recursive calls
+        if name not in self.calls:
+            entry['gas'] += self.gas - start
+        return [scope[r] for r in returns]
+
+    def block(self, node, scopes):
+        scopes = [{}] + scopes
+        try:
+            for s in node[1]:
+                self.statement(s, scopes)
+        finally:
+            self.charge(cost.POP_GAS * len(scopes[0]))
+
+    def statement(self, s, scopes):
+        kind = s[0]
+        if kind == 'block':
+            self.block(s, scopes)
+        elif kind == 'function':
+            self.charge(cost.PUSH_GAS + cost.JUMP_GAS + cost.JUMPDEST_GAS)
+        elif kind in ('let', 'assign'):
+            if s[2] is None:
+                self.charge(cost.PUSH0_GAS * len(s[1]))
+                values = [0] * len(s[1])
+            else:
+                values = self.expression(s[2], scopes)
+                values = values if len(s[1]) > 1 else [values]
+            for name, value in zip(s[1], values):
+                if kind == 'let':
+                    scopes[0][name] = value
+                else:
+                    lookup(scopes, name)[name] = value
+            if kind == 'assign':
+                self.charge((cost.SWAP_GAS + cost.POP_GAS) * len(s[1]))
+        elif kind == 'expr':
+            e = s[1]
+            value = self.expression(e, scopes)
+            if e[1] in self.defined:
+                self.charge(cost.POP_GAS * len(self.defined[e[1]][3]))
+            elif value is not None:
+                self.charge(cost.POP_GAS)
+        elif kind == 'if':
+            if self.test(s[1], scopes):
+                self.block(s[2], scopes)
+        elif kind == 'for':
+            self.loop(*s[1:], scopes)
+        else:
+            self.charge(cost.PUSH_GAS + cost.JUMP_GAS)
+            raise {'break': _Break, 'continue': _Continue, 'leave': _Leave}[kind]()
+
+    def test(self, condition, scopes):
+        value = self.expression(condition, scopes)
+        self.charge(BUILTIN_GAS['iszero'] + cost.PUSH_GAS + cost.JUMPI_GAS + cost.JUMPDEST_GAS)
+        return value
+
+    def loop(self, init, condition, post, body, scopes):
+        scopes = [{}] + scopes
+        try:
+            for s in init[1]:
+                self.statement(s, scopes)
+            while self.test(condition, scopes):
+                try:
+                    self.block(body, scopes)
+                except _Break:
+                    break
+                except _Continue:
+                    pass
+                self.charge(cost.JUMPDEST_GAS)
+                self.block(post, scopes)
+                self.charge(cost.PUSH_GAS + cost.JUMP_GAS)
+        finally:
+            self.charge(cost.POP_GAS * len(scopes[0]))
+
+
+def lookup(scopes, name):
+    for scope in scopes:
+        if name in scope:
+            return scope
+    raise NameError(f'undeclared variable {name!r}')
+
+
+def constant_table(table):
+    """Return the `memory` and `variables` of `profile` for generators reading their constants from `table`: the
+    `bytes memory` copy of the table the prologue of `hash` makes above the state slots, and the `CONSTANTS`
+    pointer to it. The copy is paid for by the prologue, so `profile` charges neither its gas nor its memory."""
+
+    address = int(MEM_SWP[-1], 16) + 0x20
+    memory = {address: 32 * len(table), **{address + 32 * (k + 1): c for k, c in enumerate(table)}}
+    return memory, {CONSTANTS: address}
+
+
+def profile(parts, memory=None, calldata=b'', memory_start=0, variables=None, code=b''):
+    """Run the `(kind, code)` parts of `utils.generate_parts` and return their profile.
+
+    `memory` maps addresses to the words written before the assembly runs (the arguments of `hash`), and
+    `memory_start` is the memory already paid for, as for `cost.estimate`. `variables` are the Solidity variables the
+    assembly refers to (e.g. the `CONSTANTS` pointer of the table backend) and `code` the bytes `codecopy` reads.
+
+    The result has the returned data (`None` if the parts end without returning), then for each kind of part the
+    number of parts and their gas (total and per part), for each part its kind, gas and the calls made during it,
+    for each function its number of calls and inclusive gas, and the total execution gas. A revert raises `Revert`."""
+
+    programs = [(kind, parse(code_)) for kind, code_ in parts]
+    defined = {}
+    for _, program in programs:
+        defined.update(functions(program))
+
+    interpreter = Interpreter(defined, memory, calldata, memory_start, code)
+    scopes = [dict(variables or {})]
+    kinds, rounds, output = {}, [], None
+    for kind, program in programs:
+        start, interpreter.functions = interpreter.gas, {}
+        try:
+            for s in program[1]:
+                interpreter.statement(s, scopes)
+        except Return as r:
+            output = r.data
+        gas = interpreter.gas - start
+        rounds.append({'kind': kind, 'gas': gas, 'functions': interpreter.functions})
+        entry = kinds.setdefault(kind, {'count': 0, 'gas': 0})
+        entry['count'] += 1
+        entry['gas'] += gas
+        if output is not None:
+            break
+    for entry in kinds.values():
+        entry['gas_per_part'] = entry['gas'] / entry['count']
+
+    totals = {}
+    for r in rounds:
+        for name, entry in r['functions'].items():
+            total = totals.setdefault(name, {'calls': 0, 'gas': 0})
+            total['calls'] += entry['calls']
+            total['gas'] += entry['gas']
+    return {
+        'output': output,
+        'parts': kinds,
+        'rounds': rounds,
+        'functions': totals,
+        'execution_gas': interpreter.gas,
+    }
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    import random
+
+    import generate_t8
+    from reference import hash7
+    from utils import F, HASH_SIGNATURES, REDUCTIONS, generate_parts
+
+    parser = argparse.ArgumentParser(description='Run the generated t=8 `hash` and print its gas profile as JSON.')
+    parser.add_argument('--backend', choices=generate_t8.BACKENDS, default='memory')
+    parser.add_argument('--reduction', choices=REDUCTIONS, default='lazy',
+                        help='where the stack backend reduces additions modulo the field')
+    parser.add_argument('--partial-rounds', choices=generate_t8.PARTIAL_ROUNDS, default='dense',
+                        help='partial rounds of the memory backend')
+    parser.add_argument('--constants', choices=('inline', 'table'), default='inline',
+                        help='push the round constants inline or read them from a table (memory backend only)')
+    parser.add_argument('--arguments', choices=HASH_SIGNATURES, default='memory',
+                        help='inputs of `hash` decoded to memory by solc or read from the calldata')
+    parser.add_argument('--inputs', type=lambda x: int(x, 0), nargs=generate_t8.T - 1,
+                        help='the 7 inputs (random by default)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random inputs')
+    args = parser.parse_args()
+
+    if args.constants != 'inline' and args.backend != 'memory':
+        parser.error('--constants table requires the memory backend')
+    generators, table = generate_t8.backend_generators(args.backend, args.reduction, args.constants,
+                                                       args.partial_rounds, args.arguments)
+    inputs = args.inputs or [random.Random(args.seed).randrange(F) for _ in range(generate_t8.T - 1)]
+
+    parts = (generate_t8.argument_parts(args.arguments)
+             + generate_parts(*generators, generate_t8.ROUNDS_F, generate_t8.ROUNDS_P, args.backend))
+    # The calldata of `hash`: a selector (left as zeros) and the inputs
+    calldata = bytes(4) + b''.join(x.to_bytes(32, 'big') for x in inputs)
+    memory, variables = constant_table(table) if table is not None else (None, None)
+    result = profile(parts, memory, calldata, generate_t8.MEMORY_START, variables)
+    result['hash'] = hex(int.from_bytes(result.pop('output'), 'big'))
+    result['expected'] = hex(hash7(inputs))
+    print(json.dumps(result, indent=2))
+    if result['hash'] != result['expected']:
+        raise SystemExit('the generated code does not compute the reference hash')
@@ -0,0 +1,296 @@
+"""Expression DAG intermediate representation of the generated permutation, its optimization passes and a Yul
+printer.
+
+The builders mirror the string helpers of `utils.py` (`add`, `addmod`, `mulmod`, `pow`, plus `mload`), but return
+`Node`s. Nodes are interned, so an expression built twice is the same node (common-subexpression elimination), and
+additions of zero constants are folded away as they are built. A program is a list of blocks (the rounds), each a
+`Block` of stores to the memory slots, built in the order the memory backend executes them; values stored in a
+block are forwarded to later loads of the same slot in that block. `optimize` then drops every store nobody reads
+any more (the `MEM_SWP` scratch slots, overwritten or unchanged slots), and `print_yul` emits each block with the
+shared nodes bound to local variables.
+
+Nodes are interned in the table of the innermost `scope`: a program is built and optimized in a scope of its own, so
+that long-running callers do not keep every node they ever built, only the programs they still refer to.
+"""
+
+from contextlib import contextmanager
+
+from utils import F, WORD, addition_chain
+
+# Interning table of the current `scope`
+_nodes = {}
+
+
+@contextmanager
+def scope():
+    """Intern the nodes built inside the `with` block (or the decorated function) in a fresh table, dropped when
+    it exits. Nodes of different scopes are never shared, so a program is built and optimized within one scope."""
+
+    global _nodes
+    outer, _nodes = _nodes, {}
+    try:
+        yield
+    finally:
+        _nodes = outer
+
+
+class Node:
+    """Interned node of the expression DAG: a `const` (with its value), an `mload` (with its address) or an
+    operation on other nodes."""
+
+    __slots__ = ('op', 'args')
+
+    def __new__(cls, op, *args):
+        key = (op, args)
+        node = _nodes.get(key)
+        if node is None:
+            node = _nodes[key] = super().__new__(cls)
+            node.op = op
+            node.args = args
+        return node
+
+    def __repr__(self):
+        return f'{self.op}({", ".join(map(repr, self.args))})'
+
+
+class Store:
+    """`mstore` of the value of `node` into the memory slot `addr`."""
+
+    __slots__ = ('addr', 'node')
+
+    def __init__(self, addr, node):
+        self.addr = addr
+        self.node = node
+
+
+class Block:
+    """Straight-line list of stores, built against a symbolic memory.
+
+    `load` returns the value last stored to the slot in this block (store-to-load forwarding), so the only `mload`
+    nodes of a block read the slots as they were when the block was entered."""
+
+    def __init__(self):
+        self.stores = []
+        self.current = {}
+
+    def load(self, addr):
+        addr = _address(addr)
+        return self.current.get(addr, mload(addr))
+
+    def store(self, addr, node):
+        addr = _address(addr)
+        self.stores.append(Store(addr, _value(node)))
+        self.current[addr] = _value(node)
+
+
+def const(value):
+    return Node('const', value)
+
+
+def _address(addr):
+    return int(addr, 16) if isinstance(addr, str) else addr
+
+
+def mload(addr):
+    return Node('mload', _address(addr))
+
+
+def calldataload(offset):
+    return Node('calldataload', const(_address(offset)))
+
+
+def _value(x):
+    return x if isinstance(x, Node) else const(x)
+
+
+def add(*summands):
+    """Addition without reduction, nested like `utils.add`; zero summands are dropped."""
+
+    summands = [s for s in map(_value, summands) if s is not const(0)]
+    if not summands:
+        return const(0)
+    total = summands[-1]
+    for s in reversed(summands[:-1]):
+        if s.op == 'const' and total.op == 'const' and s.args[0] + total.args[0] < WORD:
+            total = const(s.args[0] + total.args[0])
+        else:
+            total = Node('add', s, total)
+    return total
+
+
+def addmod(a, b):
+    a, b = _value(a), _value(b)
+    if a.op == 'const' and b.op == 'const':
+        return const((a.args[0] + b.args[0]) % F)
+    return Node('addmod', a, b)
+
+
+def mulmod(a, b):
+    a, b = _value(a), _value(b)
+    if a.op == 'const' and b.op == 'const':
+        return const(a.args[0] * b.args[0] % F)
+    if a is const(0) or b is const(0):
+        return const(0)
+    return Node('mulmod', a, b)
+
+
+def pow(alpha, x):
+    """The S-box, with the multiplications of `utils.addition_chain` (the chains of `utils.pow3`/`utils.pow5`/
+    `utils.pow7` for those degrees)."""
+
+    powers = {1: x}
+    for power, a, b in addition_chain(alpha):
+        powers[power] = mulmod(powers[a], powers[b])
+    return powers[alpha]
+
+
+def loads(nodes):
+    """Return the addresses of all the slots read by the expressions `nodes`."""
+
+    seen, stack, addrs = set(), list(nodes), set()
+    while stack:
+        node = stack.pop()
+        if node in seen:
+            continue
+        seen.add(node)
+        if node.op == 'mload':
+            addrs.add(node.args[0])
+        elif node.op != 'const':
+            stack.extend(node.args)
+    return addrs
+
+
+def eliminate_dead_stores(blocks, live_at_exit):
+    """Keep only the last store to each slot of a block, and only if a later block (or the code after the program,
+    reading `live_at_exit`) loads it before overwriting it. Stores writing back the value a slot already had are
+    dropped as well."""
+
+    live = set(map(_address, live_at_exit))
+    result = []
+    for block in reversed(blocks):
+        last = {}
+        for store in block.stores:
+            last[store.addr] = store
+        kept = [s for s in last.values() if s.addr in live and s.node is not mload(s.addr)]
+        live = (live - set(last)) | loads(s.node for s in kept)
+        result.append(kept)
+    return result[::-1]
+
+
+def optimize(blocks, live_at_exit):
+    """Return the stores of each block of the program that survive dead-store elimination."""
+
+    return eliminate_dead_stores(blocks, live_at_exit)
+
+
+def print_yul(blocks):
+    """Return the Yul code of an optimized program (lists of stores), one scoped block per program block.
+
+    Nodes used more than once are evaluated once into a local variable, and loads of a slot are bound to a variable
+    before the slot is overwritten. Variables are reused as soon as the value they hold is dead, so the number of
+    locals is the number of values live at the same time rather than the number of shared nodes."""
+
+    return ''.join(_print_block(block) for block in blocks)
+
+
+def _print_block(stores):
+    uses = {}
+    for store in stores:
+        stack = [store.node]
+        while stack:
+            node = stack.pop()
+            uses[node] = uses.get(node, 0) + 1
+            if uses[node] == 1 and node.op not in ('const', 'mload'):
+                stack.extend(node.args)
+
+    # Schedule the block as ('let', node, expression) and ('store', addr, expression) steps, where the expressions
+    # refer to the shared nodes by the nodes themselves.
+    steps = []
+    named, inlined = set(), set()
+    heights = {}
+
+    def height(node):
+        """Number of stack slots needed to evaluate `node` inline."""
+
+        if node in named or node.op in ('const', 'mload'):
+            return 1
+        if node not in heights:
+            args = sorted(map(height, node.args)) + ([1] if node.op in ('addmod', 'mulmod') else [])
+            heights[node] = max(j + h for j, h in enumerate(reversed(args)))
+        return heights[node]
+
+    def expression(node):
+        if node in named:
+            return node
+        if node.op == 'const':
+            return str(node.args[0])
+        inlined.add(node)
+        if node.op == 'mload':
+            text = f'mload({hex(node.args[0])})'
+        else:
+            # Operands are evaluated right to left: putting the deeper one last keeps the stack shallow
+            args = sorted(node.args, key=height)
+            args = [expression(a) for a in args]
+            if node.op in ('addmod', 'mulmod'):
+                args.append(str(F))
+            text = (f'{node.op}(', *_join(args), ')')
+        if uses[node] > 1:
+            named.add(node)
+            steps.append(('let', node, text))
+            return node
+        return text
+
+    for store in stores:
+        value = expression(store.node)
+        pending = mload(store.addr)
+        if pending in uses and pending not in named and pending not in inlined:
+            named.add(pending)
+            steps.append(('let', pending, f'mload({hex(store.addr)})'))
+        steps.append(('store', store.addr, value))
+
+    # Allocate the variables: a variable is free again after the last step referring to the node it holds.
+    last_use = {}
+    for i, step in enumerate(steps):
+        for node in _references(step[2]):
+            last_use[node] = i
+
+    names, free, declared, lines = {}, [], set(), []
+    for i, (kind, target, text) in enumerate(steps):
+        value = _render(text, names)
+        for node in dict.fromkeys(_references(text)):
+            if last_use[node] == i:
+                free.append(names[node])
+        if kind == 'store':
+            lines.append(f'    mstore({hex(target)}, {value})')
+            continue
+        name = names[target] = free.pop() if free else f'v{len(declared)}'
+        lines.append(f'    {"" if name in declared else "let "}{name} := {value}')
+        declared.add(name)
+        if target not in last_use:
+            free.append(name)
+    return '{\n' + '\n'.join(lines) + '\n}\n'
+
+
+def _join(args):
+    for i, arg in enumerate(args):
+        if i:
+            yield ', '
+        yield arg
+
+
+def _references(text):
+    """Yield the shared nodes an expression of the schedule refers to."""
+
+    if isinstance(text, Node):
+        yield text
+    elif isinstance(text, tuple):
+        for part in text:
+            yield from _references(part)
+
+
+def _render(text, names):
+    if isinstance(text, Node):
+        return names[text]
+    if isinstance(text, tuple):
+        return ''.join(_render(part, names) for part in text)
+    return text
@@ -0,0 +1,78 @@
+"""Scalar kernel of the t=8 permutation, the fast counterpart of `reference.py` for hashing off-chain.
+
+`reference.py` mirrors the generated assembly step by step, reducing modulo the field after most additions. Python
+integers do not overflow, so the kernel reduces far less: the external matrix is evaluated with the additions and
+shifts of `mm4` on unreduced values (its entries are at most 14, the lanes stay below `2^260`) and each lane is
+reduced once, and a partial round takes the sum of the unreduced lanes and reduces each lane once, after its
+multiplication by `D`. The state is held in eight local variables and the rounds are unrolled by `generate_kernel`
+into straight-line Python, compiled once at import, so no list is indexed in the rounds either.
+"""
+
+from utils import F, round_schedule
+from generate_t8 import C, D, T, ALPHA, ROUNDS_F, ROUNDS_P, CAPACITY
+from reference import check_field_elements
+
+LANES = [f'x{i}' for i in range(T)]
+
+
+def external_layer():
+    """Lines computing the external matrix `M` on the lanes with `mm4` and the `fr_mm` sums, one reduction per lane."""
+
+    lines = []
+    for half in (0, 4):
+        a, b, c, d = LANES[half:half + 4]
+        lines += [
+            f't0 = {a} + {b}',
+            f't1 = {c} + {d}',
+            f't2 = ({b} << 1) + t1',
+            f't3 = ({d} << 1) + t0',
+            f't4 = (t1 << 2) + t3',
+            f't5 = (t0 << 2) + t2',
+            f'{a}, {b}, {c}, {d} = t3 + t5, t5, t2 + t4, t4',
+        ]
+    for i in range(4):
+        lo, hi = LANES[i], LANES[i + 4]
+        lines.append(f'{lo}, {hi} = (({lo} << 1) + {hi}) % F, (({hi} << 1) + {lo}) % F')
+    return lines
+
+
+def generate_kernel():
+    """Return the Python source of `permute_lanes(x0, ..., x7)`, the permutation unrolled round by round."""
+
+    lanes = ', '.join(LANES)
+    lines = external_layer()
+    for r, is_full in round_schedule(ROUNDS_F, ROUNDS_P):
+        if is_full:
+            lines += [f'{x} = pow({x} + {C[T * r + i]}, {ALPHA}, F)' for i, x in enumerate(LANES)]
+            lines += external_layer()
+        else:
+            lines.append(f'x0 = pow(x0 + {C[T * r]}, {ALPHA}, F)')
+            lines.append(f"s = {' + '.join(LANES)}")
+            lines.append(f"{lanes} = {', '.join(f'({D[i]} * {x} + s) % F' for i, x in enumerate(LANES))}")
+    body = ''.join(f'    {line}\n' for line in lines)
+    return f'def permute_lanes({lanes}):\n{body}    return {lanes}\n'
+
+
+_namespace = {'F': F}
+exec(compile(generate_kernel(), f'<{__name__}.permute_lanes>', 'exec'), _namespace)
+permute_lanes = _namespace['permute_lanes']
+
+
+def permute(state):
+    """Return the Poseidon2 permutation of a `T`-element state, as `reference.permute` does."""
+
+    check_field_elements(state, T)
+    return list(permute_lanes(*state))
+
+
+def hash7(inputs):
+    """Return the same value as `hash(uint256[7])` of the generated library."""
+
+    check_field_elements(inputs, T - 1)
+    return permute_lanes(*inputs, CAPACITY)[0]
+
+
+if __name__ == '__main__':
+    import sys
+
+    print(hash7([int(a, 0) for a in sys.argv[1:]]))
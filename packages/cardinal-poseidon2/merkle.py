@@ -0,0 +1,145 @@
+"""Merkle trees hashed with the t=8 parameters, built level by level on a process pool.
+
+A node is `hash7` of its children padded with zeros, i.e. exactly what `hash(uint256[7])` of the generated library
+returns, so any root or proof computed here can be checked on-chain. With `arity=7` every slot of the hash carries a
+child; `arity=2` gives a binary tree using the same shape. Only one level is kept in memory while the next one is
+hashed, and each level is streamed to the workers in chunks.
+"""
+
+import os
+from itertools import chain, islice
+from multiprocessing import Pool
+
+from generate_t8 import T
+from kernel import hash7
+
+# Largest number of children that fit into a single `hash(uint256[7])` call
+MAX_ARITY = T - 1
+# Number of parent nodes hashed by a worker per task
+CHUNK_SIZE = 1024
+
+
+def check_arity(arity):
+    """Raise `ValueError` unless `arity` is between 2 and `MAX_ARITY`."""
+
+    if not 2 <= arity <= MAX_ARITY:
+        raise ValueError(f'arity must be between 2 and {MAX_ARITY}, got {arity}')
+
+
+def hash_node(children):
+    """Hash up to `MAX_ARITY` children, padding the missing ones with zeros."""
+
+    return hash7([*children, *[0] * (MAX_ARITY - len(children))])
+
+
+def hash_chunk(nodes, arity):
+    """Hash consecutive groups of `arity` nodes into their parents."""
+
+    return [hash_node(nodes[i:i + arity]) for i in range(0, len(nodes), arity)]
+
+
+def _hash_chunk_task(args):
+    return hash_chunk(*args)
+
+
+def chunks(nodes, arity, chunk_size):
+    """Split an iterable of nodes into lists covering `chunk_size` parents each."""
+
+    nodes = iter(nodes)
+    while chunk := list(islice(nodes, arity * chunk_size)):
+        yield chunk, arity
+
+
+def next_level(nodes, arity, pool=None, chunk_size=CHUNK_SIZE):
+    """Return the parents of an iterable of nodes, hashing the chunks on the pool returned by `pool()` if one is given
+    and the nodes span more than one chunk."""
+
+    tasks = chunks(nodes, arity, chunk_size)
+    head = list(islice(tasks, 2))
+    tasks = chain(head, tasks)
+    results = pool().imap(_hash_chunk_task, tasks) if pool and len(head) > 1 else map(_hash_chunk_task, tasks)
+    return [h for result in results for h in result]
+
+
+def build_levels(leaves, arity=MAX_ARITY, processes=None, chunk_size=CHUNK_SIZE):
+    """Yield every level above the leaves, bottom-up, ending with the single-element root level.
+
+    `leaves` may be any iterable, it is consumed once. Uses `processes` workers (all cores by default); with
+    `processes=1` everything is hashed in the current process. The workers are only started once a level spans more
+    than one chunk, so small trees and the top levels are hashed in the current process either way.
+    """
+
+    check_arity(arity)
+    processes = processes or os.cpu_count()
+    pool = None
+
+    def workers():
+        nonlocal pool
+        pool = pool or Pool(processes)
+        return pool
+
+    lazy_pool = workers if processes > 1 else None
+    try:
+        level = next_level(leaves, arity, lazy_pool, chunk_size)
+        if not level:
+            raise ValueError('cannot build a tree without leaves')
+        yield level
+        while len(level) > 1:
+            level = next_level(level, arity, lazy_pool, chunk_size)
+            yield level
+    finally:
+        if pool:
+            pool.terminate()
+
+
+def merkle_root(leaves, arity=MAX_ARITY, processes=None, chunk_size=CHUNK_SIZE):
+    """Return the root of the tree over `leaves`, keeping at most two levels in memory."""
+
+    for level in build_levels(leaves, arity, processes, chunk_size):
+        pass
+    return level[0]
+
+
+def build_tree(leaves, arity=MAX_ARITY, processes=None, chunk_size=CHUNK_SIZE):
+    """Return all levels of the tree, from the leaves up to the root level."""
+
+    leaves = list(leaves)
+    return [leaves, *build_levels(leaves, arity, processes, chunk_size)]
+
+
+def inclusion_proof(levels, index, arity=MAX_ARITY):
+    """Return the siblings of leaf `index` on every level below the root, as lists of `arity - 1` nodes.
+
+    Missing siblings of an incomplete last group are returned as zeros, which is how `hash_node` pads them.
+    """
+
+    check_arity(arity)
+    if not 0 <= index < len(levels[0]):
+        raise IndexError(f'leaf index {index} out of range')
+
+    proof = []
+    for level in levels[:-1]:
+        start = index - index % arity
+        group = level[start:start + arity]
+        group += [0] * (arity - len(group))
+        del group[index % arity]
+        proof.append(group)
+        index //= arity
+    return proof
+
+
+def root_from_proof(leaf, index, proof, arity=MAX_ARITY):
+    """Return the root implied by `leaf` at position `index` and its inclusion proof."""
+
+    node = leaf
+    for siblings in proof:
+        position = index % arity
+        node = hash_node([*siblings[:position], node, *siblings[position:]])
+        index //= arity
+    return node
+
+
+def verify_proof(leaf, index, proof, root, arity=MAX_ARITY):
+    """Check that `leaf` sits at position `index` of the tree with the given `root`."""
+
+    return root_from_proof(leaf, index, proof, arity) == root
@@ -0,0 +1,108 @@
+"""Poseidon2 instances of any supported width over the BN254 scalar field.
+
+`Parameters` holds the state width, S-box degree, round numbers and constants of an instance, together with the
+matrices they define and a plain matrix-vector reference permutation. The generated code never multiplies by the
+matrices: the external one is applied through the `mm4` decomposition for `t` a multiple of 4, and as `x + sum(x)`
+for `t = 2, 3`, where the matrix is `I + J`; the internal one is `J + diag(D)` for every width.
+"""
+
+from math import gcd
+
+from utils import F, round_schedule, memory_layout
+
+SUPPORTED_WIDTHS = (2, 3, 4, 8, 12, 16)
+# Odd degrees only, x^alpha is never a permutation for an even one; any of them is computed by an addition chain
+SUPPORTED_ALPHAS = tuple(range(3, 32, 2))
+# The 4x4 block of the external matrix, applied by `mm4`
+M4 = [[5, 7, 1, 3],
+      [4, 6, 1, 1],
+      [1, 3, 5, 7],
+      [1, 1, 4, 6]]
+
+
+def external_matrix(t):
+    """Return the external (full round) matrix of width `t`."""
+
+    if t < 4:
+        return [[2 if i == j else 1 for j in range(t)] for i in range(t)]
+    if t == 4:
+        return [row[:] for row in M4]
+    # circ(2 M4, M4, ..., M4)
+    return [[M4[i % 4][j % 4] * (2 if i // 4 == j // 4 else 1) for j in range(t)] for i in range(t)]
+
+
+def internal_diagonal(t):
+    """Return the `D` of the internal matrix `J + diag(D)` the Poseidon2 paper fixes for `t = 2, 3`."""
+
+    return [1] * (t - 1) + [2]
+
+
+class Parameters:
+    """A Poseidon2 instance: state width `t`, S-box `x^alpha`, `rounds_f` full and `rounds_p` partial rounds, the
+    round constants `C` (`t` per round, zero where a round has none) and the diagonal `D` of the internal matrix
+    (fixed by the paper for `t = 2, 3`)."""
+
+    def __init__(self, t, alpha, rounds_f, rounds_p, C, D=None):
+        if t not in SUPPORTED_WIDTHS:
+            raise ValueError(f'unsupported state width {t}, expected one of {SUPPORTED_WIDTHS}')
+        if alpha not in SUPPORTED_ALPHAS or gcd(alpha, F - 1) != 1:
+            raise ValueError(f'x^{alpha} is not a supported permutation of the field')
+        if rounds_f <= 0 or rounds_f % 2 or rounds_p < 0:
+            raise ValueError('the number of full rounds must be positive and even')
+        if D is None and t < 4:
+            D = internal_diagonal(t)
+        if D is None or len(D) != t:
+            raise ValueError(f'expected {t} diagonal entries of the internal matrix')
+        if len(C) != t * (rounds_f + rounds_p):
+            raise ValueError(f'expected {t * (rounds_f + rounds_p)} round constants, got {len(C)}')
+        if not all(0 <= c < F for c in [*C, *D]):
+            raise ValueError('constants must be elements of the field')
+        for r, is_full in round_schedule(rounds_f, rounds_p):
+            if not is_full and any(C[t * r + 1:t * (r + 1)]):
+                raise ValueError(f'partial round {r} has constants on other elements than the first')
+
+        self.t = t
+        self.alpha = alpha
+        self.rounds_f = rounds_f
+        self.rounds_p = rounds_p
+        self.C = list(C)
+        self.D = list(D)
+        self.MEM, self.MEM_SWP, self.ARG = memory_layout(t)
+        # The capacity element of `hash`: the input length shifted left by 64 bits
+        self.capacity = (t - 1) << 64
+
+    def permute(self, state):
+        """Return the permutation of a `t`-element state, computed with the full matrices."""
+
+        if len(state) != self.t or not all(0 <= x < F for x in state):
+            raise ValueError(f'expected {self.t} field elements')
+
+        external = external_matrix(self.t)
+        internal = [[1 + (self.D[i] if i == j else 0) for j in range(self.t)] for i in range(self.t)]
+        state = multiply(external, state)
+        for r, is_full in round_schedule(self.rounds_f, self.rounds_p):
+            constants = self.C[self.t * r:self.t * (r + 1)]
+            state = [(x + c) % F for x, c in zip(state, constants)]
+            if is_full:
+                state = multiply(external, [pow(x, self.alpha, F) for x in state])
+            else:
+                state = multiply(internal, [pow(state[0], self.alpha, F), *state[1:]])
+        return state
+
+    def hash(self, inputs):
+        """Return the same value as `hash(uint256[t - 1])` of the library generated for these parameters."""
+
+        return self.permute([*inputs, self.capacity])[0]
+
+
+def multiply(matrix, vector):
+    return [sum(a * x for a, x in zip(row, vector)) % F for row in matrix]
+
+
+def t8():
+    """Return the parameters of the t=8 instance of `generate_t8.py`."""
+
+    import generate_t8
+
+    return Parameters(generate_t8.T, generate_t8.ALPHA, generate_t8.ROUNDS_F, generate_t8.ROUNDS_P, generate_t8.C,
+                      generate_t8.D)
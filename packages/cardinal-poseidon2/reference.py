@@ -0,0 +1,86 @@
+"""Pure-Python reference implementation of the permutation emitted by `generate_t8.py`.
+
+Every step mirrors the generated assembly (`init`, `fr_intro`, `fr_mm`, `mm4`, `sum` and the partial round), so
+hashes can be computed and checked off-chain without going through the EVM.
+"""
+
+from utils import F, round_schedule
+from generate_t8 import C, D, T, ALPHA, ROUNDS_F, ROUNDS_P, CAPACITY
+
+
+def check_field_elements(values, count):
+    """Raise `ValueError` unless `values` holds exactly `count` elements of the field."""
+
+    if len(values) != count:
+        raise ValueError(f'expected {count} field elements, got {len(values)}')
+    for v in values:
+        if not 0 <= v < F:
+            raise ValueError(f'{v} is not an element of the field')
+
+
+def mm4(a, b, c, d):
+    """Apply the 4x4 block of the external matrix exactly like the generated `mm4` function."""
+
+    t0 = a + b                  #  a +  b
+    t1 = c + d                  #          + c +  d
+    t2 = b + b + t1             #    + 2b  + c +  d
+    t3 = d + d + t0             #  a +  b      + 2d
+    t4 = (4 * t1 + t3) % F      #  a +  b + 4c + 6d
+    t5 = (4 * t0 + t2) % F      # 4a + 6b + c +  d
+    return (t3 + t5) % F, t5, (t2 + t4) % F, t4
+
+
+def fr_mm(state):
+    """Multiply the state by the external matrix `M` in place, using the `mm4` decomposition."""
+
+    state[0:4] = mm4(*state[0:4])
+    state[4:8] = mm4(*state[4:8])
+    for i in range(4):
+        s = state[i] + state[i + 4]
+        state[i] = (state[i] + s) % F
+        state[i + 4] = (state[i + 4] + s) % F
+
+
+def full_round(state, r):
+    """Add the round constants to every lane, apply the S-box to every lane and mix with `fr_mm`."""
+
+    for i in range(T):
+        state[i] = pow(state[i] + C[T * r + i], ALPHA, F)
+    fr_mm(state)
+
+
+def partial_round(state, r):
+    """Apply the S-box to the first lane only and mix with the internal (diagonal plus sum) matrix."""
+
+    state[0] = pow(state[0] + C[T * r], ALPHA, F)
+    s = sum(state) % F
+    for i in range(T):
+        state[i] = (D[i] * state[i] + s) % F
+
+
+def permute(state):
+    """Return the Poseidon2 permutation of a `T`-element state."""
+
+    check_field_elements(state, T)
+    state = list(state)
+
+    fr_mm(state)
+    for r, is_full in round_schedule(ROUNDS_F, ROUNDS_P):
+        if is_full:
+            full_round(state, r)
+        else:
+            partial_round(state, r)
+    return state
+
+
+def hash7(inputs):
+    """Return the same value as `hash(uint256[7])` of the generated library."""
+
+    check_field_elements(inputs, T - 1)
+    return permute([*inputs, CAPACITY])[0]
+
+
+if __name__ == '__main__':
+    import sys
+
+    print(hash7([int(a, 0) for a in sys.argv[1:]]))
@@ -0,0 +1,299 @@
+"""Local hashing service: `hash7` for many processes at once, over a Unix socket or stdin/stdout.
+
+Every frame, in both directions, is a 9-byte header (`FRAME`: a request id, an operation or status byte and the
+payload length) followed by the payload. A `HASH` request carries the 7 inputs as 32-byte big-endian words and is
+answered by the 32-byte hash; a `STATS` request is answered by the JSON of `Metrics.summary`. Answers carry the id of
+their request and may come out of order; an invalid request is answered with `ERROR` and a message. A request longer
+than `MAX_PAYLOAD` is answered with `ERROR` without reading its payload, and the connection is closed.
+
+Concurrent hash requests, from one connection or many, are coalesced by a `Batcher` into batches of up to `max_batch`
+inputs, each hashed once the batch is full or `max_latency` seconds after its first request, in a worker thread so
+that the event loop keeps reading. Batches are hashed by `batch.hash7_batch` when NumPy is installed and by
+`kernel.hash7` otherwise. Answers wait for the client to read the earlier ones, so that a slow client stops the
+service from reading its requests instead of making it buffer their answers. The latency of every hash request, from
+its arrival to its answer, is kept in `Metrics`, whether it succeeded or not.
+"""
+
+import asyncio
+import json
+import struct
+import sys
+import time
+from collections import deque
+
+from generate_t8 import T
+from reference import check_field_elements
+
+FRAME = struct.Struct('>IBI')
+WORD = 32
+MAX_PAYLOAD = (T - 1) * WORD
+# Operations of the requests and statuses of the answers
+HASH, STATS = 0, 1
+OK, ERROR = 0, 1
+MAX_BATCH = 256
+MAX_LATENCY = 0.002
+# Number of latencies kept for the percentiles of `Metrics`
+LATENCY_WINDOW = 10000
+
+
+def hash_batch(rows):
+    """Return `hash7` of every row."""
+
+    if len(rows) > 1:
+        try:
+            from batch import hash7_batch
+        except ImportError:
+            pass
+        else:
+            return [int(h) for h in hash7_batch(rows)]
+    from kernel import hash7
+
+    return [hash7(row) for row in rows]
+
+
+def encode_inputs(inputs):
+    return b''.join(x.to_bytes(WORD, 'big') for x in inputs)
+
+
+def decode_inputs(payload):
+    """Return the 7 inputs of a `HASH` payload, raising `ValueError` unless they are field elements."""
+
+    if len(payload) != MAX_PAYLOAD:
+        raise ValueError(f'expected {MAX_PAYLOAD} bytes of inputs, got {len(payload)}')
+    inputs = [int.from_bytes(payload[i:i + WORD], 'big') for i in range(0, len(payload), WORD)]
+    check_field_elements(inputs, T - 1)
+    return inputs
+
+
+class Metrics:
+    """Counters of the service and the latencies of the last `LATENCY_WINDOW` requests."""
+
+    def __init__(self):
+        self.requests = self.errors = self.batches = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def summary(self):
+        latencies = sorted(self.latencies)
+
+        def percentile(q):
+            return latencies[min(int(q * len(latencies)), len(latencies) - 1)] if latencies else None
+
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'batches': self.batches,
+            'mean_batch': self.requests / self.batches if self.batches else None,
+            'latency_p50': percentile(0.5),
+            'latency_p99': percentile(0.99),
+            'latency_max': latencies[-1] if latencies else None,
+        }
+
+
+class Batcher:
+    """Coalesces single hash requests into batches hashed together."""
+
+    def __init__(self, max_batch=MAX_BATCH, max_latency=MAX_LATENCY, metrics=None):
+        self.max_batch, self.max_latency = max_batch, max_latency
+        self.metrics = metrics or Metrics()
+        self.pending = []
+        self.timer = None
+        # Batches being hashed, referenced until they are done so that the event loop does not drop them
+        self.tasks = set()
+
+    async def hash7(self, inputs):
+        """Return `hash7(inputs)` once the batch holding the request is hashed."""
+
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((inputs, future))
+        if len(self.pending) >= self.max_batch:
+            self.flush()
+        elif self.timer is None:
+            self.timer = asyncio.get_running_loop().call_later(self.max_latency, self.flush)
+        return await future
+
+    def flush(self):
+        """Start hashing the pending requests as one batch."""
+
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.pending:
+            pending, self.pending = self.pending, []
+            task = asyncio.get_running_loop().create_task(self._run(pending))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _run(self, pending):
+        self.metrics.batches += 1
+        self.metrics.requests += len(pending)
+        try:
+            hashes = await asyncio.to_thread(hash_batch, [inputs for inputs, _ in pending])
+        except Exception as e:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), h in zip(pending, hashes):
+            if not future.done():
+                future.set_result(h)
+
+
+async def serve_stream(reader, writer, batcher):
+    """Answer the frames of one connection until it is closed."""
+
+    tasks = set()
+
+    async def answer(request_id, status, payload, arrival=None):
+        """Send an answer once the client has read enough of the earlier ones; `arrival` is that of a hash request,
+        whose latency is recorded."""
+
+        writer.write(FRAME.pack(request_id, status, len(payload)) + payload)
+        if arrival is not None:
+            batcher.metrics.latencies.append(time.perf_counter() - arrival)
+            if status == ERROR:
+                batcher.metrics.errors += 1
+        await writer.drain()
+
+    async def hash_request(request_id, inputs, arrival):
+        try:
+            status, payload = OK, (await batcher.hash7(inputs)).to_bytes(WORD, 'big')
+        except Exception as e:
+            status, payload = ERROR, str(e).encode()
+        try:
+            await answer(request_id, status, payload, arrival)
+        except ConnectionError:
+            # The client is gone; the request is still counted
+            pass
+
+    try:
+        while True:
+            try:
+                header = await reader.readexactly(FRAME.size)
+                arrival = time.perf_counter()
+                request_id, operation, length = FRAME.unpack(header)
+                if length > MAX_PAYLOAD:
+                    await answer(request_id, ERROR,
+                                 f'payload of {length} bytes, at most {MAX_PAYLOAD} allowed'.encode(), arrival)
+                    break
+                payload = await reader.readexactly(length)
+                if operation == STATS:
+                    await answer(request_id, OK, json.dumps(batcher.metrics.summary()).encode())
+                    continue
+                try:
+                    if operation != HASH:
+                        raise ValueError(f'unknown operation {operation}')
+                    inputs = decode_inputs(payload)
+                except ValueError as e:
+                    await answer(request_id, ERROR, str(e).encode(), arrival)
+                    continue
+            except (asyncio.IncompleteReadError, ConnectionError):
+                break
+            task = asyncio.create_task(hash_request(request_id, inputs, arrival))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+    finally:
+        writer.close()
+
+
+async def serve_unix(path, max_batch=MAX_BATCH, max_latency=MAX_LATENCY):
+    """Serve every connection to the Unix socket `path` with a single `Batcher`, until cancelled."""
+
+    batcher = Batcher(max_batch, max_latency)
+    server = await asyncio.start_unix_server(lambda r, w: serve_stream(r, w, batcher), path)
+    async with server:
+        await server.serve_forever()
+
+
+async def serve_stdio(max_batch=MAX_BATCH, max_latency=MAX_LATENCY):
+    """Serve the frames read from stdin, answering on stdout, until stdin is closed."""
+
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin.buffer)
+    transport, protocol = await loop.connect_write_pipe(asyncio.streams.FlowControlMixin, sys.stdout.buffer)
+    writer = asyncio.StreamWriter(transport, protocol, reader, loop)
+    batcher = Batcher(max_batch, max_latency)
+    await serve_stream(reader, writer, batcher)
+    return batcher.metrics
+
+
+class Client:
+    """Client of the service over a Unix socket, matching the answers to the requests by id."""
+
+    def __init__(self, reader, writer):
+        self.reader, self.writer = reader, writer
+        self.next_id = 0
+        self.waiting = {}
+        self.receiver = asyncio.create_task(self._receive())
+
+    @classmethod
+    async def connect(cls, path):
+        return cls(*await asyncio.open_unix_connection(path))
+
+    async def _receive(self):
+        try:
+            while True:
+                request_id, status, length = FRAME.unpack(await self.reader.readexactly(FRAME.size))
+                payload = await self.reader.readexactly(length)
+                future = self.waiting.pop(request_id, None)
+                # Answers to unknown requests, or to requests the caller stopped waiting for, are dropped
+                if future is None or future.done():
+                    continue
+                if status == OK:
+                    future.set_result(payload)
+                else:
+                    future.set_exception(ValueError(payload.decode()))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._fail(ConnectionError('the service closed the connection'))
+
+    def _fail(self, error):
+        """Fail every request still waiting for its answer."""
+
+        waiting, self.waiting = self.waiting, {}
+        for future in waiting.values():
+            if not future.done():
+                future.set_exception(error)
+
+    async def _request(self, operation, payload=b''):
+        if self.receiver.done():
+            raise ConnectionError('the connection to the service is closed')
+        request_id, self.next_id = self.next_id, (self.next_id + 1) % (1 << 32)
+        future = self.waiting[request_id] = asyncio.get_running_loop().create_future()
+        self.writer.write(FRAME.pack(request_id, operation, len(payload)) + payload)
+        return await future
+
+    async def hash7(self, inputs):
+        return int.from_bytes(await self._request(HASH, encode_inputs(inputs)), 'big')
+
+    async def stats(self):
+        return json.loads(await self._request(STATS))
+
+    async def close(self):
+        self._fail(ConnectionError('the client was closed'))
+        self.receiver.cancel()
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Serve t=8 Poseidon2 hashes, coalescing requests into batches.')
+    parser.add_argument('--socket', help='Unix socket to listen on (stdin/stdout by default)')
+    parser.add_argument('--max-batch', type=int, default=MAX_BATCH, help='largest number of hashes in a batch')
+    parser.add_argument('--max-latency', type=float, default=MAX_LATENCY,
+                        help='seconds a request may wait for its batch to fill up')
+    args = parser.parse_args()
+
+    try:
+        if args.socket:
+            asyncio.run(serve_unix(args.socket, args.max_batch, args.max_latency))
+        else:
+            metrics = asyncio.run(serve_stdio(args.max_batch, args.max_latency))
+            print(json.dumps(metrics.summary()), file=sys.stderr)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,76 @@
+"""Sponge construction over the t=8 permutation for inputs of any length.
+
+The rate is the first `T - 1` state elements and the capacity is the last one, initialised with the input length
+shifted left by 64 bits. For 7-tuples this is the `CAPACITY` word the generated `hash` starts from, so
+`sponge_hash` of seven elements equals `hash7`; the generated `sponge(uint256[] calldata)` computes `sponge_hash`.
+Both reject inputs that are not field elements rather than reducing them: `absorb` raises `ValueError` and the
+generated code reverts with `InputNotInField()`.
+"""
+
+from utils import F
+from generate_t8 import T
+from reference import permute, check_field_elements
+
+RATE = T - 1
+
+
+def initial_capacity(length):
+    """Return the capacity element for an input of `length` field elements."""
+
+    return length << 64
+
+
+class Sponge:
+    """Streaming sponge: absorb exactly the declared number of elements in any number of calls, then squeeze."""
+
+    def __init__(self, length):
+        self.length = length
+        self.state = [0] * RATE + [initial_capacity(length)]
+        self.absorbed = 0
+        self.position = 0
+        self.squeezing = False
+
+    def absorb(self, elements):
+        """Add `elements` to the rate part of the state, permuting whenever a full chunk has been absorbed."""
+
+        elements = list(elements)
+        check_field_elements(elements, len(elements))
+        if self.squeezing:
+            raise ValueError('cannot absorb after squeezing')
+        if self.absorbed + len(elements) > self.length:
+            raise ValueError(f'sponge was declared for {self.length} elements')
+
+        for x in elements:
+            if self.position == RATE:
+                self.state = permute(self.state)
+                self.position = 0
+            self.state[self.position] = (self.state[self.position] + x) % F
+            self.position += 1
+        self.absorbed += len(elements)
+        return self
+
+    def squeeze(self, count=1):
+        """Return the next `count` output elements, permuting the state whenever the rate part is exhausted."""
+
+        if not self.squeezing:
+            if self.absorbed != self.length:
+                raise ValueError(f'absorbed {self.absorbed} of the declared {self.length} elements')
+            self.state = permute(self.state)
+            self.position = 0
+            self.squeezing = True
+
+        output = []
+        for _ in range(count):
+            if self.position == RATE:
+                self.state = permute(self.state)
+                self.position = 0
+            output.append(self.state[self.position])
+            self.position += 1
+        return output
+
+
+def sponge_hash(inputs):
+    """Return the same value as `sponge(uint256[])` of the generated library."""
+
+    inputs = list(inputs)
+    return Sponge(len(inputs)).absorb(inputs).squeeze()[0]
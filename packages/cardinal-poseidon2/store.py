@@ -0,0 +1,194 @@
+"""On-disk Merkle trees of `merkle.py`, read through `mmap` without loading them.
+
+A store file is a 32-byte header (`MAGIC`, the arity and the number of leaves) followed by every level of the tree
+from the leaves up to the root, each node a 32-byte big-endian word as `hash(uint256[7])` takes it. The level sizes
+follow from the number of leaves and the arity, so the position of any node is computed rather than looked up, and
+opening a store only maps the file. The `arity` nodes of a group are contiguous, so the siblings of a node on every
+level are one slice of the mapping each, returned by `NodeStore.path` as `memoryview`s without copying (they keep
+the file mapped, even after the store is closed, until they are dropped). Nodes of the upper levels, read by every
+proof, are decoded once and kept in a bounded LRU cache.
+"""
+
+import mmap
+import os
+import struct
+from collections import OrderedDict
+
+from merkle import CHUNK_SIZE, MAX_ARITY, build_levels, check_arity
+
+MAGIC = b'P2T8TREE'
+HEADER = struct.Struct('>8sQQ8x')
+NODE_SIZE = 32
+# Levels below the root whose nodes are cached, and the largest number of cached nodes
+CACHE_LEVELS = 8
+CACHE_SIZE = 1 << 16
+
+
+def level_sizes(leaves, arity):
+    """Return the number of nodes of every level, from the leaves up to the root (above the leaves, as `build_tree`
+    does for a single leaf)."""
+
+    sizes = [leaves, -(-leaves // arity)]
+    while sizes[-1] > 1:
+        sizes.append(-(-sizes[-1] // arity))
+    return sizes
+
+
+def level_offsets(sizes):
+    """Return the byte offset of every level in a store file."""
+
+    offsets, offset = [], HEADER.size
+    for size in sizes:
+        offsets.append(offset)
+        offset += size * NODE_SIZE
+    return offsets
+
+
+def write_store(path, leaves, arity=MAX_ARITY, processes=None, chunk_size=CHUNK_SIZE):
+    """Build the tree over an iterable of leaves with `merkle.build_levels` and write it to `path`, one level at a
+    time. Returns the root."""
+
+    check_arity(arity)
+    count = 0
+    temporary = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(temporary, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, arity, 0))
+
+            def written(leaves):
+                nonlocal count
+                for leaf in leaves:
+                    f.write(leaf.to_bytes(NODE_SIZE, 'big'))
+                    count += 1
+                    yield leaf
+
+            for level in build_levels(written(leaves), arity, processes, chunk_size):
+                f.write(b''.join(node.to_bytes(NODE_SIZE, 'big') for node in level))
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, arity, count))
+    except BaseException:
+        os.remove(temporary)
+        raise
+    # Renamed once complete, so that an interrupted build never leaves a truncated store behind
+    os.replace(temporary, path)
+    return level[0]
+
+
+class NodeStore:
+    """Read-only view of a store file, mapped into memory."""
+
+    def __init__(self, path, cache_levels=CACHE_LEVELS, cache_size=CACHE_SIZE):
+        with open(path, 'rb') as f:
+            self.mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.arity, self.leaves = HEADER.unpack_from(self.mapping)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a tree store')
+        check_arity(self.arity)
+        self.sizes = level_sizes(self.leaves, self.arity)
+        self.offsets = level_offsets(self.sizes)
+        if len(self.mapping) != self.offsets[-1] + NODE_SIZE:
+            raise ValueError(f'{path} is truncated or has trailing data')
+        self.buffer = memoryview(self.mapping)
+        self.cached_from = max(len(self.sizes) - cache_levels, 0)
+        self.cache, self.cache_size = OrderedDict(), cache_size
+
+    def close(self):
+        """Stop reading the store. The file stays mapped while views returned by `path` or `node_bytes` are still
+        referenced, and is unmapped when the last of them is dropped."""
+
+        if self.mapping is None:
+            return
+        self.buffer.release()
+        try:
+            self.mapping.close()
+        except BufferError:
+            # Views of the mapping are alive: dropping it leaves the unmapping to the last of them
+            pass
+        self.mapping = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.leaves
+
+    @property
+    def height(self):
+        """Number of levels above the leaves."""
+
+        return len(self.sizes) - 1
+
+    def _offset(self, level, index):
+        if not 0 <= index < self.sizes[level]:
+            raise IndexError(f'node {index} out of range for level {level}')
+        return self.offsets[level] + index * NODE_SIZE
+
+    def node_bytes(self, level, index):
+        """Return node `index` of `level` as a 32-byte view of the mapping."""
+
+        offset = self._offset(level, index)
+        return self.buffer[offset:offset + NODE_SIZE]
+
+    def node(self, level, index):
+        """Return node `index` of `level`, from the cache for the upper levels."""
+
+        if level < self.cached_from:
+            return int.from_bytes(self.node_bytes(level, index), 'big')
+        key = (level, index)
+        value = self.cache.get(key)
+        if value is None:
+            value = self.cache[key] = int.from_bytes(self.node_bytes(level, index), 'big')
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        else:
+            self.cache.move_to_end(key)
+        return value
+
+    def root(self):
+        return self.node(self.height, 0)
+
+    def path(self, index):
+        """Return the group of leaf `index` and of each of its ancestors below the root, as views of the mapping of
+        `arity` nodes (fewer for the last group of a level), the ancestor included."""
+
+        if not 0 <= index < self.leaves:
+            raise IndexError(f'leaf index {index} out of range')
+        groups = []
+        for level in range(self.height):
+            start = index - index % self.arity
+            end = min(start + self.arity, self.sizes[level])
+            groups.append(self.buffer[self._offset(level, start):self._offset(level, end - 1) + NODE_SIZE])
+            index //= self.arity
+        return groups
+
+    def proof(self, index):
+        """Return the inclusion proof of leaf `index`, as `merkle.inclusion_proof` does."""
+
+        if not 0 <= index < self.leaves:
+            raise IndexError(f'leaf index {index} out of range')
+        proof = []
+        for level in range(self.height):
+            start = index - index % self.arity
+            group = [self.node(level, i) if i < self.sizes[level] else 0 for i in range(start, start + self.arity)]
+            del group[index % self.arity]
+            proof.append(group)
+            index //= self.arity
+        return proof
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Build a tree store from a file of leaves, one integer per line.')
+    parser.add_argument('leaves', help='file of leaves')
+    parser.add_argument('output', help='store file to write')
+    parser.add_argument('--arity', type=int, default=MAX_ARITY, help='children per node')
+    parser.add_argument('--processes', type=int, help='number of worker processes (all the cores by default)')
+    args = parser.parse_args()
+
+    with open(args.leaves) as f:
+        root = write_store(args.output, (int(line, 0) for line in f if line.strip()), args.arity, args.processes)
+    print(hex(root))
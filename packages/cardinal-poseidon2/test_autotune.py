@@ -0,0 +1,53 @@
+from itertools import groupby
+
+import pytest
+
+import autotune
+
+SWEEP = ([4, 8, 12], [5, 7], 8, 48)
+
+
+@pytest.fixture(scope='module')
+def report():
+    return autotune.sweep(*SWEEP, jobs=2)
+
+
+def check_ranking(results, gas):
+    ranked = [r for r in results if 'error' not in r]
+    failed = results[len(ranked):]
+    assert all('error' in r for r in failed)
+    assert [r['variant'] for r in failed] == sorted(r['variant'] for r in failed)
+    for _, group in groupby(ranked, key=lambda r: (r['t'], r['alpha'])):
+        group = list(group)
+        assert [r['rank'] for r in group] == list(range(1, len(group) + 1))
+        assert [gas(r) for r in group] == sorted(gas(r) for r in group)
+    # Every instance comes once, in order
+    instances = [(r['t'], r['alpha']) for r in ranked]
+    assert instances == sorted(instances)
+
+
+def test_report_is_deterministic(report):
+    assert autotune.sweep(*SWEEP, jobs=1) == report
+    assert report['sweep'] == {'widths': [4, 8, 12], 'alphas': [5, 7], 'rounds_f': 8, 'rounds_p': 48, 'calls': None}
+    names = [r['variant'] for r in report['results']]
+    assert len(names) == len(set(names)) == len(autotune.variants(*SWEEP))
+    assert sum(r['generator'] == 'generate_t8' for r in report['results']) == len(autotune.T8_VARIANTS)
+
+
+def test_ranked_by_gas(report):
+    check_ranking(report['results'], lambda r: r['total_gas'])
+
+
+def test_failing_variants_last(report):
+    failed = [r for r in report['results'] if 'error' in r]
+    assert [(r['t'], r['backend']) for r in failed] == [(12, 'ir'), (12, 'ir')]
+    assert all('stack slots' in r['error'] for r in failed)
+    assert autotune.table(report).splitlines()[-2:] == [f"   -  {r['variant']}: {r['error']}" for r in failed]
+
+
+def test_ranked_by_lifetime_cost():
+    report = autotune.sweep([8], [7], 8, 48, calls=10, jobs=2)
+    check_ranking(report['results'], lambda r: r['lifetime_gas'])
+    # With few calls the small table encoding is the cheapest to deploy and run
+    assert report['results'][0]['variant'] == ('generate_t8 t=8 x^7 backend=memory constants=table '
+                                              'partial_rounds=dense')
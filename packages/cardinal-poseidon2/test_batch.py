@@ -0,0 +1,27 @@
+import random
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from batch import hash7_batch, permute_batch
+from reference import hash7, permute
+from utils import F
+
+
+def test_permute_batch_matches_reference():
+    rng = random.Random(2)
+    states = [list(range(8)), [F - 1] * 8] + [[rng.randrange(F) for _ in range(8)] for _ in range(20)]
+    assert [[int(x) for x in row] for row in permute_batch(states)] == [permute(s) for s in states]
+
+
+def test_hash7_batch_matches_reference():
+    rng = random.Random(3)
+    inputs = [[0] * 7, [F - 1] * 7] + [[rng.randrange(F) for _ in range(7)] for _ in range(20)]
+    assert [int(h) for h in hash7_batch(inputs)] == [hash7(x) for x in inputs]
+
+
+@pytest.mark.parametrize('inputs', [[[0] * 6], [[F] + [0] * 6]])
+def test_rejects_invalid_inputs(inputs):
+    with pytest.raises(ValueError):
+        hash7_batch(inputs)
@@ -0,0 +1,37 @@
+import pytest
+
+from bench import TOLERANCE, compare, result
+
+
+def report(**values):
+    """A report with one benchmark per keyword, named after it, of the unit given with its value."""
+
+    return {'benchmarks': {name: result(value, unit) for name, (value, unit) in values.items()}}
+
+
+@pytest.mark.parametrize('unit, worse, better', [('seconds', 1.2, 0.8), ('hashes/s', 0.8, 1.2)])
+def test_directions(unit, worse, better):
+    baseline = report(a=(1.0, unit))
+    assert compare(baseline, report(a=(worse, unit))) == [('a', 1.0, worse, True)]
+    assert compare(baseline, report(a=(better, unit))) == [('a', 1.0, better, False)]
+
+
+def test_threshold():
+    baseline = report(t=(1.0, 'seconds'), r=(100.0, 'leaves/s'))
+    within = 1 + TOLERANCE * 0.9
+    assert compare(baseline, report(t=(within, 'seconds'), r=(100.0 / within, 'leaves/s'))) == []
+    assert compare(baseline, report(t=(1.05, 'seconds')), tolerance=0.01) == [('t', 1.0, 1.05, True)]
+    assert compare(baseline, report(t=(1.5, 'seconds')), tolerance=1) == []
+
+
+def test_exact_values():
+    baseline = report(size=(1000, 'bytes'))
+    # Any change of a size is reported, whatever the tolerance
+    assert compare(baseline, report(size=(1001, 'bytes')), tolerance=1) == [('size', 1000, 1001, True)]
+    assert compare(baseline, report(size=(999, 'bytes')), tolerance=1) == [('size', 1000, 999, False)]
+    assert compare(baseline, report(size=(1000, 'bytes'))) == []
+
+
+def test_missing_benchmarks_are_skipped():
+    baseline = report(old=(1.0, 'seconds'), both=(1.0, 'seconds'))
+    assert compare(baseline, report(new=(9.0, 'seconds'), both=(1.0, 'seconds'))) == []
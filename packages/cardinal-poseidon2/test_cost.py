@@ -0,0 +1,26 @@
+import pytest
+
+import cost
+import generate_t8 as g
+
+
+def encoding(code_size, total_gas):
+    return {'code_size': code_size, 'total_gas': total_gas}
+
+
+def test_choose_constant_encoding():
+    inline, table = encoding(10000, 30000), encoding(2000, 34000)
+    # Deploying the smaller table saves 1.6M gas, paid back by the inline code after 400 hashes
+    assert cost.choose_constant_encoding(inline, table, 0) == 'table'
+    assert cost.choose_constant_encoding(inline, table, 399) == 'table'
+    assert cost.choose_constant_encoding(inline, table, 401) == 'inline'
+    # Code over the limit cannot be deployed, however cheap it is to run
+    assert cost.choose_constant_encoding(encoding(cost.CODE_SIZE_LIMIT + 1, 0), table, 10 ** 9) == 'table'
+
+
+@pytest.mark.parametrize('calls', [0, 10000, 10 ** 9])
+def test_t8_auto_is_table(calls):
+    generators, table = g.table_backend()
+    inline = g.estimate(g.BACKENDS['memory'])
+    assert inline['code_size'] > cost.CODE_SIZE_LIMIT > g.estimate(generators, table=table)['code_size']
+    assert g.constant_encoding('auto', calls)[1] == table
@@ -0,0 +1,58 @@
+import random
+
+import pytest
+
+from frontier import Frontier, zero_hashes
+from merkle import merkle_root, verify_proof
+
+HISTORY = 5
+
+
+def padded_root(leaves, depth, arity):
+    """The root `Frontier` should have: the `merkle_root` of the leaves padded with zeros to `arity ** depth`."""
+
+    return merkle_root(leaves + [0] * (arity ** depth - len(leaves)), arity, processes=1)
+
+
+@pytest.mark.parametrize('batched', [False, True])
+@pytest.mark.parametrize('depth, arity', [(4, 2), (3, 3), (2, 7)])
+def test_matches_padded_tree(depth, arity, batched):
+    if batched:
+        pytest.importorskip('numpy')
+    rng = random.Random(20)
+    leaves = [rng.randrange(1 << 250) for _ in range(arity ** depth)]
+    one, many = Frontier(depth, arity, history=HISTORY), Frontier(depth, arity, history=HISTORY)
+    assert one.root() == many.root() == padded_root([], depth, arity) == zero_hashes(depth, arity)[-1]
+    size = 0
+    while size < len(leaves):
+        appended = leaves[size:size + rng.randint(1, 6)]
+        for leaf in appended:
+            one.append(leaf)
+        many.append_many(appended, batched)
+        size += len(appended)
+        root = padded_root(leaves[:size], depth, arity)
+        assert len(one) == len(many) == size
+        assert one.root() == many.root() == root
+        for index in range(max(size - HISTORY, 0), size):
+            for frontier in (one, many):
+                assert verify_proof(leaves[index], index, frontier.proof(index), root, arity)
+
+
+def test_history():
+    frontier = Frontier(3, 2, history=2)
+    frontier.append_many(range(7))
+    assert verify_proof(5, 5, frontier.proof(5), frontier.root(), 2)
+    with pytest.raises(IndexError):
+        frontier.proof(0)
+    with pytest.raises(IndexError):
+        frontier.proof(7)
+
+
+def test_full_tree():
+    frontier = Frontier(2, 3)
+    frontier.append_many(range(9))
+    with pytest.raises(ValueError):
+        frontier.append(9)
+    with pytest.raises(ValueError):
+        frontier.append_many([9])
+    assert len(frontier) == 9 and frontier.root() == padded_root(list(range(9)), 2, 3)
@@ -0,0 +1,66 @@
+import random
+
+import pytest
+
+import generate
+import grain
+from interpreter import profile
+from parameters import SUPPORTED_WIDTHS, Parameters, t8
+from reference import hash7
+from utils import F, MEMORY_START, argument_copy, generate_parts
+
+ROUNDS_F, ROUNDS_P = 4, 6
+
+
+def parameters(t, alpha=5):
+    return Parameters(t, alpha, ROUNDS_F, ROUNDS_P, *grain.constants(F, t, alpha, ROUNDS_F, ROUNDS_P))
+
+
+def run_hash(params, backend, inputs):
+    parts = [argument_copy(params.ARG), *generate_parts(*generate.BACKENDS[backend](params), params.rounds_f,
+                                                        params.rounds_p, backend)]
+    calldata = bytes(4) + b''.join(x.to_bytes(32, 'big') for x in inputs)
+    result = profile(parts, calldata=calldata, memory_start=MEMORY_START)
+    return int.from_bytes(result['output'], 'big'), result['execution_gas']
+
+
+@pytest.mark.parametrize('backend, t', [('memory', t) for t in SUPPORTED_WIDTHS] + [('ir', t) for t in (2, 3, 4, 8)])
+def test_hash_matches_parameters(backend, t):
+    params = parameters(t)
+    rng = random.Random(10)
+    for inputs in [[0] * (t - 1), [F - 1] * (t - 1), [rng.randrange(F) for _ in range(t - 1)]]:
+        output, gas = run_hash(params, backend, inputs)
+        assert output == params.hash(inputs)
+    assert gas == generate.estimate(params, backend)['total_gas']
+
+
+def test_t8_parameters_match_reference():
+    inputs = [random.Random(8).randrange(F) for _ in range(7)]
+    assert t8().hash(inputs) == hash7(inputs)
+    assert run_hash(t8(), 'memory', inputs)[0] == hash7(inputs)
+
+
+@pytest.mark.parametrize('t, alpha', [(12, 5), (16, 5), (8, 11)])
+def test_ir_stack_limit(t, alpha):
+    with pytest.raises(ValueError, match='use the memory backend'):
+        generate.estimate(parameters(t, alpha), 'ir')
+
+
+def test_parameters_errors():
+    C, D = grain.constants(F, 4, 5, ROUNDS_F, ROUNDS_P)
+    for args, message in [((5, 5, ROUNDS_F, ROUNDS_P, C, D), 'width'),
+                          ((4, 3, ROUNDS_F, ROUNDS_P, C, D), 'permutation'),
+                          ((4, 6, ROUNDS_F, ROUNDS_P, C, D), 'permutation'),
+                          ((4, 5, 3, ROUNDS_P, C, D), 'even'),
+                          ((4, 5, ROUNDS_F, -1, C, D), 'even'),
+                          ((4, 5, ROUNDS_F, ROUNDS_P, C, None), 'diagonal'),
+                          ((4, 5, ROUNDS_F, ROUNDS_P, C, D[:3]), 'diagonal'),
+                          ((4, 5, ROUNDS_F, ROUNDS_P, C[:-1], D), 'round constants'),
+                          ((4, 5, ROUNDS_F, ROUNDS_P, [F] + C[1:], D), 'field'),
+                          ((4, 5, ROUNDS_F, ROUNDS_P, C[:9] + [1] + C[10:], D), 'partial round 2')]:
+        with pytest.raises(ValueError, match=message):
+            Parameters(*args)
+    # The paper fixes the diagonal for the small widths
+    assert Parameters(3, 5, ROUNDS_F, ROUNDS_P, grain.constants(F, 3, 5, ROUNDS_F, ROUNDS_P)[0]).D == [1, 1, 2]
+    with pytest.raises(ValueError, match='field elements'):
+        parameters(4).permute([0, 0, 0, F])
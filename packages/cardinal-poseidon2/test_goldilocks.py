@@ -0,0 +1,41 @@
+import random
+
+import pytest
+
+import generate_goldilocks as g
+from interpreter import Revert, profile
+
+
+def run(entry, memory, alpha):
+    """Run entry point `entry` of the generated library with its arguments in `memory`, and return its output."""
+
+    _, before, after = g.entry_points()[entry]
+    parts = [('before', before), *g.rounds(alpha), ('after', after)]
+    return profile(parts, memory)['output']
+
+
+def words(data):
+    return [int.from_bytes(data[i:i + 32], 'big') for i in range(0, len(data), 32)]
+
+
+@pytest.mark.parametrize('alpha', [5, 7])
+def test_permute_matches_python(alpha):
+    state = [random.Random(alpha).randrange(g.P) for _ in range(g.T)]
+    output = run(0, {int(address, 16): x for address, x in zip(g.MEM, state)}, alpha)
+    assert words(output) == g.permute(state, alpha)
+
+
+@pytest.mark.parametrize('length', [1, 4, g.MAX_INPUTS])
+def test_hash_matches_python(length):
+    inputs = [random.Random(length).randrange(g.P) for _ in range(length)]
+    memory = {int(g.MEM[0], 16): length, **{int(a, 16): x for a, x in zip(g.MEM[1:], inputs)}}
+    assert words(run(1, memory, g.ALPHA)) == [g.hash(inputs)]
+
+
+@pytest.mark.parametrize('inputs', [[], [0] * (g.MAX_INPUTS + 1), [1, g.P]])
+def test_hash_rejects_invalid_inputs(inputs):
+    memory = {int(g.MEM[0], 16): len(inputs), **{int(a, 16): x for a, x in zip(g.MEM[1:], inputs)}}
+    with pytest.raises(Revert):
+        run(1, memory, g.ALPHA)
+    with pytest.raises(ValueError):
+        g.hash(inputs)
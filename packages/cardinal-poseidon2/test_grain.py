@@ -0,0 +1,38 @@
+import itertools
+import json
+
+import pytest
+
+import generate_t8
+from grain import cache_path, cache_key, constants, derive, is_irreducible
+from utils import F
+
+
+def test_derive_matches_t8_constants():
+    C, D = derive(F, generate_t8.T, generate_t8.ALPHA, generate_t8.ROUNDS_F, generate_t8.ROUNDS_P)
+    assert C == generate_t8.C
+    assert D == generate_t8.D
+
+
+def test_is_irreducible():
+    assert is_irreducible([1, 1, 0, 0, 1], 2) and not is_irreducible([1, 0, 1, 0, 1], 2)
+    # There are (5^3 - 5) / 3 monic irreducible cubics over GF(5)
+    assert sum(is_irreducible([a, b, c, 1], 5) for a, b, c in itertools.product(range(5), repeat=3)) == 40
+
+
+def test_cache(tmp_path):
+    args = (F, 8, 7, 8, 48)
+    assert constants(*args, cache_dir=tmp_path) == (generate_t8.C, generate_t8.D)
+    path = cache_path(cache_key(*args), tmp_path)
+    with open(path) as f:
+        assert json.load(f)['key'] == cache_key(*args)
+    # A damaged entry is derived again
+    with open(path, 'w') as f:
+        f.write('{')
+    assert constants(*args, cache_dir=tmp_path) == (generate_t8.C, generate_t8.D)
+
+
+@pytest.mark.parametrize('t, alpha, rounds_f', [(5, 7, 8), (8, 2, 8), (8, 7, 7)])
+def test_rejects_invalid_instances(t, alpha, rounds_f):
+    with pytest.raises(ValueError):
+        derive(F, t, alpha, rounds_f, 48)
@@ -0,0 +1,28 @@
+import random
+
+import pytest
+
+import generate_t8 as g
+from interpreter import profile
+from reference import hash7
+from utils import F, hash_many_assembly
+
+# Offset of the array in the calldata of `hashMany(uint256[7][])`: the selector, the offset and the length
+OFFSET = 0x44
+
+
+def words(data):
+    return [int.from_bytes(data[i:i + 32], 'big') for i in range(0, len(data), 32)]
+
+
+@pytest.mark.parametrize('partial_rounds', g.PARTIAL_ROUNDS)
+@pytest.mark.parametrize('count', [0, 1, 3])
+def test_matches_reference(partial_rounds, count):
+    code = hash_many_assembly(g.define_functions, 'fr_mm()', g.full_round, g.PARTIAL_ROUNDS[partial_rounds], g.T,
+                              g.ROUNDS_F, g.ROUNDS_P)
+    rng = random.Random(12)
+    inputs = [[rng.randrange(F) for _ in range(7)] for _ in range(count - 1)] + [[F - 1] * 7] * (count > 0)
+    calldata = bytes(OFFSET) + b''.join(x.to_bytes(32, 'big') for tuple_ in inputs for x in tuple_)
+    result = profile([('hashMany', code)], calldata=calldata,
+                     variables={'inputs.offset': OFFSET, 'inputs.length': count})
+    assert words(result['output']) == [0x20, count, *(hash7(x) for x in inputs)]
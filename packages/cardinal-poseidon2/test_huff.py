@@ -0,0 +1,81 @@
+import random
+
+import huff
+from reference import hash7
+from utils import F
+
+WORD = 2 ** 256
+
+
+def execute(code, calldata=b''):
+    """Run the opcodes `huff.py` emits and return the data returned by the code and the gas used (without the
+    memory expansion)."""
+
+    pc, stack, memory, gas = 0, [], bytearray(), 0
+
+    def expand(end):
+        memory.extend(bytes(max(end - len(memory), 0)))
+
+    while True:
+        op = code[pc]
+        pc += 1
+        if 0x5f <= op <= 0x7f:
+            size = op - 0x5f
+            stack.append(int.from_bytes(code[pc:pc + size], 'big'))
+            pc += size
+            gas += 3 if size else 2
+        elif 0x80 <= op <= 0x8f:
+            stack.append(stack[-(op - 0x7f)])
+            gas += 3
+        elif 0x90 <= op <= 0x9f:
+            depth = op - 0x8f
+            stack[-1], stack[-1 - depth] = stack[-1 - depth], stack[-1]
+            gas += 3
+        elif op == 0x01:
+            stack.append((stack.pop() + stack.pop()) % WORD)
+            gas += 3
+        elif op in (0x08, 0x09):
+            a, b, n = stack.pop(), stack.pop(), stack.pop()
+            stack.append((a + b if op == 0x08 else a * b) % n)
+            gas += 8
+        elif op == 0x35:
+            offset = stack.pop()
+            stack.append(int.from_bytes(calldata[offset:offset + 32].ljust(32, b'\0'), 'big'))
+            gas += 3
+        elif op == 0x39:
+            destination, offset, size = stack.pop(), stack.pop(), stack.pop()
+            expand(destination + size)
+            memory[destination:destination + size] = code[offset:offset + size].ljust(size, b'\0')
+            gas += 3 + 3 * (-(-size // 32))
+        elif op == 0x50:
+            stack.pop()
+            gas += 2
+        elif op == 0x52:
+            offset, value = stack.pop(), stack.pop()
+            expand(offset + 32)
+            memory[offset:offset + 32] = value.to_bytes(32, 'big')
+            gas += 3
+        elif op == 0xf3:
+            offset, size = stack.pop(), stack.pop()
+            expand(offset + size)
+            return bytes(memory[offset:offset + size]), gas
+        else:
+            raise ValueError(f'unexpected opcode {op:#04x} at {pc - 1}')
+
+
+def test_runtime_hash():
+    code = huff.runtime_code()
+    rng = random.Random(14)
+    for inputs in [list(range(7)), [F - 1] * 7, *([rng.randrange(F) for _ in range(7)] for _ in range(3))]:
+        output, gas = execute(code, b''.join(x.to_bytes(32, 'big') for x in inputs))
+        assert int.from_bytes(output, 'big') == hash7(inputs)
+        assert gas == huff.estimate()['execution_gas']
+
+
+def test_creation_code_deploys_runtime():
+    runtime = huff.runtime_code()
+    deployed, _ = execute(huff.creation_code(runtime))
+    assert deployed == runtime
+    inputs = [1, 2, 3, 4, 5, 6, 7]
+    output, _ = execute(deployed, b''.join(x.to_bytes(32, 'big') for x in inputs))
+    assert int.from_bytes(output, 'big') == hash7(inputs)
@@ -0,0 +1,61 @@
+import random
+
+import pytest
+
+import generate_t8 as g
+from interpreter import constant_table, profile
+from reference import hash7
+from utils import F, generate_parts
+
+VARIANTS = [
+    ('memory', 'lazy', 'dense'),
+    ('memory', 'lazy', 'folded'),
+    ('stack', 'lazy', 'dense'),
+    ('stack', 'eager', 'dense'),
+    ('ir', 'lazy', 'dense'),
+]
+
+
+def calldata(inputs):
+    """The calldata of `hash`: a selector (left as zeros) and the inputs."""
+
+    return bytes(4) + b''.join(x.to_bytes(32, 'big') for x in inputs)
+
+
+@pytest.mark.parametrize('arguments', ['memory', 'calldata'])
+@pytest.mark.parametrize('backend, reduction, partial_rounds', VARIANTS)
+def test_hash_matches_reference(backend, reduction, partial_rounds, arguments):
+    generators, table = g.backend_generators(backend, reduction, partial_rounds=partial_rounds, arguments=arguments)
+    parts = g.argument_parts(arguments) + generate_parts(*generators, g.ROUNDS_F, g.ROUNDS_P, backend)
+    rng = random.Random(19)
+    for inputs in [[0] * 7, [F - 1] * 7, [rng.randrange(F) for _ in range(7)]]:
+        result = profile(parts, calldata=calldata(inputs), memory_start=g.MEMORY_START)
+        assert int.from_bytes(result['output'], 'big') == hash7(inputs)
+    # The code is straight-line, so the static estimate is exact
+    assert result['execution_gas'] == g.estimate(generators, backend, table, arguments)['total_gas']
+
+
+@pytest.mark.parametrize('arguments', ['memory', 'calldata'])
+def test_constant_table(arguments):
+    generators, table = g.backend_generators('memory', constants='table', arguments=arguments)
+    parts = g.argument_parts(arguments) + generate_parts(*generators, g.ROUNDS_F, g.ROUNDS_P)
+    memory, variables = constant_table(table)
+    inputs = [random.Random(25).randrange(F) for _ in range(7)]
+    result = profile(parts, memory, calldata(inputs), g.MEMORY_START, variables)
+    assert int.from_bytes(result['output'], 'big') == hash7(inputs)
+    assert result['parts']['partial']['count'] == g.ROUNDS_P
+    # The copy of the table and its memory are paid before the assembly runs
+    assert result['execution_gas'] == g.estimate(generators, 'memory', table, arguments)['execution_gas']
+
+
+def test_calldata_signature():
+    generators, table = g.backend_generators('stack', arguments='calldata')
+    code = g.generate_code(*generators, g.T, g.ROUNDS_F, g.ROUNDS_P, g.FUNCTION_COMMENT, [], 'stack', table,
+                           'calldata')
+    assert 'function hash(uint256[7] calldata) external pure returns (uint256)' in code
+    assert 'calldataload(0x04)' in code
+
+
+def test_unsupported_builtin():
+    with pytest.raises(ValueError, match='extcodesize'):
+        profile([('init', 'let x := extcodesize(0)')])
@@ -0,0 +1,23 @@
+import generate_t8 as g
+import ir
+from utils import generate_parts
+
+
+def test_nodes_are_interned_within_a_scope():
+    with ir.scope():
+        a = ir.addmod(ir.mload(0x80), ir.const(1))
+        assert ir.addmod(ir.mload(0x80), ir.const(1)) is a
+        assert ir.add(a, ir.const(0)) is a
+    with ir.scope():
+        assert ir.addmod(ir.mload(0x80), ir.const(1)) is not a
+
+
+def test_generation_keeps_no_nodes():
+    before = len(ir._nodes)
+    generate_parts(*g.BACKENDS['ir'], g.ROUNDS_F, g.ROUNDS_P, 'ir')
+    assert len(ir._nodes) == before
+
+
+def test_generated_code_is_deterministic():
+    codes = [generate_parts(*g.BACKENDS['ir'], g.ROUNDS_F, g.ROUNDS_P, 'ir') for _ in range(2)]
+    assert codes[0] == codes[1]
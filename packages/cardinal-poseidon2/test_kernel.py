@@ -0,0 +1,25 @@
+import random
+
+import pytest
+
+import kernel
+import reference
+from utils import F
+
+
+def test_permute_matches_reference():
+    rng = random.Random(23)
+    for state in [[0] * 8, [F - 1] * 8, *([rng.randrange(F) for _ in range(8)] for _ in range(20))]:
+        assert kernel.permute(state) == reference.permute(state)
+
+
+def test_hash7_matches_reference():
+    rng = random.Random(7)
+    for inputs in [[0] * 7, [F - 1] * 7, *([rng.randrange(F) for _ in range(7)] for _ in range(20))]:
+        assert kernel.hash7(inputs) == reference.hash7(inputs)
+
+
+@pytest.mark.parametrize('inputs', [[0] * 6, [F] + [0] * 6])
+def test_rejects_invalid_inputs(inputs):
+    with pytest.raises(ValueError):
+        kernel.hash7(inputs)
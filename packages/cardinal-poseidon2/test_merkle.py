@@ -0,0 +1,94 @@
+import random
+
+import pytest
+
+import generate_t8 as g
+import merkle
+from interpreter import Revert, profile
+from merkle import MAX_ARITY, build_tree, inclusion_proof, merkle_root, verify_proof
+from reference import hash7
+from utils import merkle_assembly, selector
+
+# Offset of the siblings in the calldata of `updateLeaf` (the selector, five head words and the length of the array),
+# used for `verifyPath` as well
+OFFSET = 0xc4
+# Leaves of the trees the generated `verifyPath` and `updateLeaf` are run on
+LEAVES = 20
+
+
+def reference_root(nodes, arity):
+    """The root computed with the reference `hash7`, one group of `arity` children (zero-padded) at a time."""
+
+    while True:
+        nodes = [hash7(nodes[i:i + arity] + [0] * (7 - len(nodes[i:i + arity]))) for i in range(0, len(nodes), arity)]
+        if len(nodes) == 1:
+            return nodes[0]
+
+
+@pytest.mark.parametrize('count, arity', [(1, 7), (2, 2), (7, 7), (8, 7), (60, 7), (33, 3), (100, 2)])
+def test_matches_reference(count, arity):
+    rng = random.Random(3)
+    leaves = [rng.randrange(1 << 250) for _ in range(count)]
+    root = reference_root(leaves, arity)
+    assert merkle_root(iter(leaves), arity, processes=1, chunk_size=3) == root
+    levels = build_tree(leaves, arity, processes=1)
+    assert levels[0] == leaves and levels[-1] == [root]
+    for index in range(count):
+        proof = inclusion_proof(levels, index, arity)
+        assert all(len(siblings) == arity - 1 for siblings in proof)
+        assert verify_proof(leaves[index], index, proof, root, arity)
+        assert not verify_proof(leaves[index] + 1, index, proof, root, arity)
+
+
+def test_process_pool(monkeypatch):
+    leaves = list(range(500))
+    assert merkle_root(leaves, processes=2, chunk_size=4) == merkle_root(leaves, processes=1)
+    # A tree that fits into one chunk is hashed without starting the workers
+    monkeypatch.setattr(merkle, 'Pool', None)
+    assert merkle_root(leaves, processes=2) == merkle_root(leaves, processes=1)
+
+
+@pytest.mark.parametrize('arity', [1, MAX_ARITY + 1])
+def test_rejects_invalid_arity(arity):
+    with pytest.raises(ValueError):
+        merkle_root([1, 2], arity, processes=1)
+
+
+def test_rejects_empty_tree():
+    with pytest.raises(ValueError):
+        merkle_root([], processes=1)
+    with pytest.raises(IndexError):
+        inclusion_proof(build_tree([1], processes=1), 1)
+
+
+def run_routine(code, leaf, proof, index, root, new_leaf=None):
+    """Run the generated `verifyPath` (or `updateLeaf` with `new_leaf`) and return the word it returns."""
+
+    calldata = bytes(OFFSET) + b''.join(x.to_bytes(32, 'big') for siblings in proof for x in siblings)
+    variables = {'leaf': leaf, 'index': index, 'root': root, 'siblings.offset': OFFSET, 'siblings.length': len(proof)}
+    if new_leaf is not None:
+        variables['newLeaf'] = new_leaf
+    return int.from_bytes(profile([('merkle', code)], calldata=calldata, variables=variables)['output'], 'big')
+
+
+@pytest.mark.parametrize('arity', [2, 3, 7])
+def test_generated_routines(arity):
+    verify, update = merkle_assembly(g.define_functions, 'fr_mm()', g.full_round, g.partial_round, g.T, g.ROUNDS_F,
+                                     g.ROUNDS_P, arity)
+    rng = random.Random(13)
+    leaves = [rng.randrange(1 << 250) for _ in range(LEAVES)]
+    levels = build_tree(leaves, arity, processes=1)
+    root = levels[-1][0]
+    for index in (0, arity - 1, LEAVES - 1):
+        proof = inclusion_proof(levels, index, arity)
+        assert run_routine(verify, leaves[index], proof, index, root) == 1
+        assert run_routine(verify, leaves[index] + 1, proof, index, root) == 0
+        assert run_routine(verify, leaves[index], proof, index ^ 1, root) == 0
+        # Digits left over after the last level make the index invalid
+        assert run_routine(verify, leaves[index], proof, index + arity ** len(proof), root) == 0
+
+        updated = leaves[:index] + [12345] + leaves[index + 1:]
+        assert run_routine(update, leaves[index], proof, index, root, 12345) == merkle_root(updated, arity, processes=1)
+        with pytest.raises(Revert) as e:
+            run_routine(update, leaves[index], proof, index, root + 1, 12345)
+        assert e.value.data == selector('InvalidProof()').to_bytes(32, 'big')[:4]
@@ -0,0 +1,75 @@
+import random
+
+import pytest
+
+from generate_t8 import C, D, T, ALPHA, ROUNDS_F, ROUNDS_P, CAPACITY
+from reference import hash7, permute
+from utils import F
+
+# Known answers of `hash7`, pinned so that a change of the reference (or of the constants) does not go unnoticed
+HASH7_VECTORS = [
+    ([0] * 7, 0x2bc02d35e6c2e71d9e04079c3447bf26adc170a3263440c77af46ae7edc1a632),
+    ([1, 2, 3, 4, 5, 6, 7], 0x52de13371e49ea6d8c9e16ff7199279c2317359d919b79f163bff3d5b2deb4b),
+    ([F - 1] * 7, 0xfa737500987ee453521e9648dc8397be027c2fe28a44fe1318b51c635b37d75),
+]
+PERMUTE_VECTOR = (list(range(8)), [
+    0x25bd6b18db8af6d02b96e2d3ad9a0e8c0a3f8fc32a7b90ff5d558b650bdc6e14,
+    0x1782f613fd4605f04abbf319e95a4bf7958a82a91adc48333f9e9f208178b824,
+    0x064d3832f1ab6cb38c3dc851596597876a88d9b43e21635bf1ad53d9cfd2edb5,
+    0x2cdfbf1065af6978aa5a44e1ba2ea31e53516229c7010144fbcb910d087dc379,
+    0x0cb59531a220779f18c229dc3ebf2e1e617be83de30292ed418ef2a508d645d4,
+    0x120eaca85e4c8e27e4effd1ea4c8d6c0c1ee86262d889086ece8294487ddc59e,
+    0x19aa1e72638e9bd26c37708effa390d7e8dcfb6340cd818d2473fdab1cc5700d,
+    0x09cfb67fc60f69d358bb2b8c3666bbbb46f4986f2aaa32c719b99254b7b243ac,
+])
+
+# The 4x4 block of the external matrix of Poseidon2, and the internal matrix `1 + diag(D)`
+M4 = [[5, 7, 1, 3], [4, 6, 1, 1], [1, 3, 5, 7], [1, 1, 4, 6]]
+EXTERNAL = [[M4[i % 4][j % 4] * (2 if i // 4 == j // 4 else 1) for j in range(T)] for i in range(T)]
+INTERNAL = [[1 + (D[i] if i == j else 0) for j in range(T)] for i in range(T)]
+
+
+def multiply(matrix, state):
+    return [sum(m * x for m, x in zip(row, state)) % F for row in matrix]
+
+
+def textbook_permute(state):
+    """The permutation as the Poseidon2 paper states it, with the matrices written out."""
+
+    state = multiply(EXTERNAL, state)
+    for r in range(ROUNDS_F + ROUNDS_P):
+        full = r < ROUNDS_F // 2 or r >= ROUNDS_F // 2 + ROUNDS_P
+        state = [(x + c) % F for x, c in zip(state, C[T * r:T * (r + 1)])]
+        state = [pow(x, ALPHA, F) if full or i == 0 else x for i, x in enumerate(state)]
+        state = multiply(EXTERNAL if full else INTERNAL, state)
+    return state
+
+
+@pytest.mark.parametrize('inputs, expected', HASH7_VECTORS)
+def test_hash7_vectors(inputs, expected):
+    assert hash7(inputs) == expected
+    assert textbook_permute([*inputs, CAPACITY])[0] == expected
+
+
+def test_permute_vector():
+    state, expected = PERMUTE_VECTOR
+    assert permute(state) == expected
+    assert textbook_permute(state) == expected
+
+
+def test_matches_textbook_permutation():
+    rng = random.Random(1)
+    for _ in range(5):
+        state = [rng.randrange(F) for _ in range(T)]
+        assert permute(state) == textbook_permute(state)
+
+
+def test_partial_round_constants_on_first_lane_only():
+    for r in range(ROUNDS_F // 2, ROUNDS_F // 2 + ROUNDS_P):
+        assert not any(C[T * r + 1:T * (r + 1)])
+
+
+@pytest.mark.parametrize('inputs', [[0] * 6, [0] * 8, [F] + [0] * 6, [-1] + [0] * 6])
+def test_rejects_invalid_inputs(inputs):
+    with pytest.raises(ValueError):
+        hash7(inputs)
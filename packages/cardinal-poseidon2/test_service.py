@@ -0,0 +1,181 @@
+import asyncio
+import random
+
+import pytest
+
+import service
+from reference import hash7
+from utils import F
+
+
+def run_service(path, client, **options):
+    """Serve `path` while `client(path)` runs, and return its result."""
+
+    async def main():
+        server = asyncio.create_task(service.serve_unix(str(path), **options))
+        while not path.exists():
+            await asyncio.sleep(0.01)
+        try:
+            return await client(str(path))
+        finally:
+            server.cancel()
+
+    return asyncio.run(main())
+
+
+async def exchange(path, frame):
+    """Send a raw frame and return the answer, and whether the service closed the connection after it."""
+
+    reader, writer = await asyncio.open_unix_connection(path)
+    writer.write(frame)
+    request_id, status, length = service.FRAME.unpack(await reader.readexactly(service.FRAME.size))
+    payload = await reader.readexactly(length)
+    closed = await reader.read() == b''
+    writer.close()
+    return request_id, status, payload, closed
+
+
+def test_round_trip(tmp_path):
+    rng = random.Random(24)
+    inputs = [[rng.randrange(F) for _ in range(7)] for _ in range(50)] + [[0] * 7, [F - 1] * 7]
+
+    async def client(path):
+        c = await service.Client.connect(path)
+        try:
+            return await asyncio.gather(*(c.hash7(x) for x in inputs))
+        finally:
+            await c.close()
+
+    assert run_service(tmp_path / 's', client) == [hash7(x) for x in inputs]
+
+
+def test_coalescing(tmp_path):
+    inputs = [[i, 1, 2, 3, 4, 5, 6] for i in range(20)]
+
+    async def client(path):
+        clients = [await service.Client.connect(path) for _ in range(2)]
+        try:
+            hashes = await asyncio.gather(*(clients[i % 2].hash7(x) for i, x in enumerate(inputs)))
+            return hashes, await clients[0].stats()
+        finally:
+            for c in clients:
+                await c.close()
+
+    hashes, stats = run_service(tmp_path / 's', client, max_batch=8, max_latency=0.5)
+    assert hashes == [hash7(x) for x in inputs]
+    # Two full batches, then the rest once the latency is up
+    assert (stats['requests'], stats['batches'], stats['errors']) == (20, 3, 0)
+
+
+def test_error_frames(tmp_path):
+    async def client(path):
+        c = await service.Client.connect(path)
+        errors = []
+        for operation, payload in ((service.HASH, service.encode_inputs([F] + [0] * 6)),
+                                   (service.HASH, bytes(32)), (9, b'')):
+            try:
+                await c._request(operation, payload)
+            except ValueError as e:
+                errors.append(str(e))
+        stats = await c.stats()
+        await c.close()
+        return errors, stats
+
+    errors, stats = run_service(tmp_path / 'a', client)
+    assert 'field' in errors[0] and 'bytes of inputs' in errors[1] and 'unknown operation' in errors[2]
+    assert stats['errors'] == 3
+
+    # An oversize frame is answered without waiting for its payload, and the connection is closed
+    request_id, status, message, closed = run_service(
+        tmp_path / 'b', lambda path: exchange(path, service.FRAME.pack(3, service.HASH, 1 << 30)))
+    assert (request_id, status, closed) == (3, service.ERROR, True) and b'at most' in message
+
+
+def test_client_drops_unknown_answers():
+    async def main():
+        async def fake_service(reader, writer):
+            request_id, _, length = service.FRAME.unpack(await reader.readexactly(service.FRAME.size))
+            await reader.readexactly(length)
+            writer.write(service.FRAME.pack(request_id + 100, service.OK, 32) + bytes(32))
+            writer.write(service.FRAME.pack(request_id, service.OK, 32) + (5).to_bytes(32, 'big'))
+            await reader.read()
+            writer.close()
+
+        server = await asyncio.start_server(fake_service, '127.0.0.1', 0)
+        c = service.Client(*await asyncio.open_connection(*server.sockets[0].getsockname()[:2]))
+        result = await c.hash7([0] * 7)
+        pending = asyncio.ensure_future(c._request(service.STATS))
+        await asyncio.sleep(0)
+        await c.close()
+        server.close()
+        with pytest.raises(ConnectionError):
+            await pending
+        return result
+
+    assert asyncio.run(main()) == 5
+
+
+class RecordingWriter:
+    """Writer of `serve_stream` recording the answers, and whether each was followed by a `drain`."""
+
+    def __init__(self):
+        self.frames, self.drained, self.closed = [], [], False
+
+    def write(self, data):
+        self.frames.append(service.FRAME.unpack(data[:service.FRAME.size]))
+        self.drained.append(False)
+
+    async def drain(self):
+        self.drained[-1] = True
+
+    def close(self):
+        self.closed = True
+
+
+def serve_frames(frames, batcher):
+    """Run `serve_stream` on `frames` and return the writer it answered on."""
+
+    async def main():
+        reader = asyncio.StreamReader()
+        reader.feed_data(b''.join(frames))
+        reader.feed_eof()
+        writer = RecordingWriter()
+        await service.serve_stream(reader, writer, batcher)
+        return writer
+
+    return asyncio.run(main())
+
+
+def frame(request_id, inputs):
+    payload = service.encode_inputs(inputs)
+    return service.FRAME.pack(request_id, service.HASH, len(payload)) + payload
+
+
+@pytest.mark.parametrize('fail', [False, True])
+def test_answers_are_drained_and_timed(monkeypatch, fail):
+    if fail:
+        def hash_batch(rows):
+            raise ValueError('out of order')
+
+        monkeypatch.setattr(service, 'hash_batch', hash_batch)
+    batcher = service.Batcher(max_batch=2)
+    frames = [frame(0, [1] * 7), frame(1, [F] * 7), frame(2, [2] * 7), service.FRAME.pack(3, service.STATS, 0)]
+    writer = serve_frames(frames, batcher)
+    assert writer.closed and all(writer.drained) and not batcher.tasks
+    assert sorted(request_id for request_id, _, _ in writer.frames) == [0, 1, 2, 3]
+    # Both hash requests are timed and counted, whether their batch failed or not, as is the invalid one
+    assert len(batcher.metrics.latencies) == 3
+    assert (batcher.metrics.requests, batcher.metrics.batches, batcher.metrics.errors) == (2, 1, 3 if fail else 1)
+
+
+def test_batcher_keeps_its_tasks():
+    async def main():
+        batcher = service.Batcher(max_batch=1)
+        request = asyncio.ensure_future(batcher.hash7([0] * 7))
+        await asyncio.sleep(0)
+        running = set(batcher.tasks)
+        return running, await request, batcher.tasks
+
+    running, result, tasks = asyncio.run(main())
+    assert len(running) == 1 and result == hash7([0] * 7) and not tasks
+
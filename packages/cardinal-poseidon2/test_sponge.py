@@ -0,0 +1,50 @@
+import random
+
+import pytest
+
+import generate_t8 as g
+from interpreter import Revert, profile
+from reference import hash7
+from sponge import Sponge, sponge_hash
+from utils import F, selector, sponge_assembly
+
+# Offset of the array in the calldata of `sponge(uint256[])`: the selector, the offset and the length
+OFFSET = 0x44
+
+
+def run_sponge(inputs):
+    """Run the generated `sponge` on `inputs` and return its result."""
+
+    code = sponge_assembly(g.define_functions, 'fr_mm()', g.full_round, g.partial_round, g.T, g.ROUNDS_F, g.ROUNDS_P)
+    calldata = bytes(OFFSET) + b''.join(x.to_bytes(32, 'big') for x in inputs)
+    result = profile([('sponge', code)], calldata=calldata,
+                     variables={'inputs.offset': OFFSET, 'inputs.length': len(inputs)})
+    return int.from_bytes(result['output'], 'big')
+
+
+def test_seven_inputs_match_hash():
+    inputs = [random.Random(4).randrange(F) for _ in range(7)]
+    assert sponge_hash(inputs) == hash7(inputs) == run_sponge(inputs)
+
+
+@pytest.mark.parametrize('length', [0, 1, 6, 8, 14, 15, 30])
+def test_generated_sponge_matches_python(length):
+    inputs = [random.Random(length).randrange(F) for _ in range(length)]
+    assert run_sponge(inputs) == sponge_hash(inputs)
+
+
+def test_streaming_absorb():
+    inputs = list(range(1, 20))
+    assert Sponge(19).absorb(inputs[:5]).absorb(inputs[5:]).squeeze()[0] == sponge_hash(inputs)
+    with pytest.raises(ValueError):
+        Sponge(3).absorb([1, 2, 3, 4])
+
+
+@pytest.mark.parametrize('value', [F, 2 ** 256 - 1])
+def test_inputs_outside_the_field_are_rejected(value):
+    inputs = [1] * 9 + [value]
+    with pytest.raises(ValueError):
+        sponge_hash(inputs)
+    with pytest.raises(Revert) as e:
+        run_sponge(inputs)
+    assert e.value.data == selector('InputNotInField()').to_bytes(32, 'big')[:4]
@@ -0,0 +1,60 @@
+import gc
+import random
+import weakref
+
+import pytest
+
+from merkle import build_tree, inclusion_proof, merkle_root, verify_proof
+from store import HEADER, NodeStore, write_store
+
+
+@pytest.mark.parametrize('count, arity', [(1, 7), (2, 2), (7, 7), (8, 7), (50, 7), (100, 3), (1000, 2)])
+def test_matches_in_memory_tree(tmp_path, count, arity):
+    rng = random.Random(21)
+    leaves = [rng.randrange(1 << 250) for _ in range(count)]
+    levels = build_tree(leaves, arity, processes=1)
+    root = write_store(tmp_path / 'tree', iter(leaves), arity, processes=1)
+    assert root == levels[-1][0] == merkle_root(leaves, arity, processes=1)
+    with NodeStore(tmp_path / 'tree', cache_levels=3, cache_size=5) as store:
+        assert (store.root(), len(store), store.height) == (root, count, len(levels) - 1)
+        for index in rng.sample(range(count), min(count, 20)):
+            proof = store.proof(index)
+            assert proof == inclusion_proof(levels, index, arity)
+            assert verify_proof(leaves[index], index, proof, root, arity)
+            group = store.path(index)[0]
+            position = index % arity * 32
+            assert int.from_bytes(group[position:position + 32], 'big') == leaves[index]
+        with pytest.raises(IndexError):
+            store.proof(count)
+
+
+def test_close_with_live_views(tmp_path):
+    leaves = list(range(1, 50))
+    write_store(tmp_path / 'tree', leaves, 7, processes=1)
+    store = NodeStore(tmp_path / 'tree')
+    path, node = store.path(10), store.node_bytes(0, 3)
+    mapping = weakref.ref(store.mapping)
+    store.close()
+    store.close()
+    # The views still read the file, which is unmapped once they are dropped
+    assert int.from_bytes(path[0][3 * 32:4 * 32], 'big') == leaves[10]
+    assert int.from_bytes(node, 'big') == leaves[3]
+    del path, node
+    gc.collect()
+    assert mapping() is None
+
+    with NodeStore(tmp_path / 'tree') as store:
+        root = store.root()
+    assert store.mapping is None and root == merkle_root(leaves, 7, processes=1)
+
+
+def test_rejects_invalid_files(tmp_path):
+    path = tmp_path / 'tree'
+    write_store(path, range(10), 2, processes=1)
+    data = path.read_bytes()
+    for name, content in (('truncated', data[:-1]), ('trailing', data + bytes(32)),
+                          ('magic', b'NOTATREE' + data[8:]), ('empty', bytes(HEADER.size))):
+        (tmp_path / name).write_bytes(content)
+        with pytest.raises(ValueError):
+            NodeStore(tmp_path / name)
+    assert not list(tmp_path.glob('*.tmp'))
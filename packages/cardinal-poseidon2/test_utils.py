@@ -0,0 +1,41 @@
+import random
+
+import pytest
+
+import utils
+from interpreter import profile
+from parameters import SUPPORTED_ALPHAS
+from utils import F, addition_chain, max_stack_height
+
+# Length of the shortest addition chains of 1 to 31 (OEIS A003313)
+SHORTEST_CHAINS = [0, 1, 2, 2, 3, 3, 4, 3, 4, 4, 5, 4, 5, 5, 5, 4, 5, 5, 6, 5, 6, 6, 6, 5, 6, 6, 6, 6, 7, 6, 7]
+
+
+@pytest.mark.parametrize('alpha', range(2, 32))
+def test_addition_chain(alpha):
+    steps = addition_chain(alpha)
+    assert len(steps) == SHORTEST_CHAINS[alpha - 1]
+    known = {1}
+    for power, a, b in steps:
+        assert a >= b and a in known and b in known and power == a + b
+        known.add(power)
+    assert steps[-1][0] == alpha
+
+
+def test_hand_written_chains():
+    assert [len(addition_chain(alpha)) for alpha in (3, 7, 31)] == [2, 4, 7]
+    assert addition_chain(5) == [(2, 1, 1), (4, 2, 2), (5, 4, 1)]
+    assert addition_chain(7) == [(2, 1, 1), (4, 2, 2), (6, 4, 2), (7, 6, 1)]
+    with pytest.raises(ValueError):
+        addition_chain(1)
+
+
+@pytest.mark.parametrize('alpha', SUPPORTED_ALPHAS)
+def test_sbox_matches_pow(alpha):
+    rng = random.Random(alpha)
+    for x in [0, 1, F - 1, rng.randrange(F)]:
+        for code in (f'{utils.pow(alpha, "x")}\nmstore(0x00, x)', utils.pow_store(alpha, 'x', '0x00')):
+            result = profile([('sbox', f'let x := {x}\n{code}\nreturn(0x00, 0x20)')])
+            assert int.from_bytes(result['output'], 'big') == pow(x, alpha, F)
+    # The powers kept for later are reassigned once they are dead: no chain needs more stack than the x^7 of `pow7`
+    assert max_stack_height(utils.pow_store(alpha, 'x', '0x00')) <= max_stack_height(utils.pow7_store('x', '0x00'))
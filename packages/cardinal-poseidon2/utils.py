@@ -1,3 +1,5 @@
+import re
+
 # BN254/BN256 field modulus
 F = 21888242871839275222246405745257275088548364400416034343698204186575808495617
 
@@ -7,28 +9,56 @@ MEM = ['0x00', '0x20', '0x80', '0xa0', '0xc0', '0xe0', '0x100', '0x120']
 MEM_SWP = ['0x140', '0x160', '0x180', '0x1a0', '0x1c0', '0x1e0', '0x200', '0x220']
 # Memory slot addresses for the function arguments
 ARG = ['0x080', '0x0a0', '0x0c0', '0x0e0', '0x100', '0x120', '0x140']
-
-
-def wrap_into_full_code(assembly_code, T, function_comment):
-    """Wrap the assembly code into a full Solidity contract."""
+# Calldata offsets of the function arguments when `hash` takes them as `calldata`, after the selector
+CALLDATA_ARG = ['0x04', '0x24', '0x44', '0x64', '0x84', '0xa4', '0xc4']
+# Memory paid for when `hash` starts: solc stores the free memory pointer at 0x40 first
+MEMORY_START = 0x60
+# Where `hash` reads its arguments from: decoded into memory by solc, or straight from the calldata
+HASH_SIGNATURES = {
+    'memory': 'hash(uint256[{n}] memory) public pure returns (uint256)',
+    'calldata': 'hash(uint256[{n}] calldata) external pure returns (uint256)',
+}
+# Local variable names for the state in the stack backend
+STACK = ['s0', 's1', 's2', 's3', 's4', 's5', 's6', 's7']
+# Number of stack slots reachable with DUP16/SWAP16
+STACK_LIMIT = 16
+# Exclusive upper bound of a 256-bit word
+WORD = 2 ** 256
+
+
+def wrap_into_function(signature, assembly_code, function_comment='', prologue=''):
+    """Wrap the assembly code into a Solidity function with the given signature, after the Solidity statements of
+    `prologue`."""
 
     return f"""
-pragma solidity 0.8.26;
-library Poseidon2T{T}Assembly {{
     {function_comment}
-    function hash(uint256[{T - 1}] memory) public pure returns (uint256) {{
+    function {signature} {{{prologue}
         assembly {{
 
 {''.join(3 * chr(9) + a + chr(10) for a in assembly_code)}
 
         }}
-    }}
+    }}"""
+
+
+def wrap_into_full_code(assembly_code, T, function_comment, extra_functions=(), declarations='', prologue='',
+                        arguments='memory'):
+    """Wrap the assembly code into a full Solidity contract, followed by any additional (already wrapped)
+    functions. `declarations` go at the top of the library and `prologue` before the assembly block of `hash`, whose
+    signature is the one of `HASH_SIGNATURES` for `arguments`."""
+
+    hash_function = wrap_into_function(HASH_SIGNATURES[arguments].format(n=T - 1), assembly_code, function_comment,
+                                       prologue)
+
+    return f"""
+pragma solidity 0.8.26;
+library Poseidon2T{T}Assembly {{{declarations}{''.join([hash_function, *extra_functions])}
 }}"""
 
 
-def mulmod(a, b):
-    """Return the assembly code for the multiplication of two variables modulo `F`."""
-    return f'mulmod({a}, {b}, {F})'
+def mulmod(a, b, modulus=F):
+    """Return the assembly code for the multiplication of two variables modulo `F` (or another `modulus`)."""
+    return f'mulmod({a}, {b}, {modulus})'
 
 
 def add(*summands):
@@ -40,67 +70,173 @@ def add(*summands):
     return f'add({summands[0]}, {add(*summands[1:])})'
 
 
-def addmod(a, b):
-    """Return the assembly code for the addition of two variables modulo `F`."""
-    return f'addmod({a}, {b}, {F})'
+def addmod(a, b, modulus=F):
+    """Return the assembly code for the addition of two variables modulo `F` (or another `modulus`)."""
+    return f'addmod({a}, {b}, {modulus})'
 
 
-def pow(alpha, var):
-    """Router function for `pow5` and `pow7`."""
-    if alpha == 5:
-        return pow5(var)
+def pow(alpha, var, modulus=F):
+    """Router function for `pow3`, `pow5` and `pow7`, and `pow_chain` for the other degrees."""
+    if alpha == 3:
+        return pow3(var, modulus)
+    elif alpha == 5:
+        return pow5(var, modulus)
     elif alpha == 7:
-        return pow7(var)
+        return pow7(var, modulus)
+    return pow_chain(alpha, var, modulus)
 
 
-def pow_store(alpha, var, at):
-    """Router function for `pow5_store` and `pow7_store`."""
-    if alpha == 5:
-        return pow5_store(var, at)
+def pow_store(alpha, var, at, modulus=F):
+    """Router function for `pow3_store`, `pow5_store` and `pow7_store`, and `pow_chain` for the other degrees."""
+    if alpha == 3:
+        return pow3_store(var, at, modulus)
+    elif alpha == 5:
+        return pow5_store(var, at, modulus)
     elif alpha == 7:
-        return pow7_store(var, at)
+        return pow7_store(var, at, modulus)
+    return pow_chain(alpha, var, modulus, at)
+
+
+def addition_chain(alpha):
+    """Return the multiplications of a shortest addition chain for `alpha`, as `(power, a, b)` triples computing
+    `x^power` as `x^a * x^b` from earlier powers, `a >= b`.
+
+    The chain is found by iterative deepening, trying the largest powers first, so that x^3, x^5 and x^7 get the
+    chains of `pow3`, `pow5` and `pow7`."""
+
+    if alpha < 2:
+        raise ValueError(f'no multiplication needed for x^{alpha}')
+
+    def extend(chain, steps):
+        if chain[-1] == alpha:
+            return chain
+        # Doubling at every remaining step is the fastest growth
+        if steps == 0 or chain[-1] << steps < alpha:
+            return None
+        for power in sorted({a + b for a in chain for b in chain if chain[-1] < a + b <= alpha}, reverse=True):
+            found = extend(chain + [power], steps - 1)
+            if found:
+                return found
+        return None
+
+    steps = 1
+    while not (chain := extend([1], steps)):
+        steps += 1
+    steps = []
+    for i, power in enumerate(chain[1:], 1):
+        a = max(a for a in chain[:i] if power - a in chain[:i])
+        steps.append((power, a, power - a))
+    return steps
+
+
+def pow_chain(alpha, var, modulus=F, at=None):
+    """Return the assembly code for the exponentiation of a variable to the power of `alpha` modulo `F` with the
+    multiplications of `addition_chain`, assigning the result to the variable or storing it in memory at `at`.
+
+    A power used once is computed where it is used, unless its own operands are computed that way; the others are
+    kept in `aux` local variables, reassigned once the power they hold is not read any more, so that the S-box
+    never needs more than a few stack slots."""
+
+    steps = addition_chain(alpha)
+    uses = {}
+    for _, a, b in steps:
+        uses[a] = uses.get(a, 0) + 1
+        uses[b] = uses.get(b, 0) + 1
+
+    # Powers computed where they are used, and the powers kept in variables each emitted step reads
+    inlined, reads = set(), {}
+    for power, a, b in steps:
+        operands = [p for p in (a, b) if p != 1]
+        if power != alpha and uses[power] == 1 and not inlined.intersection(operands):
+            inlined.add(power)
+        reads[power] = [q for p in operands for q in (reads[p] if p in inlined else [p])]
+    emitted = [power for power, _, _ in steps if power not in inlined]
+    last_read = {p: power for power in emitted for p in reads[power]}
+
+    expressions, registers, free, lines = {1: var}, {}, [], []
+    for power, a, b in steps:
+        expressions[power] = mulmod(expressions[a], expressions[b], modulus)
+        if power in inlined:
+            continue
+        if power == alpha:
+            lines.append(f'{var} := {expressions[power]}' if at is None else f'mstore({at}, {expressions[power]})')
+            break
+        free += [registers[p] for p in dict.fromkeys(reads[power]) if last_read[p] == power]
+        register = free.pop(0) if free else f'aux{len(registers)}'
+        lines.append(f'{"" if register in registers.values() else "let "}{register} := {expressions[power]}')
+        registers[power] = register
+        expressions[power] = register
+    return '{\n' + ''.join(f'     {line}\n' for line in lines) + '}'
+
+
+def pow3(var, modulus=F):
+    """Return the assembly code for the exponentiation of a variable to the power of 3 modulo `F`."""
+
+    return f'''{{
+     {var} := {mulmod(mulmod(var, var, modulus), var, modulus)}
+}}'''
+
+
+def pow3_store(var, at, modulus=F):
+    """Return the assembly code for the exponentiation of a variable to the power of 3 modulo `F` and store the
+    result in memory."""
+
+    return f'''{{
+     mstore({at}, {mulmod(mulmod(var, var, modulus), var, modulus)})
+}}'''
 
 
-def pow5(var):
+def pow5(var, modulus=F):
     """Return the assembly code for the exponentiation of a variable to the power of 5 modulo `F`."""
 
     return f'''{{
-     let aux_pow := {mulmod(var, var)}
-     {var} := {mulmod(mulmod('aux_pow', 'aux_pow'), var)}
+     let aux_pow := {mulmod(var, var, modulus)}
+     {var} := {mulmod(mulmod('aux_pow', 'aux_pow', modulus), var, modulus)}
 }}'''
 
 
-def pow5_store(var, at):
+def pow5_store(var, at, modulus=F):
     """Return the assembly code for the exponentiation of a variable to the power of 5 modulo `F` and store the
     result in memory."""
 
     return f'''{{
-     let aux_pow := {mulmod(var, var)}
-     mstore({at}, {mulmod(mulmod('aux_pow', 'aux_pow'), var)})
+     let aux_pow := {mulmod(var, var, modulus)}
+     mstore({at}, {mulmod(mulmod('aux_pow', 'aux_pow', modulus), var, modulus)})
 }}'''
 
 
-def pow7(var):
+def pow7(var, modulus=F):
     """Return the assembly code for the exponentiation of a variable to the power of 7 modulo `F`."""
 
     return f'''{{
-     let var2 := {mulmod(var, var)}
-     let var4 := {mulmod('var2', 'var2')}
-     {var} := {mulmod(mulmod('var4', 'var2'), var)}
+     let var2 := {mulmod(var, var, modulus)}
+     let var4 := {mulmod('var2', 'var2', modulus)}
+     {var} := {mulmod(mulmod('var4', 'var2', modulus), var, modulus)}
 }}'''
 
 
-def pow7_store(var, at):
+def pow7_store(var, at, modulus=F):
     """Return the assembly code for the exponentiation of a variable to the power of 7 modulo `F` and store the
     result in memory."""
 
     return f'''{{
-     let var2 := {mulmod(var, var)}
-     let var4 := {mulmod('var2', 'var2')}
-     mstore({at}, {mulmod(mulmod('var4', 'var2'), var)})
+     let var2 := {mulmod(var, var, modulus)}
+     let var4 := {mulmod('var2', 'var2', modulus)}
+     mstore({at}, {mulmod(mulmod('var4', 'var2', modulus), var, modulus)})
 }}'''
 
 
+def memory_layout(t):
+    """Return the `MEM`, `MEM_SWP` and `ARG` slots for a state of `t` elements, laid out like the t=8 ones: the
+    state in the scratch space and then over the arguments, which are read before they are overwritten, and the
+    swap slots right after the state (never over the free memory pointer and the zero slot)."""
+
+    state = [0x00, 0x20] + [0x80 + 0x20 * i for i in range(t - 2)]
+    swap = [max(state[-1] + 0x20, 0x80) + 0x20 * i for i in range(t)]
+    args = [0x80 + 0x20 * i for i in range(t - 1)]
+    return [hex(a) for a in state], [hex(a) for a in swap], [hex(a) for a in args]
+
+
 # Memory load and store functions
 def load0(swap=False): return f'mload({MEM_SWP[0] if swap else MEM[0]})'
 def load1(swap=False): return f'mload({MEM_SWP[1] if swap else MEM[1]})'
@@ -122,23 +258,474 @@ def store6(val, swap=False): return f'mstore({MEM_SWP[6] if swap else MEM[6]}, {
 def store7(val, swap=False): return f'mstore({MEM_SWP[7] if swap else MEM[7]}, {val})'
 
 
-def generate_code(init, full_round, partial_round, t, full_rounds, partial_rounds, function_comment):
-    """Generate the full assembly code for the Poseidon hash function with given parameters and function generators."""
+class Bounded(str):
+    """Assembly expression annotated with an exclusive upper bound of the value it evaluates to."""
+
+    def __new__(cls, code, bound):
+        expr = super().__new__(cls, code)
+        expr.bound = bound
+        return expr
 
-    code = init()
+
+class ReductionPlanner:
+    """Tracks an exclusive upper bound of every local variable of the generated code to decide where a modular
+    reduction is actually needed.
+
+    An addition is emitted as a plain `add` when the sum provably stays below `headroom` (at most `WORD`, where
+    `add` would overflow), and as an `addmod` otherwise. `mulmod` and `addmod` take operands of any size, so
+    values are only reduced when an addition would not fit. Reductions are modulo `modulus`, `F` by default."""
+
+    def __init__(self, headroom=WORD, modulus=F):
+        self.headroom = headroom
+        self.modulus = modulus
+        self.bounds = {}
+
+    def __getitem__(self, name):
+        return Bounded(name, self.bounds[name])
+
+    def assign(self, name, value, declare=False):
+        """Return the assembly code assigning `value` to the local variable `name`, recording its bound."""
+
+        self.bounds[name] = value.bound
+        return f'{"let " if declare else ""}{name} := {value}'
+
+    def add(self, *summands, limit=None):
+        """Return the sum of the `summands`, reduced only where needed for every partial sum to stay below
+        `headroom` and for the result to stay below `limit`."""
+
+        limit = limit or self.headroom
+        total = summands[-1]
+        for i, summand in enumerate(reversed(summands[:-1])):
+            cap = limit if i == len(summands) - 2 else self.headroom
+            if summand.bound + total.bound - 1 <= cap:
+                total = Bounded(add(summand, total), summand.bound + total.bound - 1)
+            else:
+                total = Bounded(addmod(summand, total, self.modulus), self.modulus)
+        return total
+
+    def mulmod(self, a, b):
+        return Bounded(mulmod(a, b, self.modulus), self.modulus)
+
+    def reduce(self, value):
+        return value if value.bound <= self.modulus else Bounded(f'mod({value}, {self.modulus})', self.modulus)
+
+    @staticmethod
+    def constant(c):
+        return Bounded(str(c), c + 1)
+
+
+# Headroom of the `ReductionPlanner` for each reduction strategy: `eager` reduces every addition, `lazy` only
+# the additions that could overflow 256 bits.
+REDUCTIONS = {'eager': F, 'lazy': WORD}
+
+
+def argument(i, arguments='memory'):
+    """Return the assembly code loading the argument `i` of `hash`, from memory or from the calldata."""
+
+    return f'mload({ARG[i]})' if arguments == 'memory' else f'calldataload({CALLDATA_ARG[i]})'
+
+
+def argument_copy(addresses):
+    """Return the part standing for solc's ABI decoding of the `memory` arguments of `hash` to `addresses`, for
+    `cost.estimate`: a `calldataload` and an `mstore` per word, a lower bound of the decoder's loop."""
+
+    return 'arguments', ''.join(f'mstore({a}, calldataload({hex(4 + 32 * i)}))\n' for i, a in enumerate(addresses))
+
+
+def stack_mm4(a, b, c, d, planner):
+    """Return the assembly code applying the 4x4 block of the external matrix in place to four local variables.
+
+    Same operations as the `mm4` function of the memory backend, scheduled so that only two temporaries are live,
+    with the reductions placed by `planner`."""
+
+    p = planner
+    lines = [p.assign('t0', p.add(p[a], p[b]), declare=True),            #  a +  b
+             p.assign('t1', p.add(p[c], p[d]), declare=True),            #          + c +  d
+             p.assign(b, p.add(p[b], p[b], p['t1'])),                    #    + 2b  + c +  d
+             p.assign(d, p.add(p[d], p[d], p['t0'])),                    #  a +  b      + 2d
+             p.assign('t1', p.add(p['t1'], p['t1'])),                    #           2c + 2d
+             p.assign('t1', p.add(p[d], p.add(p['t1'], p['t1']))),       #  a +  b + 4c + 6d
+             p.assign('t0', p.add(p['t0'], p['t0'])),                    # 2a + 2b
+             p.assign('t0', p.add(p[b], p.add(p['t0'], p['t0']))),       # 4a + 6b + c +  d
+             p.assign(a, p.add(p[d], p['t0'])),
+             p.assign(c, p.add(p[b], p['t1'])),
+             p.assign(b, p['t0']),
+             p.assign(d, p['t1'])]
+    return '{\n' + ''.join(f'    {line}\n' for line in lines) + '}'
+
+
+TOKEN = re.compile(r'0x[0-9a-fA-F]+|\d+|[A-Za-z_$][\w$.]*|:=|->|[{}(),]')
+
+
+def _expression_height(tokens, i):
+    """Return the number of stack slots needed to evaluate the expression starting at `tokens[i]`, and the index
+    right after it. Call arguments are evaluated right to left, each one on top of those already pushed."""
+
+    i += 1
+    if i == len(tokens) or tokens[i] != '(':
+        return 1, i
+
+    i += 1
+    heights = []
+    while tokens[i] != ')':
+        height, i = _expression_height(tokens, i)
+        heights.append(height)
+        if tokens[i] == ',':
+            i += 1
+    return max([1] + [j + h for j, h in enumerate(reversed(heights))]), i + 1
+
+
+def max_stack_height(code):
+    """Return the largest number of stack slots used at once by the assembly code: the variables in scope plus the
+    operands of the expression being evaluated. This is an upper bound, as the compiler may reuse the slots of
+    variables that are no longer used."""
+
+    tokens = TOKEN.findall(re.sub(r'//.*', '', code))
+    frames = [[0]]
+    highest = 0
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token == '{':
+            frames[-1].append(0)
+            i += 1
+        elif token == '}':
+            frames[-1].pop()
+            if not frames[-1]:
+                frames.pop()
+            i += 1
+        elif token == 'function':
+            # Functions only see their own arguments and return variables
+            end = tokens.index('{', i)
+            frames.append([sum(t not in ('(', ')', ',', '->') for t in tokens[i + 2:end])])
+            i = end + 1
+        elif token == 'let':
+            names = [tokens[i + 1]]
+            i += 2
+            while i < len(tokens) and tokens[i] == ',':
+                names.append(tokens[i + 1])
+                i += 2
+            if i < len(tokens) and tokens[i] == ':=':
+                height, i = _expression_height(tokens, i + 1)
+                highest = max(highest, sum(frames[-1]) + height)
+            frames[-1][-1] += len(names)
+            highest = max(highest, sum(frames[-1]))
+        elif i + 1 < len(tokens) and tokens[i + 1] == ':=':
+            height, i = _expression_height(tokens, i + 2)
+            highest = max(highest, sum(frames[-1]) + height)
+        elif i + 1 < len(tokens) and tokens[i + 1] == '(':
+            height, i = _expression_height(tokens, i)
+            highest = max(highest, sum(frames[-1]) + height)
+        else:
+            i += 1
+    return highest
+
+
+def round_schedule(full_rounds, partial_rounds):
+    """Yield `(r, is_full)` for every round: half of the full rounds, then the partial rounds, then the other half."""
 
     partial_rounds_begin = full_rounds // 2
     partial_rounds_end = partial_rounds_begin + partial_rounds
-    final_full_rounds_end = full_rounds + partial_rounds
 
-    for r in range(partial_rounds_begin):
-        code += full_round(r)
-    for r in range(partial_rounds_begin, partial_rounds_end):
-        code += partial_round(r)
-    for r in range(partial_rounds_end, final_full_rounds_end):
-        code += full_round(r)
+    for r in range(full_rounds + partial_rounds):
+        yield r, not partial_rounds_begin <= r < partial_rounds_end
+
+
+def generate_rounds(full_round, partial_round, full_rounds, partial_rounds):
+    """Generate the assembly code of all the rounds, in the order given by `round_schedule` (or the concatenated
+    lists of blocks, for generators building `ir` programs)."""
+
+    code = None
+    for r, is_full in round_schedule(full_rounds, partial_rounds):
+        part = full_round(r) if is_full else partial_round(r)
+        code = part if code is None else code + part
+    return code
+
+
+def round_constants(constants, t, r):
+    """Return the `(lane, constant)` pairs of round `r` whose constant is not zero. Adding the others is a no-op."""
+
+    return [(i, c) for i, c in enumerate(constants[t * r:t * r + t]) if c]
+
+
+def constant_table(constants, t, full_rounds, partial_rounds):
+    """Return the nonzero round constants in the order the rounds use them, and the index in that table of the
+    first constant of every round."""
+
+    table, offsets = [], []
+    for r, _ in round_schedule(full_rounds, partial_rounds):
+        offsets.append(len(table))
+        table += [c for _, c in round_constants(constants, t, r)]
+    return table, offsets
+
+
+def pack_constants(values):
+    """Return the values as one big-endian 32-byte word each, in the hex form of a Solidity `hex"..."` literal."""
+
+    return ''.join(f'{v:064x}' for v in values)
+
+
+# Name of the `bytes constant` holding the packed round constants, and of the local it is copied to
+CONSTANT_TABLE = 'ROUND_CONSTANTS'
+CONSTANTS = 'constants'
+
+
+def generate_parts(init, full_round, partial_round, full_rounds, partial_rounds, backend='memory'):
+    """Return the assembly code of `hash` as `(kind, code)` pairs: `'init'`, one `'full'` or `'partial'` pair per
+    round in the order of `round_schedule`, then `'return'`. Joined, they are the body `generate_code` wraps."""
+
+    kinds = [('full' if is_full else 'partial') for _, is_full in round_schedule(full_rounds, partial_rounds)]
+    if backend == 'ir':
+        import ir
+
+        # The generators return lists of blocks, optimized as a whole and printed back round by round
+        with ir.scope():
+            programs = [init()] + [full_round(r) if kind == 'full' else partial_round(r)
+                                   for r, kind in enumerate(kinds)]
+            stores = ir.optimize([block for program in programs for block in program], [int(MEM[0], 16)])
+            codes = []
+            for program in programs:
+                codes.append(ir.print_yul(stores[:len(program)]))
+                stores = stores[len(program):]
+    else:
+        codes = [init()] + [full_round(r) if kind == 'full' else partial_round(r) for r, kind in enumerate(kinds)]
+
+    if backend in ('stack', 'ir'):
+        height = max_stack_height(''.join(codes))
+        if height > STACK_LIMIT:
+            raise ValueError(f'the {backend} backend needs {height} stack slots for these parameters, only '
+                             f'{STACK_LIMIT} are reachable: use the memory backend')
 
     # We assume that the result is stored in the first memory slot.
-    code += f'return({MEM[0]}, 0x20)'
+    epilogue = f'mstore({MEM[0]}, {STACK[0]})\n' if backend == 'stack' else ''
+    epilogue += f'return({MEM[0]}, 0x20)'
+    return [('init', codes[0]), *zip(kinds, codes[1:]), ('return', epilogue)]
+
+
+def generate_code(init, full_round, partial_round, t, full_rounds, partial_rounds, function_comment,
+                  extra_functions=(), backend='memory', table=None, arguments='memory'):
+    """Generate the full assembly code for the Poseidon hash function with given parameters and function generators.
+
+    With `backend='stack'` the generators keep the state in the `STACK` local variables instead of the `MEM` slots;
+    the code is then checked against `STACK_LIMIT` and the first element is stored to memory only to be returned.
+    With `backend='ir'` the generators build blocks of the `ir` module, which are optimized and printed at once.
+    With a `table` of constants, they are packed into a `bytes constant` that `hash` copies to memory first, where
+    the generators find it through the `CONSTANTS` pointer. With `arguments='calldata'`, `hash` takes its inputs as
+    `calldata` and `init` has to read them with `calldataload`."""
+
+    code = ''.join(part for _, part in generate_parts(init, full_round, partial_round, full_rounds, partial_rounds,
+                                                      backend))
+
+    declarations = prologue = ''
+    if table is not None:
+        declarations = f'''
+    bytes constant {CONSTANT_TABLE} = hex"{pack_constants(table)}";
+'''
+        # Move the free memory pointer above the state slots, so that the table is not overwritten by the rounds
+        prologue = f'''
+        assembly {{ mstore(0x40, {hex(int(MEM_SWP[-1], 16) + 0x20)}) }}
+        bytes memory {CONSTANTS} = {CONSTANT_TABLE};'''
+
+    return wrap_into_full_code(code.split('\n'), t, function_comment, extra_functions, declarations, prologue,
+                               arguments)
+
+
+def permutation_function(define_functions, linear_layer, full_round, partial_round, full_rounds, partial_rounds):
+    """Return the helper functions and a Yul `permute()` function applying the linear layer and all the rounds to the
+    state in the `MEM` slots, for the entry points that permute more than once."""
+
+    return f'''    {define_functions()}
+
+    function permute() {{
+        {linear_layer}
+        {generate_rounds(full_round, partial_round, full_rounds, partial_rounds)}
+    }}'''
+
+
+def keccak256(data):
+    """Return the Keccak-256 digest of `data` (requires eth-hash, see `requirements.txt`)."""
+
+    from eth_hash.auto import keccak
+
+    return keccak(data)
+
+
+def selector(error):
+    """Return the selector of a custom error, as the word `revert` returns first."""
+
+    return int.from_bytes(keccak256(error.encode())[:4], 'big') << 224
+
+
+def sponge_assembly(define_functions, linear_layer, full_round, partial_round, t, full_rounds, partial_rounds):
+    """Return the assembly code of `sponge(uint256[] calldata inputs)`.
+
+    The rate is `t - 1` and the capacity is the last state element, initialised with the input length shifted left
+    by 64 bits (for `t - 1` inputs this is exactly the state `hash` starts from). The inputs are added to the rate
+    part of the state chunk by chunk, with a permutation after every chunk; a missing tail is padded with zeros.
+    Like `sponge.Sponge`, it rejects inputs that are not field elements, reverting with `InputNotInField()`."""
 
-    return wrap_into_full_code(code.split('\n'), t, function_comment)
+    rate = t - 1
+    absorb = ''
+    for i in range(rate):
+        at = add('ptr', hex(32 * i)) if i else 'ptr'
+        absorb += f'        if lt({at}, end) {{ mstore({MEM[i]}, {addmod(f"mload({MEM[i]})", f"input({at})")}) }}\n'
+
+    return f'''
+{permutation_function(define_functions, linear_layer, full_round, partial_round, full_rounds, partial_rounds)}
+
+    function input(at) -> x {{
+        x := calldataload(at)
+        if iszero(lt(x, {F})) {{
+            mstore(0, {hex(selector('InputNotInField()'))})
+            revert(0, 4)
+        }}
+    }}
+
+    {(chr(10) + 4 * ' ').join(f'mstore({MEM[i]}, 0)' for i in range(rate))}
+    mstore({MEM[rate]}, shl(64, inputs.length))
+
+    let ptr := inputs.offset
+    let end := add(ptr, shl(5, inputs.length))
+    for {{ }} 1 {{ }} {{
+{absorb}
+        permute()
+        ptr := add(ptr, {hex(32 * rate)})
+        if iszero(lt(ptr, end)) {{ break }}
+    }}
+    return({MEM[0]}, 0x20)
+'''
+
+
+def generate_sponge(define_functions, linear_layer, full_round, partial_round, t, full_rounds, partial_rounds,
+                    function_comment):
+    """Generate a `sponge(uint256[] calldata)` function hashing inputs of any length, see `sponge_assembly`."""
+
+    code = sponge_assembly(define_functions, linear_layer, full_round, partial_round, t, full_rounds, partial_rounds)
+    return '''
+
+    error InputNotInField();
+''' + wrap_into_function('sponge(uint256[] calldata inputs) public pure returns (uint256)', code.split('\n'),
+                         function_comment)
+
+
+def hash_many_assembly(define_functions, linear_layer, full_round, partial_round, t, full_rounds, partial_rounds):
+    """Return the assembly code of `hashMany(uint256[t - 1][] calldata inputs)`, returning the `hash` of every tuple.
+
+    The permutation is emitted once, as a Yul function run for every tuple on the same `MEM` slots `hash` uses, and
+    the results are written one after the other above the `MEM_SWP` slots, as the ABI-encoded array returned."""
+
+    rate = t - 1
+    stride = hex(32 * rate)
+    out = int(MEM_SWP[-1], 16) + 0x20
+    loads = ''.join(f'        mstore({MEM[i]}, calldataload({add("ptr", hex(32 * i)) if i else "ptr"}))\n'
+                    for i in range(rate))
+
+    return f'''
+{permutation_function(define_functions, linear_layer, full_round, partial_round, full_rounds, partial_rounds)}
+
+    mstore({hex(out)}, 0x20)
+    mstore({hex(out + 0x20)}, inputs.length)
+
+    let result := {hex(out + 0x40)}
+    let ptr := inputs.offset
+    let end := add(ptr, mul(inputs.length, {stride}))
+    for {{ }} lt(ptr, end) {{ ptr := add(ptr, {stride}) }} {{
+{loads}        mstore({MEM[rate]}, {rate << 64})
+
+        permute()
+        mstore(result, mload({MEM[0]}))
+        result := add(result, 0x20)
+    }}
+    return({hex(out)}, sub(result, {hex(out)}))
+'''
+
+
+def generate_hash_many(define_functions, linear_layer, full_round, partial_round, t, full_rounds, partial_rounds,
+                       function_comment):
+    """Generate a `hashMany(uint256[t - 1][] calldata)` function, see `hash_many_assembly`."""
+
+    code = hash_many_assembly(define_functions, linear_layer, full_round, partial_round, t, full_rounds,
+                              partial_rounds)
+    return wrap_into_function(f'hashMany(uint256[{t - 1}][] calldata inputs) public pure returns (uint256[] memory)',
+                              code.split('\n'), function_comment)
+
+
+def merkle_assembly(define_functions, linear_layer, full_round, partial_round, t, full_rounds, partial_rounds, arity):
+    """Return the assembly code of `verifyPath` and of `updateLeaf` for Merkle trees whose nodes are the `hash` of
+    `arity` children padded with zeros (the trees of `merkle.py`).
+
+    The siblings of every level are given bottom-up, `arity - 1` per level, and the position of the node among its
+    children is taken from the low digits of the leaf `index` in base `arity`; digits left over after the last
+    level make the proof invalid, so that every leaf has a single valid index. The permutation is run on the `MEM`
+    slots, loaded directly from the calldata siblings and from the running node, which stays on the stack."""
+
+    stride = hex(32 * (arity - 1))
+    if arity & (arity - 1):
+        position, parent = f'mod(index, {arity})', f'div(index, {arity})'
+    else:
+        position, parent = f'and(index, {arity - 1})', f'shr({arity.bit_length() - 1}, index)'
+
+    # The `MEM` slots of the children, and of the node at `pos`: the slots skip 0x40 and 0x60 after the first two
+    stores = f'''
+        mstore({MEM[0]}, calldataload(ptr))'''
+    stores += ''.join(f'''
+        mstore({MEM[j]}, calldataload(add(ptr, shl(5, sub({j}, gt({j}, pos))))))''' for j in range(1, arity))
+    stores += ''.join(f'''
+        mstore({MEM[j]}, 0)''' for j in range(arity, t - 1))
+
+    def level(*nodes):
+        return ''.join(f'''
+        children(ptr, pos, {node})
+        permute()
+        {node} := mload({MEM[0]})''' for node in nodes)
+
+    def path(*nodes):
+        return f'''
+    {permutation_function(define_functions, linear_layer, full_round, partial_round, full_rounds, partial_rounds)}
+
+    function children(ptr, pos, node) {{{stores}
+        mstore({MEM[t - 1]}, {(t - 1) << 64})
+        mstore(add(shl(5, pos), shl(6, gt(pos, 1))), node)
+    }}
+
+    let ptr := siblings.offset
+    let end := add(ptr, mul(siblings.length, {stride}))
+    for {{ }} lt(ptr, end) {{ ptr := add(ptr, {stride}) }} {{
+        let pos := {position}
+        index := {parent}
+{level(*nodes)}
+    }}
+    let valid := and(iszero(index), eq(leaf, root))
+'''
+
+    verify = path('leaf') + f'''
+    mstore({MEM[0]}, valid)
+    return({MEM[0]}, 0x20)
+'''
+    update = path('leaf', 'newLeaf') + f'''
+    if iszero(valid) {{
+        mstore(0, {hex(selector('InvalidProof()'))})
+        revert(0, 4)
+    }}
+    mstore({MEM[0]}, newLeaf)
+    return({MEM[0]}, 0x20)
+'''
+    return verify, update
+
+
+def generate_merkle(define_functions, linear_layer, full_round, partial_round, t, full_rounds, partial_rounds, arity,
+                    comments):
+    """Generate `verifyPath` and `updateLeaf`, see `merkle_assembly`, with the two `comments`."""
+
+    group = 'uint256[] calldata' if arity == 2 else f'uint256[{arity - 1}][] calldata'
+    verify, update = merkle_assembly(define_functions, linear_layer, full_round, partial_round, t, full_rounds,
+                                     partial_rounds, arity)
+    return f'''
+
+    error InvalidProof();
+''' + ''.join([
+        wrap_into_function(f'verifyPath(uint256 leaf, {group} siblings, uint256 index, uint256 root) '
+                           'public pure returns (bool)', verify.split('\n'), comments[0]),
+        wrap_into_function(f'updateLeaf(uint256 leaf, uint256 newLeaf, {group} siblings, uint256 index, uint256 root) '
+                           'public pure returns (uint256)', update.split('\n'), comments[1]),
+    ])
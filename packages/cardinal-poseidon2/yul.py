@@ -0,0 +1,141 @@
+"""Parser for the subset of Yul the generators emit.
+
+A program parses to nested tuples: statements are `('block', statements)`, `('function', name, params, returns,
+body)`, `('let', names, value)` (with `value=None` for a bare declaration), `('assign', names, value)`,
+`('expr', call)`, `('if', condition, body)`, `('for', init, condition, post, body)`, `('break',)`, `('continue',)`
+and `('leave',)`; expressions are `('lit', value)`, `('var', name)` and `('call', name, arguments)`.
+"""
+
+import re
+
+from utils import TOKEN
+
+COMMENT = re.compile(r'//[^\n]*|/\*.*?\*/', re.S)
+
+
+def tokenize(code):
+    """Return the tokens of the assembly code, without the comments."""
+
+    return TOKEN.findall(COMMENT.sub('', code))
+
+
+def parse(code):
+    """Parse a sequence of statements into a `('block', statements)` tuple."""
+
+    parser = Parser(tokenize(code))
+    statements = []
+    while not parser.done():
+        statements.append(parser.statement())
+    return ('block', statements)
+
+
+def functions(node):
+    """Return the function definitions found anywhere in a parsed program, by name."""
+
+    found = {}
+    if node[0] == 'function':
+        found[node[1]] = node
+        found.update(functions(node[4]))
+    elif node[0] == 'block':
+        for statement in node[1]:
+            found.update(functions(statement))
+    elif node[0] == 'if':
+        found.update(functions(node[2]))
+    elif node[0] == 'for':
+        for block in (node[1], node[3], node[4]):
+            found.update(functions(block))
+    return found
+
+
+class Parser:
+    """Recursive-descent parser over the tokens of `tokenize`."""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.i = 0
+
+    def done(self):
+        return self.i == len(self.tokens)
+
+    def peek(self, k=0):
+        return self.tokens[self.i + k] if self.i + k < len(self.tokens) else None
+
+    def next(self):
+        if self.done():
+            raise SyntaxError('unexpected end of the assembly code')
+        self.i += 1
+        return self.tokens[self.i - 1]
+
+    def expect(self, token):
+        found = self.next()
+        if found != token:
+            context = ' '.join(self.tokens[max(self.i - 6, 0):self.i + 4])
+            raise SyntaxError(f'expected {token!r}, found {found!r} in: {context}')
+
+    def names(self):
+        names = [self.next()]
+        while self.peek() == ',':
+            self.next()
+            names.append(self.next())
+        return names
+
+    def block(self):
+        self.expect('{')
+        statements = []
+        while self.peek() != '}':
+            statements.append(self.statement())
+        self.expect('}')
+        return ('block', statements)
+
+    def statement(self):
+        token = self.peek()
+        if token == '{':
+            return self.block()
+        if token == 'function':
+            self.next()
+            name = self.next()
+            self.expect('(')
+            params = self.names() if self.peek() != ')' else []
+            self.expect(')')
+            returns = []
+            if self.peek() == '->':
+                self.next()
+                returns = self.names()
+            return ('function', name, params, returns, self.block())
+        if token == 'let':
+            self.next()
+            names = self.names()
+            value = None
+            if self.peek() == ':=':
+                self.next()
+                value = self.expression()
+            return ('let', names, value)
+        if token == 'if':
+            self.next()
+            return ('if', self.expression(), self.block())
+        if token == 'for':
+            self.next()
+            return ('for', self.block(), self.expression(), self.block(), self.block())
+        if token in ('break', 'continue', 'leave'):
+            self.next()
+            return (token,)
+        if self.peek(1) in (':=', ','):
+            names = self.names()
+            self.expect(':=')
+            return ('assign', names, self.expression())
+        return ('expr', self.expression())
+
+    def expression(self):
+        token = self.next()
+        if token[0].isdigit():
+            return ('lit', int(token, 0))
+        if self.peek() != '(':
+            return ('var', token)
+        self.next()
+        args = []
+        while self.peek() != ')':
+            args.append(self.expression())
+            if self.peek() == ',':
+                self.next()
+        self.expect(')')
+        return ('call', token, args)